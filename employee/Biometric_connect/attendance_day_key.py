@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Canonical Attendance Day Key (Manila "YYYY-MM-DD")
+Shared by the Python attendance writers so today's record is found with one
+equality lookup on (employee, dayKey) instead of a datetime range.
+Run directly to backfill dayKey on existing documents and create the unique index:
+    python attendance_day_key.py [--dry-run] [--batch-size N]
+"""
+
+import sys
+import json
+import argparse
+from datetime import datetime
+import pytz
+from pymongo import UpdateOne, ASCENDING
+
+# Manila timezone
+MANILA_TZ = pytz.timezone('Asia/Manila')
+
+DAY_KEY_INDEX_NAME = "employee_dayKey_unique"
+DEFAULT_BATCH_SIZE = 1000
+
+def manila_day_key(dt=None):
+    """
+    Return the Manila calendar day of dt as "YYYY-MM-DD"
+    Naive datetimes are treated as UTC (that is how pymongo returns stored dates)
+    """
+    if dt is None:
+        dt = datetime.now(MANILA_TZ)
+    elif dt.tzinfo is None:
+        dt = pytz.utc.localize(dt)
+    return dt.astimezone(MANILA_TZ).strftime('%Y-%m-%d')
+
+def ensure_day_key_index(collection):
+    """Create the unique (employee, dayKey) index; documents without a dayKey are not indexed"""
+    return collection.create_index(
+        [("employee", ASCENDING), ("dayKey", ASCENDING)],
+        name=DAY_KEY_INDEX_NAME,
+        unique=True,
+        partialFilterExpression={"dayKey": {"$type": "string"}}
+    )
+
+def find_day_attendance(collection, employee_object_id, day_key, legacy_filter=None):
+    """
+    Find an employee's attendance for one day with a point query on (employee, dayKey)
+    legacy_filter is only tried on a miss, to pick up records written before dayKey
+    existed; a record found that way gets its dayKey stamped so the next scan hits directly
+    """
+    attendance = collection.find_one({"employee": employee_object_id, "dayKey": day_key})
+    if attendance or not legacy_filter:
+        return attendance
+
+    attendance = collection.find_one({**legacy_filter, "dayKey": {"$exists": False}})
+    if attendance:
+        collection.update_one(
+            {"_id": attendance["_id"]},
+            {"$set": {"dayKey": day_key, "employee": employee_object_id}}
+        )
+        attendance["dayKey"] = day_key
+        attendance["employee"] = employee_object_id
+    return attendance
+
+def backfill_day_keys(db, dry_run=False, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Stamp dayKey (and the employee ObjectId, if missing) on attendances that lack it
+    When several records map to the same (employee, dayKey) only the earliest gets the
+    key; the rest are reported as conflicts so the unique index can still be built
+    """
+    attendances = db.attendances
+
+    # employeeId -> ObjectId for records written by the IPC script without "employee"
+    employee_ids = {
+        emp['employeeId']: emp['_id']
+        for emp in db.employees.find({"employeeId": {"$exists": True}}, {"employeeId": 1})
+    }
+
+    # Day keys already taken
+    taken = {
+        (doc.get('employee'), doc['dayKey'])
+        for doc in attendances.find({"dayKey": {"$type": "string"}}, {"employee": 1, "dayKey": 1})
+    }
+
+    stats = {"scanned": 0, "updated": 0, "conflicts": [], "unresolved": []}
+    operations = []
+    cursor = attendances.find(
+        {"dayKey": {"$exists": False}},
+        {"employee": 1, "employeeId": 1, "date": 1, "timeIn": 1}
+    ).sort([("timeIn", ASCENDING), ("_id", ASCENDING)]).batch_size(batch_size)
+
+    for doc in cursor:
+        stats["scanned"] += 1
+        employee_object_id = doc.get('employee') or employee_ids.get(doc.get('employeeId'))
+        day_source = doc.get('date') or doc.get('timeIn')
+        if employee_object_id is None or day_source is None:
+            stats["unresolved"].append(str(doc['_id']))
+            continue
+
+        day_key = manila_day_key(day_source)
+        if (employee_object_id, day_key) in taken:
+            stats["conflicts"].append({
+                "_id": str(doc['_id']),
+                "employee": str(employee_object_id),
+                "dayKey": day_key
+            })
+            continue
+        taken.add((employee_object_id, day_key))
+
+        operations.append(UpdateOne(
+            {"_id": doc['_id']},
+            {"$set": {"dayKey": day_key, "employee": employee_object_id}}
+        ))
+        if len(operations) >= batch_size:
+            if not dry_run:
+                attendances.bulk_write(operations, ordered=False)
+            stats["updated"] += len(operations)
+            print(f"📊 Backfilled {stats['updated']} records...", file=sys.stderr)
+            operations = []
+
+    if operations:
+        if not dry_run:
+            attendances.bulk_write(operations, ordered=False)
+        stats["updated"] += len(operations)
+
+    if not dry_run:
+        ensure_day_key_index(attendances)
+        print(f"✅ Index {DAY_KEY_INDEX_NAME} ready", file=sys.stderr)
+
+    return stats
+
+def main():
+    """Main entry point - backfill dayKey on existing attendances"""
+    parser = argparse.ArgumentParser(description="Backfill attendance dayKey and create the (employee, dayKey) index")
+    parser.add_argument('--dry-run', action='store_true', help="Report what would change without writing")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    from integrated_capture import get_database_connection
+
+    db, client, connection_error = get_database_connection()
+    if connection_error:
+        print(json.dumps({"success": False, "message": connection_error}))
+        sys.exit(1)
+
+    try:
+        stats = backfill_day_keys(db, args.dry_run, args.batch_size)
+        result = {
+            "success": True,
+            "message": f"Backfilled dayKey on {stats['updated']} of {stats['scanned']} attendance records",
+            "dryRun": args.dry_run,
+            **stats
+        }
+    except Exception as e:
+        result = {"success": False, "message": f"Backfill failed: {str(e)}"}
+    finally:
+        client.close()
+
+    print(json.dumps(result))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -13,10 +13,24 @@ import time
 import json
 import os
 from pyzkfp import ZKFP2
+from toast_banner import ToastBanner
+from ui_event_bus import UIEventBus
+from cancellation import CancelToken
+from backend_client import BackendClient
+from edge_identifier import EdgeIdentifier, EDGE_MODE
+from device_arbiter import DeviceArbiter, DeviceUnavailable, PRIORITY_ATTENDANCE
+from capture_quality import assess_capture
+from scan_archive import archive_scan, close_scan_archive
 from PIL import Image, ImageTk
 import io
 from datetime import datetime, timedelta
 
+# Continuous kiosk mode timing
+KIOSK_POLL_INTERVAL = 0.1     # seconds between capture polls while armed
+KIOSK_CAPTURE_SECONDS = 1     # each armed capture request; disarm and close are noticed between them
+KIOSK_RESULT_MS = 5000        # how long a result stays on screen before the display resets
+KIOSK_LIFT_POLLS = 3          # consecutive empty polls that count as "finger lifted"
+
 class AttendanceGUI:
     def __init__(self, root):
         self.root = root
@@ -27,10 +41,34 @@ class AttendanceGUI:
         self.zkfp2 = None
         self.is_capturing = False
         self.current_scan_thread = None
+        # Every SDK call goes through the arbiter, which owns the open handle; the lock
+        # serializes opening/closing the device and claiming is_capturing between the
+        # scan button, the kiosk thread and reconnects
+        self.arbiter = DeviceArbiter(log=self.log)
+        self.device_lock = threading.RLock()
         self.backend_url = "http://localhost:5000"
+        # Templates go up as raw bytes on a kept-alive session (see backend_client.py)
+        self.backend = BackendClient(self.backend_url, log=self.log)
+        # Edge mode: identify on the kiosk and send only the match (see edge_identifier.py)
+        self.edge = EdgeIdentifier(log=self.log) if EDGE_MODE else None
+
+        # Kiosk mode: one persistent capture thread, armed/disarmed by events
+        self.kiosk_mode = tk.BooleanVar(value=False)
+        self.kiosk_armed = threading.Event()
+        # Cancelled on close: the kiosk loop and any capture stop within one poll
+        self.cancel = CancelToken()
+        self.kiosk_thread = None
+        self.reset_after_id = None
+
+        # Worker threads post widget updates here; the Tk thread applies them once per frame
+        self.ui = UIEventBus(self.root)
 
         self.setup_ui()
-        self.check_backend_connection()
+        self.ui.start()
+        # Results and device notices are shown in a self-expiring banner so nobody has to click OK
+        self.toast = ToastBanner(self.root)
+        # The window is usable right away; the backend status fills in when the check returns
+        threading.Thread(target=self.check_backend_connection, daemon=True).start()
 
     def setup_ui(self):
         """Setup the main UI components"""
@@ -83,7 +121,12 @@ class AttendanceGUI:
         self.btn_scan = ttk.Button(scan_frame, text="Scan Fingerprint for Attendance",
                                   command=self.start_attendance_scan,
                                   state=tk.DISABLED, width=30)
-        self.btn_scan.pack(pady=(0, 15))
+        self.btn_scan.pack(pady=(0, 5))
+
+        # Continuous kiosk mode toggle
+        ttk.Checkbutton(scan_frame, text="Continuous kiosk mode (no button press per scan)",
+                        variable=self.kiosk_mode,
+                        command=self.toggle_kiosk_mode).pack(pady=(0, 10))
 
         # Progress bar for scan
         self.progress_var = tk.DoubleVar()
@@ -110,35 +153,43 @@ class AttendanceGUI:
                   command=self.clear_result).pack(pady=(10, 0))
 
     def check_backend_connection(self):
-        """Check if backend server is running"""
+        """Check if backend server is running (safe from worker threads)"""
         try:
             # ✅ Fix: Use correct endpoint for testing backend connectivity
             response = requests.get(f"{self.backend_url}/api/attendance", timeout=5)
             if response.status_code == 200:
-                self.backend_status_label.config(text="Connected", foreground="green")
+                self.set_backend_status("Connected", "green")
                 self.log("✅ Backend server connection verified")
                 return True
             else:
-                self.backend_status_label.config(text="Error", foreground="red")
+                self.set_backend_status("Error", "red")
                 self.log(f"⚠️ Backend returned status {response.status_code}")
                 return False
         except requests.exceptions.ConnectionError:
-            self.backend_status_label.config(text="Disconnected", foreground="red")
+            self.set_backend_status("Disconnected", "red")
             self.log("❌ Backend server not reachable")
             return False
         except Exception as e:
-            self.backend_status_label.config(text="Error", foreground="red")
+            self.set_backend_status("Error", "red")
             self.log(f"❌ Backend connection error: {str(e)}")
             return False
 
-    def connect_device(self):
+    def set_backend_status(self, text, color):
+        self.ui.post(lambda: self.backend_status_label.config(text=text, foreground=color), key="backend_status")
+
+    def connect_device(self, notify=True):
         """Connect to ZKTeco fingerprint device"""
+        with self.device_lock:
+            self._connect_device(notify)
+
+    def _connect_device(self, notify):
         try:
             self.log("Connecting to fingerprint device...")
             self.device_status_label.config(text="Connecting...", foreground="orange")
             self.root.update()
 
             # Clean up any existing connection
+            self.arbiter.detach()
             if self.zkfp2:
                 try:
                     self.zkfp2.Terminate()
@@ -176,13 +227,18 @@ class AttendanceGUI:
                     self.log(f"Device connection test failed: {test_error}")
                     # Continue anyway, the device might still work
 
+                self.arbiter.attach(self.zkfp2)
+                if self.edge:
+                    self.edge.reset()
+
                 self.device_status_label.config(text="Connected", foreground="green")
                 self.btn_connect.config(state=tk.DISABLED)
                 self.btn_disconnect.config(state=tk.NORMAL)
                 self.btn_reconnect.config(state=tk.NORMAL)
-                self.btn_scan.config(state=tk.NORMAL)
+                self.btn_scan.config(state=tk.DISABLED if self.kiosk_mode.get() else tk.NORMAL)
                 self.log("Device connected successfully")
-                messagebox.showinfo("Success", "Fingerprint device connected successfully!")
+                if notify:
+                    self.toast.success("Fingerprint device connected")
             else:
                 self.device_status_label.config(text="No Device Found", foreground="red")
                 self.log("No fingerprint devices found")
@@ -205,12 +261,23 @@ class AttendanceGUI:
                     pass
                 self.zkfp2 = None
 
-    def reconnect_device(self):
-        """Reconnect to the fingerprint device"""
+    def reconnect_device(self, failed=None):
+        """
+        Reconnect to the fingerprint device
+        failed: the handle a capture gave up on; if another thread has already reconnected
+        or disconnected since, the device is left as it is
+        """
+        with self.device_lock:
+            if failed is not None and self.zkfp2 is not failed:
+                return self.zkfp2 is not None
+            return self._reconnect_device()
+
+    def _reconnect_device(self):
         try:
             self.log("Attempting to reconnect device...")
             
             # Disconnect first
+            self.arbiter.detach()
             if self.zkfp2:
                 try:
                     self.zkfp2.Terminate()
@@ -239,6 +306,9 @@ class AttendanceGUI:
                 except Exception as start_error:
                     self.log(f"Device Start() failed during reconnect: {start_error}")
                 
+                self.arbiter.attach(self.zkfp2)
+                if self.edge:
+                    self.edge.reset()
                 self.log("✅ Device reconnected successfully")
                 return True
             else:
@@ -252,9 +322,11 @@ class AttendanceGUI:
     def disconnect_device(self):
         """Disconnect from fingerprint device"""
         try:
-            if self.zkfp2:
-                self.zkfp2.Terminate()
-                self.zkfp2 = None
+            with self.device_lock:
+                self.arbiter.detach()
+                if self.zkfp2:
+                    self.zkfp2.Terminate()
+                    self.zkfp2 = None
 
             self.device_status_label.config(text="Disconnected", foreground="red")
             self.btn_connect.config(state=tk.NORMAL)
@@ -262,7 +334,7 @@ class AttendanceGUI:
             self.btn_reconnect.config(state=tk.DISABLED)
             self.btn_scan.config(state=tk.DISABLED)
             self.log("Device disconnected successfully")
-            messagebox.showinfo("Success", "Device disconnected successfully!")
+            self.toast.info("Device disconnected")
 
         except Exception as e:
             self.log(f"Error disconnecting device: {str(e)}")
@@ -282,8 +354,8 @@ class AttendanceGUI:
                 self.btn_connect.config(state=tk.DISABLED)
                 self.btn_disconnect.config(state=tk.NORMAL)
                 self.btn_reconnect.config(state=tk.NORMAL)
-                self.btn_scan.config(state=tk.NORMAL)
-                messagebox.showinfo("Success", "Device reconnected successfully!")
+                self.btn_scan.config(state=tk.DISABLED if self.kiosk_mode.get() else tk.NORMAL)
+                self.toast.success("Device reconnected")
             else:
                 self.device_status_label.config(text="Reconnection Failed", foreground="red")
                 self.btn_connect.config(state=tk.NORMAL)
@@ -297,12 +369,19 @@ class AttendanceGUI:
             self.device_status_label.config(text="Reconnection Failed", foreground="red")
             messagebox.showerror("Error", f"Manual reconnection failed:\n{str(e)}")
 
+    def claim_scan(self):
+        """Take is_capturing for one scan; False if another scan already holds it"""
+        with self.device_lock:
+            if self.is_capturing:
+                return False
+            self.is_capturing = True
+            return True
+
     def start_attendance_scan(self):
         """Start the attendance scanning process"""
-        if self.is_capturing:
+        if not self.claim_scan():
             return
 
-        self.is_capturing = True
         self.btn_scan.config(state=tk.DISABLED)
         self.progress_var.set(0)
         self.scan_status_label.config(text="Place finger on scanner...")
@@ -316,100 +395,202 @@ class AttendanceGUI:
         """Perform the actual fingerprint scan and attendance recording"""
         try:
             # Update progress
-            self.root.after(0, lambda: self.progress_var.set(10))
-            self.root.after(0, lambda: self.scan_status_label.config(text="Initializing scan..."))
+            self.set_scan_progress(10, "Initializing scan...")
 
             # Wait a moment for device to be ready
-            time.sleep(0.5)
+            if self.cancel.sleep(0.5):
+                return
 
             # Capture fingerprint
-            self.root.after(0, lambda: self.progress_var.set(30))
-            self.root.after(0, lambda: self.scan_status_label.config(text="Capturing fingerprint..."))
+            self.set_scan_progress(30, "Capturing fingerprint...")
 
             capture = self.capture_fingerprint()
             if not capture:
-                self.root.after(0, self.scan_failed, "Fingerprint capture failed or timeout")
+                self.ui.post(self.scan_failed, "Fingerprint capture failed or timeout")
                 return
 
+            self.process_capture(capture)
+
+        except Exception as e:
+            self.ui.post(self.scan_failed, f"Scan error: {str(e)}")
+
+        finally:
+            self.is_capturing = False
+            self.ui.post(lambda: self.btn_scan.config(
+                state=tk.DISABLED if self.kiosk_mode.get() else tk.NORMAL), key="scan_button")
+
+    def set_scan_progress(self, value, text):
+        """Queue a coalesced progress bar / status label update (safe from worker threads)"""
+        self.ui.post(self.progress_var.set, value, key="scan_progress")
+        self.ui.post(lambda: self.scan_status_label.config(text=text), key="scan_status")
+
+    def process_capture(self, capture):
+        """Send a captured fingerprint to the backend and show the result"""
+        try:
             template, img = capture
 
-            # Convert to hex string (same format as registration)
-            self.root.after(0, lambda: self.progress_var.set(60))
-            self.root.after(0, lambda: self.scan_status_label.config(text="Processing fingerprint..."))
+            # Poor captures get a "press again" before any matching or upload
+            quality = assess_capture(img, self.zkfp2)
+            if not quality["ok"]:
+                self.log(f"👆 Capture rejected in {quality['ms']:.1f} ms: {quality['reason']}")
+                self.ui.post(self.scan_failed, f"Press again - {quality['reason']}")
+                return
+
+            self.set_scan_progress(60, "Processing fingerprint...")
 
-            template_hex = bytes(template).hex()
-            
             # Debug logging
             self.log(f"🔍 DEBUG: Template type: {type(template)}")
             self.log(f"🔍 DEBUG: Template length: {len(template)}")
-            self.log(f"🔍 DEBUG: Template hex length: {len(template_hex)}")
-            self.log(f"🔍 DEBUG: Template hex first 100 chars: {template_hex[:100]}...")
-            self.log(f"🔍 DEBUG: Template hex last 100 chars: ...{template_hex[-100:]}")
 
-            # Send to backend
-            self.root.after(0, lambda: self.progress_var.set(80))
-            self.root.after(0, lambda: self.scan_status_label.config(text="Recording attendance..."))
+            match = self.identify_at_edge(template)
+
+            # Send to backend (raw bytes; the backend converts to hex for matching)
+            self.set_scan_progress(80, "Recording attendance...")
 
-            success, result = self.record_attendance(template_hex)
+            success, result = self.record_attendance(template, match)
+            archive_scan(template, img, {
+                "source": "attendance_gui",
+                "employeeId": result.get('employee', {}).get('employeeId') if success else (match or {}).get('employeeId'),
+                "success": success,
+                "message": result.get('message') if success else result
+            }, self.zkfp2)
 
             if success:
-                self.root.after(0, lambda: self.progress_var.set(100))
-                self.root.after(0, lambda: self.scan_status_label.config(text="Attendance recorded successfully!"))
-                self.root.after(0, self.scan_success, result)
+                self.set_scan_progress(100, "Attendance recorded successfully!")
+                self.ui.post(self.scan_success, result)
             else:
-                self.root.after(0, self.scan_failed, result)
+                self.ui.post(self.scan_failed, result)
 
         except Exception as e:
-            self.root.after(0, self.scan_failed, f"Scan error: {str(e)}")
-
-        finally:
-            self.is_capturing = False
-            self.root.after(0, lambda: self.btn_scan.config(state=tk.NORMAL))
+            self.ui.post(self.scan_failed, f"Scan error: {str(e)}")
 
-    def capture_fingerprint(self, timeout=20):
-        """Capture fingerprint from device with timeout"""
-        start_time = time.time()
-        consecutive_errors = 0
-        max_consecutive_errors = 5
+    def identify_at_edge(self, template):
+        """Edge mode: DBIdentify through the arbiter; returns the match, or None to upload the template"""
+        if not self.edge:
+            return None
+        try:
+            match = self.arbiter.call(
+                PRIORITY_ATTENDANCE, lambda zkfp2: self.edge.identify(zkfp2, template)).result()
+        except Exception as e:
+            self.log(f"⚠️ Edge identification failed, sending template: {str(e)}")
+            return None
+        if match:
+            self.log(f"🔍 Edge match: {match['employeeId']} (FID {match['fid']}, score {match['score']})")
+        else:
+            self.log("🔍 No edge match - sending template to the backend")
+        return match
+
+    def toggle_kiosk_mode(self):
+        """Arm or disarm the persistent kiosk capture thread"""
+        if self.kiosk_mode.get():
+            if self.kiosk_thread is None:
+                self.kiosk_thread = threading.Thread(target=self.kiosk_loop, daemon=True)
+                self.kiosk_thread.start()
+            self.btn_scan.config(state=tk.DISABLED)
+            self.kiosk_armed.set()
+            self.scan_status_label.config(text="Place finger on scanner")
+            self.log("🖐️ Kiosk mode on - device armed for continuous scanning")
+        else:
+            self.kiosk_armed.clear()
+            self.btn_scan.config(state=tk.NORMAL if self.zkfp2 else tk.DISABLED)
+            self.scan_status_label.config(text="Ready to scan")
+            self.log("Kiosk mode off")
+
+    def kiosk_loop(self):
+        """
+        Persistent capture loop for kiosk mode
+        Captures while armed, processes each finger as it arrives and waits for the
+        finger to be lifted before accepting the next one
+        """
+        while not self.cancel.cancelled:
+            if not self.kiosk_armed.wait(timeout=0.5):
+                continue
+            if not self.zkfp2 or not self.claim_scan():
+                self.cancel.sleep(KIOSK_POLL_INTERVAL)
+                continue
 
-        while time.time() - start_time < timeout:
             try:
-                if self.zkfp2:
-                    capture = self.zkfp2.AcquireFingerprint()
-                    if capture:
-                        consecutive_errors = 0  # Reset error counter on success
-                        return capture
-                    else:
-                        consecutive_errors += 1
-                        if consecutive_errors >= max_consecutive_errors:
-                            self.log(f"Too many consecutive capture failures, reconnecting device...")
-                            self.reconnect_device()
-                            consecutive_errors = 0
-            except Exception as e:
-                consecutive_errors += 1
-                self.log(f"Capture attempt failed: {str(e)}")
-                
-                # If we get too many consecutive errors, try to reconnect
-                if consecutive_errors >= max_consecutive_errors:
-                    self.log(f"Too many consecutive errors, reconnecting device...")
-                    self.reconnect_device()
-                    consecutive_errors = 0
+                zkfp2 = self.zkfp2
+                try:
+                    capture = self.acquire(KIOSK_CAPTURE_SECONDS)
+                except DeviceUnavailable as e:
+                    capture = None
+                    self.log(f"Kiosk capture failed: {str(e)}")
+                    if zkfp2 is not None and not self.cancel.cancelled:
+                        self.log("Reconnecting device...")
+                        self.reconnect_device(failed=zkfp2)
+
+                if capture:
+                    self.ui.post(self.cancel_scheduled_reset)
+                    self.process_capture(capture)
+                    self.ui.post(self.schedule_reset, KIOSK_RESULT_MS)
+                    self.wait_for_finger_lift()
+            finally:
+                self.is_capturing = False
+
+    def acquire(self, timeout):
+        """
+        One capture through the arbiter: (template, image), or None on timeout or close
+        Raises DeviceUnavailable if the device is gone
+        """
+        request = self.arbiter.capture(PRIORITY_ATTENDANCE, timeout)
+        self.cancel.on_cancel(request.cancel)
+        try:
+            return request.result()
+        finally:
+            self.cancel.remove_callback(request.cancel)
 
-            time.sleep(0.1)
+    def wait_for_finger_lift(self):
+        """Block until the finger has left the sensor so one touch is one scan"""
+        empty_polls = 0
+        while empty_polls < KIOSK_LIFT_POLLS and not self.cancel.cancelled and self.kiosk_armed.is_set():
+            try:
+                capture = self.arbiter.call(PRIORITY_ATTENDANCE, lambda zkfp2: zkfp2.AcquireFingerprint()).result()
+            except Exception:
+                capture = None
+            empty_polls = 0 if capture else empty_polls + 1
+            self.cancel.sleep(KIOSK_POLL_INTERVAL)
+
+    def schedule_reset(self, delay_ms):
+        """Clear the result display after delay_ms, replacing any earlier pending reset"""
+        self.cancel_scheduled_reset()
+        self.reset_after_id = self.root.after(delay_ms, self.reset_display)
+
+    def cancel_scheduled_reset(self):
+        if self.reset_after_id is not None:
+            self.root.after_cancel(self.reset_after_id)
+            self.reset_after_id = None
+
+    def reset_display(self):
+        self.reset_after_id = None
+        self.clear_result()
+        if self.kiosk_mode.get():
+            self.scan_status_label.config(text="Place finger on scanner")
 
+    def capture_fingerprint(self, timeout=20):
+        """Capture fingerprint from device with timeout, reconnecting once if the device drops"""
+        deadline = time.time() + timeout
+        for attempt in range(2):
+            zkfp2 = self.zkfp2
+            try:
+                return self.acquire(max(deadline - time.time(), 0))
+            except DeviceUnavailable as e:
+                self.log(f"Capture failed: {str(e)}")
+                if attempt or zkfp2 is None or self.cancel.cancelled:
+                    return None
+                self.log("Reconnecting device...")
+                if not self.reconnect_device(failed=zkfp2):
+                    return None
         return None
 
-    def record_attendance(self, fingerprint_template):
-        """Send fingerprint to backend for attendance recording"""
+    def record_attendance(self, fingerprint_template, match=None):
+        """Send fingerprint (or the edge match for it) to backend for attendance recording"""
         try:
-            payload = {
-                "fingerprint_template": fingerprint_template
-            }
-
-            headers = {'Content-Type': 'application/json'}
             self.log(f"📤 Sending attendance request to {self.backend_url}/api/attendance/record")
-            response = requests.post(f"{self.backend_url}/api/attendance/record",
-                                   json=payload, headers=headers, timeout=10)
+            if match:
+                response = self.backend.record_identified(match, fingerprint_template, timeout=10)
+            else:
+                response = self.backend.record_attendance(fingerprint_template, timeout=10)
 
             if response.status_code == 200:
                 result = response.json()
@@ -453,9 +634,12 @@ class AttendanceGUI:
 {result.get('message', '')}"""
 
             self.display_result(message, "success")
+            self.toast.success(f"✅ {employee.get('name', 'Unknown')} - {attendance.get('time', 'N/A')}",
+                               duration_ms=KIOSK_RESULT_MS)
 
-            # Auto-clear after 10 seconds
-            self.root.after(10000, self.clear_result)
+            # Auto-clear after 10 seconds (kiosk mode resets sooner)
+            if not self.kiosk_mode.get():
+                self.schedule_reset(10000)
 
         except Exception as e:
             self.log(f"Error displaying success result: {str(e)}")
@@ -473,6 +657,7 @@ Error: {error_message}
 Please try again or contact administrator if the problem persists."""
 
             self.display_result(message, "error")
+            self.toast.error(f"❌ {error_message}", duration_ms=KIOSK_RESULT_MS)
 
         except Exception as e:
             self.log(f"Error displaying failed result: {str(e)}")
@@ -514,17 +699,33 @@ Please try again or contact administrator if the problem persists."""
 
     def on_closing(self):
         """Handle window closing"""
+        self.ui.stop()
+        self.cancel.cancel("Window closed")
+        self.kiosk_armed.set()  # Wake the kiosk thread so it can exit
+        # Both loops notice the cancel within one poll; only then is the device released
+        for thread in (self.kiosk_thread, self.current_scan_thread):
+            if thread is not None:
+                thread.join(timeout=1)
+        self.arbiter.stop()
         try:
             if self.zkfp2:
                 self.zkfp2.Terminate()
         except:
             pass
+        close_scan_archive(timeout=2)  # Flush queued scans to disk
         self.root.destroy()
 
 def main():
     root = tk.Tk()
     app = AttendanceGUI(root)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
+
+    # Wall-mounted kiosk: connect and start continuous scanning without operator input
+    if "--kiosk" in sys.argv:
+        app.connect_device(notify=False)
+        app.kiosk_mode.set(True)
+        app.toggle_kiosk_mode()
+
     root.mainloop()
 
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+"""
+Warm Per-Day Attendance State
+For long-lived capture processes: today's attendance for every employee is loaded
+with one query (at startup and again after Manila midnight), so deciding between
+Time Out and "already completed" needs no database read per scan. An employee
+missing from the state is still looked up before a Time In is inserted, since
+other writers (the backend does not stamp dayKey) may have timed them in since.
+Writes still go straight to MongoDB; the caller records them here (write-through)
+and the whole day is re-read every RECONCILE_INTERVAL to pick up other writers.
+"""
+
+import sys
+import threading
+from datetime import datetime, timedelta
+from attendance_day_key import MANILA_TZ, manila_day_key
+
+RECONCILE_INTERVAL = timedelta(minutes=5)
+
+STATE_PROJECTION = {
+    "employee": 1,
+    "employeeId": 1,
+    "date": 1,
+    "dayKey": 1,
+    "timeIn": 1,
+    "timeOut": 1,
+    "status": 1
+}
+
+class DayAttendanceState:
+    """Today's attendance records keyed by employee ObjectId string"""
+
+    def __init__(self, collection, reconcile_interval=RECONCILE_INTERVAL):
+        self.collection = collection
+        self.reconcile_interval = reconcile_interval
+        self.lock = threading.Lock()
+        self.day_key = None
+        self.loaded_at = None
+        self.records = {}
+
+    def load(self, now=None):
+        """Replace the state with today's records (one query)"""
+        now = now or datetime.now(MANILA_TZ)
+        day_key = manila_day_key(now)
+        today = now.astimezone(MANILA_TZ).replace(hour=0, minute=0, second=0, microsecond=0)
+
+        records = {}
+        cursor = self.collection.find(
+            {"$or": [
+                {"dayKey": day_key},
+                # Written before dayKey existed
+                {"dayKey": {"$exists": False}, "date": {"$gte": today, "$lt": today + timedelta(days=1)}}
+            ]},
+            STATE_PROJECTION
+        )
+        for record in cursor:
+            if record.get('employee') is None:
+                continue
+            key = str(record['employee'])
+            # Prefer the keyed record if a legacy one exists for the same employee
+            if key not in records or record.get('dayKey') == day_key:
+                records[key] = record
+
+        with self.lock:
+            self.records = records
+            self.day_key = day_key
+            self.loaded_at = now
+        print(f"📅 Loaded attendance state for {day_key}: {len(records)} records", file=sys.stderr)
+
+    def ensure_current(self, now=None):
+        """Reload after Manila midnight or when the reconcile interval has passed"""
+        now = now or datetime.now(MANILA_TZ)
+        if self.day_key != manila_day_key(now) or now - self.loaded_at >= self.reconcile_interval:
+            self.load(now)
+
+    def get(self, employee_key):
+        with self.lock:
+            return self.records.get(str(employee_key))
+
+    def records_list(self):
+        """Copy of today's records (e.g. to seed the hot candidate ranking)"""
+        with self.lock:
+            return list(self.records.values())
+
+    def put(self, employee_key, record):
+        """Write-through: remember a record just written to MongoDB"""
+        with self.lock:
+            self.records[str(employee_key)] = record
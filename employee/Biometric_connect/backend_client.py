@@ -0,0 +1,174 @@
+"""
+Shared Backend Client for the Biometric GUIs
+Uploads fingerprint templates over one kept-alive session in a compact form:
+  - binary   raw template bytes as application/octet-stream, other fields in the query string
+  - base64   base64 template inside a small JSON envelope (~1.33x the template size)
+  - hex      legacy hex string in JSON (~2x the template size)
+Any of them can be gzip-compressed (compress=True). Every upload logs its size on
+the wire against the hex equivalent and its round-trip time; stats() sums them up.
+Kiosks in edge mode (edge_identifier.py) send only the match result instead,
+signed with this kiosk's key: KIOSK_ID (default the host name) and EDGE_KIOSK_SECRET
+must match an entry of the backend's EDGE_KIOSK_KEYS. Without a key, or when the
+backend rejects the match, the template is uploaded as usual.
+
+The transport defaults to binary; set BIOMETRIC_TEMPLATE_TRANSPORT=hex (and
+BIOMETRIC_TEMPLATE_GZIP=1 to compress) when talking to a backend without
+utils/templateTransport.js.
+"""
+
+import os
+import json
+import gzip
+import hmac
+import time
+import base64
+import socket
+import hashlib
+import threading
+import requests
+
+TEMPLATE_TRANSPORTS = ("binary", "base64", "hex")
+DEFAULT_TEMPLATE_TRANSPORT = os.environ.get("BIOMETRIC_TEMPLATE_TRANSPORT", "binary")
+DEFAULT_TEMPLATE_GZIP = os.environ.get("BIOMETRIC_TEMPLATE_GZIP", "0") == "1"
+KIOSK_ID = os.environ.get("KIOSK_ID") or socket.gethostname()
+EDGE_KIOSK_SECRET = os.environ.get("EDGE_KIOSK_SECRET", "")
+
+def template_bytes(template):
+    """Normalise a template (SDK byte array, bytes or hex string) to bytes"""
+    if isinstance(template, str):
+        return bytes.fromhex(template)
+    return bytes(template)
+
+def sign_edge_match(match, kiosk_id=KIOSK_ID, secret=EDGE_KIOSK_SECRET):
+    """X-Kiosk-Id / X-Kiosk-Signature headers for an edge match (see utils/templateTransport.js)"""
+    message = f"{kiosk_id}|{match['employeeId']}|{match['fid']}|{match['score']}|{match['capturedAt']}"
+    signature = hmac.new(secret.encode("utf-8"), message.encode("utf-8"), hashlib.sha256).hexdigest()
+    return {"X-Kiosk-Id": kiosk_id, "X-Kiosk-Signature": signature}
+
+def encode_template_upload(template, field, fields=None, transport="binary", compress=False):
+    """
+    Build the request for a template upload
+    Returns (body, headers, params, hex_size) where hex_size is what the legacy
+    hex JSON body would have been, for comparison
+    """
+    raw = template_bytes(template)
+    fields = dict(fields or {})
+    legacy = json.dumps({field: raw.hex(), **fields}).encode("utf-8")
+    params = None
+
+    if transport == "binary":
+        body = raw
+        content_type = "application/octet-stream"
+        params = {key: value for key, value in fields.items() if value is not None}
+    elif transport == "base64":
+        envelope = {field: base64.b64encode(raw).decode("ascii"), "templateEncoding": "base64", **fields}
+        body = json.dumps(envelope, separators=(",", ":")).encode("utf-8")
+        content_type = "application/json"
+    elif transport == "hex":
+        body = legacy
+        content_type = "application/json"
+    else:
+        raise ValueError(f"Unknown template transport: {transport} (expected one of {TEMPLATE_TRANSPORTS})")
+
+    headers = {"Content-Type": content_type, "Accept": "application/json"}
+    if compress:
+        body = gzip.compress(body)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers, params, len(legacy)
+
+class BackendClient:
+    """Template uploads to the payroll backend, with per-endpoint size/latency stats"""
+
+    def __init__(self, base_url, transport=DEFAULT_TEMPLATE_TRANSPORT, compress=DEFAULT_TEMPLATE_GZIP, log=None):
+        if transport not in TEMPLATE_TRANSPORTS:
+            raise ValueError(f"Unknown template transport: {transport} (expected one of {TEMPLATE_TRANSPORTS})")
+        self.base_url = base_url.rstrip("/")
+        self.transport = transport
+        self.compress = compress
+        self.log = log or print
+        self.session = requests.Session()  # Reuses the connection; no new TCP handshake per scan
+        self.lock = threading.Lock()
+        self.totals = {}  # path -> [uploads, wire bytes, hex bytes, seconds]
+
+    def record_attendance(self, template, timeout=10):
+        """POST /api/attendance/record; returns the requests.Response"""
+        return self.upload_template("/api/attendance/record", "fingerprint_template", template, timeout=timeout)
+
+    def check_duplicate(self, template, exclude_employee_id=None, timeout=10):
+        """POST /api/fingerprint/check-duplicate; returns the requests.Response"""
+        return self.upload_template("/api/fingerprint/check-duplicate", "fingerprintTemplate", template,
+                                    fields={"excludeEmployeeId": exclude_employee_id}, timeout=timeout)
+
+    def record_identified(self, match, template=None, timeout=10):
+        """
+        POST a signed edge match {employeeId, fid, score, capturedAt} to /api/attendance/record
+        If this kiosk has no key or the backend rejects the match, template (when given)
+        is uploaded instead
+        """
+        path = "/api/attendance/record"
+        if not EDGE_KIOSK_SECRET and template is not None:
+            self.log("⚠️ EDGE_KIOSK_SECRET is not set - sending the template instead of the edge match")
+            return self.record_attendance(template, timeout=timeout)
+        match = {**match, "fid": int(match["fid"]), "score": int(match["score"])}
+        body = json.dumps(match, separators=(",", ":")).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Accept": "application/json", **sign_edge_match(match)}
+
+        started = time.perf_counter()
+        response = self.session.post(f"{self.base_url}{path}", data=body, headers=headers, timeout=timeout)
+        elapsed = time.perf_counter() - started
+
+        # Kept apart from template uploads to the same endpoint so their averages stay comparable
+        self._add_cost(f"{path} (edge)", len(body), len(body), elapsed)
+        self.log(f"📦 {path}: {len(body)} B edge match in {elapsed * 1000:.0f} ms")
+        if response.status_code in (401, 403) and template is not None:
+            try:
+                rejected = response.json()
+            except ValueError:
+                rejected = {}
+            if rejected.get("edgeRejected"):
+                self.log(f"⚠️ Edge match rejected ({rejected.get('error')}) - sending the template")
+                return self.record_attendance(template, timeout=timeout)
+        return response
+
+    def upload_template(self, path, field, template, fields=None, timeout=10):
+        """POST a template to path in the configured transport and record its cost"""
+        body, headers, params, hex_size = encode_template_upload(
+            template, field, fields, transport=self.transport, compress=self.compress)
+
+        started = time.perf_counter()
+        response = self.session.post(f"{self.base_url}{path}", data=body, headers=headers,
+                                     params=params, timeout=timeout)
+        elapsed = time.perf_counter() - started
+
+        self._add_cost(path, len(body), hex_size, elapsed)
+        saved = 100.0 * (1 - len(body) / hex_size) if hex_size else 0.0
+        label = self.transport + ("+gzip" if self.compress else "")
+        self.log(f"📦 {path}: {len(body)} B as {label} (hex: {hex_size} B, -{saved:.0f}%) "
+                 f"in {elapsed * 1000:.0f} ms")
+        return response
+
+    def _add_cost(self, key, wire_bytes, hex_bytes, seconds):
+        with self.lock:
+            totals = self.totals.setdefault(key, [0, 0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += wire_bytes
+            totals[2] += hex_bytes
+            totals[3] += seconds
+
+    def stats(self):
+        """Per-endpoint averages: uploads, wire/hex bytes, percent saved, round-trip ms"""
+        with self.lock:
+            snapshot = {path: list(totals) for path, totals in self.totals.items()}
+        return {
+            path: {
+                "uploads": uploads,
+                "avgBytes": wire_bytes / uploads,
+                "avgHexBytes": hex_bytes / uploads,
+                "savedPercent": 100.0 * (1 - wire_bytes / hex_bytes) if hex_bytes else 0.0,
+                "avgMs": seconds * 1000 / uploads,
+            }
+            for path, (uploads, wire_bytes, hex_bytes, seconds) in snapshot.items()
+        }
+
+    def close(self):
+        self.session.close()
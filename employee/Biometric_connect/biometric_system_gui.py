@@ -13,6 +13,14 @@ import time
 import json
 import os
 from pyzkfp import ZKFP2
+from toast_banner import ToastBanner
+from ui_event_bus import UIEventBus
+from device_arbiter import DeviceArbiter, DeviceUnavailable, PRIORITY_ATTENDANCE, PRIORITY_ENROLLMENT
+from cancellation import CancelToken
+from backend_client import BackendClient
+from edge_identifier import EdgeIdentifier, EDGE_MODE
+from capture_quality import assess_capture
+from scan_archive import archive_scan, close_scan_archive
 from PIL import Image, ImageTk
 import io
 from datetime import datetime, timedelta
@@ -29,6 +37,10 @@ class UnifiedBiometricGUI:
         self.is_capturing = False
         self.current_scan_thread = None
         self.backend_url = "http://localhost:5000"
+        # Templates go up as raw bytes on a kept-alive session (see backend_client.py)
+        self.backend = BackendClient(self.backend_url, log=self.log)
+        # Edge mode: identify on the kiosk and send only the match (see edge_identifier.py)
+        self.edge = EdgeIdentifier(log=self.log) if EDGE_MODE else None
         
         # Registration data
         self.registered_users = {}
@@ -36,18 +48,33 @@ class UnifiedBiometricGUI:
         self.registration_in_progress = False
         self.scan_count = 0
         self.template_count = 0
-        self.device_lock = threading.Lock()
         self.debug_mode = True
         self.skip_duplicate_check = False
         
         # Attendance data
         self.attendance_records = []
 
+        # Worker threads post widget updates here; the Tk thread applies them once per frame
+        self.ui = UIEventBus(self.root)
+
+        # All capture/match/merge calls go through the arbiter, which owns the open handle;
+        # attendance requests are served ahead of enrollment
+        self.arbiter = DeviceArbiter(log=self.log)
+        # Cancelled on close: pending captures are withdrawn and worker sleeps end at once
+        self.cancel = CancelToken()
+
         self.setup_ui()
-        self.check_backend_connection()
-        
-        # Load users from MongoDB backend
-        self.load_users_from_backend()
+        self.ui.start()
+        # Results and device notices are shown in a self-expiring banner so nobody has to click OK
+        self.toast = ToastBanner(self.root)
+
+        # Backend check and roster load run in the background; the window is usable right away
+        self.started_at = time.perf_counter()
+        self.root.after_idle(self.log_startup_time, "Window ready")
+        threading.Thread(target=self.load_users_from_backend, daemon=True).start()
+
+    def log_startup_time(self, what):
+        self.log(f"⏱️ {what} {(time.perf_counter() - self.started_at) * 1000:.0f} ms after startup")
 
     def setup_ui(self):
         """Setup the main UI with tabs"""
@@ -335,26 +362,29 @@ class UnifiedBiometricGUI:
                   command=self.clear_logs).pack(pady=(10, 0))
 
     def check_backend_connection(self):
-        """Check if backend server is running"""
+        """Check if backend server is running (safe from worker threads)"""
         try:
             response = requests.get(f"{self.backend_url}/api/attendance", timeout=5)
             if response.status_code == 200:
-                self.backend_status_label.config(text="Connected", foreground="green")
+                self.set_backend_status("Connected", "green")
                 self.log("✅ Backend server connection verified")
                 return True
             else:
-                self.backend_status_label.config(text="Error", foreground="red")
+                self.set_backend_status("Error", "red")
                 self.log(f"⚠️ Backend returned status {response.status_code}")
                 return False
         except requests.exceptions.ConnectionError:
-            self.backend_status_label.config(text="Disconnected", foreground="red")
+            self.set_backend_status("Disconnected", "red")
             self.log("❌ Backend server not reachable")
             return False
         except Exception as e:
-            self.backend_status_label.config(text="Error", foreground="red")
+            self.set_backend_status("Error", "red")
             self.log(f"❌ Backend connection error: {str(e)}")
             return False
 
+    def set_backend_status(self, text, color):
+        self.ui.post(lambda: self.backend_status_label.config(text=text, foreground=color), key="backend_status")
+
     def connect_device(self):
         """Connect to ZKTeco fingerprint device"""
         try:
@@ -363,6 +393,7 @@ class UnifiedBiometricGUI:
             self.root.update()
 
             # Clean up any existing connection
+            self.arbiter.detach()
             if self.zkfp2:
                 try:
                     self.zkfp2.Terminate()
@@ -392,6 +423,9 @@ class UnifiedBiometricGUI:
                     self.log(f"Device Start() failed (this is normal for some versions): {start_error}")
 
                 # Connection successful - no need to test capture
+                self.arbiter.attach(self.zkfp2)
+                if self.edge:
+                    self.edge.reset()
                 self.log("Device connection established successfully")
 
                 self.device_status_label.config(text="Connected", foreground="green")
@@ -401,7 +435,7 @@ class UnifiedBiometricGUI:
                 self.btn_register.config(state=tk.NORMAL)
                 self.btn_scan_attendance.config(state=tk.NORMAL)
                 self.log("Device connected successfully")
-                messagebox.showinfo("Success", "Fingerprint device connected successfully!")
+                self.toast.success("Fingerprint device connected")
             else:
                 self.device_status_label.config(text="No Device Found", foreground="red")
                 self.log("No fingerprint devices found")
@@ -427,6 +461,7 @@ class UnifiedBiometricGUI:
     def disconnect_device(self):
         """Disconnect from fingerprint device"""
         try:
+            self.arbiter.detach()
             if self.zkfp2:
                 self.zkfp2.Terminate()
                 self.zkfp2 = None
@@ -438,7 +473,7 @@ class UnifiedBiometricGUI:
             self.btn_register.config(state=tk.DISABLED)
             self.btn_scan_attendance.config(state=tk.DISABLED)
             self.log("Device disconnected successfully")
-            messagebox.showinfo("Success", "Device disconnected successfully!")
+            self.toast.info("Device disconnected")
 
         except Exception as e:
             self.log(f"Error disconnecting device: {str(e)}")
@@ -519,79 +554,82 @@ class UnifiedBiometricGUI:
         self.log(f"Starting registration for {user_name} (ID: {user_id})")
         
         for i in range(3):
-            self.root.after(0, lambda i=i: self.progress_label.config(text=f"Scans: {i}/3"))
+            self.ui.post(lambda i=i: self.progress_label.config(text=f"Scans: {i}/3"), key="registration_label")
             self.log(f"Scan {i+1}/3 - Place finger on scanner...")
             
             self.safe_light('red')
             
-            capture = self.capture_fingerprint()
+            capture = self.capture_fingerprint(priority=PRIORITY_ENROLLMENT)
             
             if not capture:
                 self.log("Registration cancelled - timeout")
-                self.root.after(0, self.registration_complete, False, None, None, employee_data)
+                self.ui.post(self.registration_complete, False, None, None, employee_data)
                 return
                 
             tmp, img = capture
             
             # Duplicate check will be performed after template merging using DBIdentify
-            self.root.after(0, lambda: self.duplicate_status_label.config(
-                text="🔍 Will check for duplicates after merging...", foreground="blue"))
+            self.ui.post(lambda: self.duplicate_status_label.config(
+                text="🔍 Will check for duplicates after merging...", foreground="blue"), key="duplicate_status")
             
             # Check if this is the same finger as previous scans (only for 2nd and 3rd scans)
             if self.current_templates:
-                with self.device_lock:
-                    if self.zkfp2:
-                        match_result = self.zkfp2.DBMatch(self.current_templates[0], tmp)
-                        if match_result == 0:
-                            self.log("Warning: Different finger detected!")
-                            self.root.after(0, lambda: messagebox.showwarning("Warning", 
-                                "This appears to be a different finger. Please use the same finger."))
-                            self.root.after(0, self.registration_complete, False, None, None, employee_data)
-                            return
+                first_template = self.current_templates[0]
+                try:
+                    match_result = self.arbiter.call(
+                        PRIORITY_ENROLLMENT, lambda zkfp2: zkfp2.DBMatch(first_template, tmp)).result()
+                except DeviceUnavailable as e:
+                    self.log(f"❌ {str(e)} during registration")
+                    self.ui.post(self.registration_complete, False, None, None, employee_data, str(e))
+                    return
+                if match_result == 0:
+                    self.log("Warning: Different finger detected!")
+                    self.ui.post(self.registration_complete, False, None, None, employee_data,
+                                 "This appears to be a different finger. Please use the same finger.")
+                    return
                     
             self.current_templates.append(tmp)
-            self.root.after(0, lambda: self.progress_bar.step(1))
+            self.ui.post(lambda i=i: self.progress_bar.config(value=i + 1), key="registration_progress")
             self.log(f"Scan {i+1}/3 captured")
             
-            self.display_fingerprint_image(img)
+            self.ui.post(self.display_fingerprint_image, img, key="fingerprint_image")
             
-            time.sleep(1)
+            if self.cancel.sleep(1):
+                return
             
         try:
             self.log("Merging templates...")
-            with self.device_lock:
-                if not self.zkfp2:
-                    raise Exception("Device disconnected during registration")
-                    
-                reg_temp, reg_temp_len = self.zkfp2.DBMerge(*self.current_templates)
-                
-                # CRITICAL: Reload all existing templates to device memory for proper duplicate detection
-                self.log("🔄 Reloading all existing templates for duplicate detection...")
-                for existing_user_id, existing_user_info in self.registered_users.items():
-                    if existing_user_info.get('template'):
-                        try:
-                            # Extract numeric part for device operations
-                            if existing_user_id.startswith('EMP'):
-                                existing_id_int = int(existing_user_id[3:])
-                            else:
-                                existing_id_int = int(existing_user_id) if isinstance(existing_user_id, str) else existing_user_id
-                            
-                            # Add template to device memory - DISABLED to prevent errors
-                            # self.zkfp2.DBAdd(existing_id_int, existing_user_info['template'])
-                            self.log(f"ℹ️  Skipped reloading template for {existing_user_info['name']} (ID: {existing_user_id}) - DBAdd disabled")
-                        except Exception as reload_e:
-                            self.log(f"⚠️  Failed to reload template for {existing_user_id}: {str(reload_e)}")
-                            continue
-                
-                # Extract numeric part from Employee ID for device operations - DISABLED to prevent errors
-                if user_id.startswith('EMP'):
-                    user_id_int = int(user_id[3:])  # Remove 'EMP' prefix and convert to int
-                else:
-                    user_id_int = int(user_id) if isinstance(user_id, str) else user_id
-                # self.zkfp2.DBAdd(user_id_int, reg_temp)  # DISABLED to prevent DBAdd errors
-                self.log(f"ℹ️  Skipped adding template to device - DBAdd disabled")
+            templates = list(self.current_templates)
+            reg_temp, reg_temp_len = self.arbiter.call(
+                PRIORITY_ENROLLMENT, lambda zkfp2: zkfp2.DBMerge(*templates)).result()
+            
+            # CRITICAL: Reload all existing templates to device memory for proper duplicate detection
+            self.log("🔄 Reloading all existing templates for duplicate detection...")
+            for existing_user_id, existing_user_info in self.registered_users.items():
+                if existing_user_info.get('template'):
+                    try:
+                        # Extract numeric part for device operations
+                        if existing_user_id.startswith('EMP'):
+                            existing_id_int = int(existing_user_id[3:])
+                        else:
+                            existing_id_int = int(existing_user_id) if isinstance(existing_user_id, str) else existing_user_id
+                        
+                        # Add template to device memory - DISABLED to prevent errors
+                        # self.zkfp2.DBAdd(existing_id_int, existing_user_info['template'])
+                        self.log(f"ℹ️  Skipped reloading template for {existing_user_info['name']} (ID: {existing_user_id}) - DBAdd disabled")
+                    except Exception as reload_e:
+                        self.log(f"⚠️  Failed to reload template for {existing_user_id}: {str(reload_e)}")
+                        continue
+            
+            # Extract numeric part from Employee ID for device operations - DISABLED to prevent errors
+            if user_id.startswith('EMP'):
+                user_id_int = int(user_id[3:])  # Remove 'EMP' prefix and convert to int
+            else:
+                user_id_int = int(user_id) if isinstance(user_id, str) else user_id
+            # self.zkfp2.DBAdd(user_id_int, reg_temp)  # DISABLED to prevent DBAdd errors
+            self.log(f"ℹ️  Skipped adding template to device - DBAdd disabled")
             
-            # Check for duplicates in backend database (OUTSIDE device lock)
+            # Check for duplicates in backend database (no device access needed)
             self.log("🔍 Checking for duplicates in backend database...")
             self.log("🚨 DUPLICATE CHECK STARTING - THIS SHOULD APPEAR IN LOGS!")
             self.log("🚨 CRITICAL: About to start duplicate check for user: " + str(user_id))
@@ -602,26 +640,16 @@ class UnifiedBiometricGUI:
             
             try:
                 # Send fingerprint template to backend for duplicate check
-                duplicate_check_data = {
-                    "fingerprintTemplate": bytes(reg_temp).hex(),
-                    "excludeEmployeeId": None  # Don't exclude any employee for new registrations
-                }
-                
                 self.log(f"🔍 Sending duplicate check request for user: {user_id}")
-                self.log(f"🔍 Template length: {len(bytes(reg_temp).hex())}")
-                self.log(f"🔍 Template hex (first 100 chars): {bytes(reg_temp).hex()[:100]}...")
+                self.log(f"🔍 Template length: {len(bytes(reg_temp))} bytes")
                 
                 # Test backend connection first
                 self.log(f"🔍 Testing backend connection...")
                 test_response = requests.get("http://localhost:5000/api/fingerprint/test", timeout=5)
                 self.log(f"🔍 Backend test response: {test_response.status_code} - {test_response.text}")
                 
-                response = requests.post(
-                    "http://localhost:5000/api/fingerprint/check-duplicate",
-                    json=duplicate_check_data,
-                    headers={'Content-Type': 'application/json'},
-                    timeout=10
-                )
+                # No exclusion for new registrations
+                response = self.backend.check_duplicate(reg_temp, exclude_employee_id=None, timeout=10)
                 
                 self.log(f"🔍 Backend response status: {response.status_code}")
                 
@@ -676,18 +704,18 @@ class UnifiedBiometricGUI:
                 self.log(f"❌ Stopping registration process...")
                 
                 self.log(f"❌ Duplicate fingerprint detected! Already registered to: {duplicate_user['name']}")
-                self.root.after(0, lambda: self.duplicate_status_label.config(
-                    text="❌ DUPLICATE FINGERPRINT DETECTED!", foreground="red"))
-                self.root.after(0, lambda: messagebox.showerror("Duplicate Fingerprint", 
-                    f"This fingerprint is already registered to:\n\nName: {duplicate_user['name']}\n\nPlease use a different finger or contact admin."))
-                self.root.after(0, self.registration_complete, False, None, None, employee_data)
+                self.ui.post(lambda: self.duplicate_status_label.config(
+                    text="❌ DUPLICATE FINGERPRINT DETECTED!", foreground="red"), key="duplicate_status")
+                self.ui.post(self.registration_complete, False, None, None, employee_data,
+                             f"Duplicate fingerprint: already registered to {duplicate_user['name']}. "
+                             "Please use a different finger or contact admin.")
                 return  # CRITICAL: Stop execution here to prevent duplicate registration
             
             # No duplicates found - proceed with registration
             self.log("✅ DUPLICATE CHECK PASSED - No duplicates found - proceeding with registration")
             self.log("🚨 CRITICAL: About to proceed with registration...")
-            self.root.after(0, lambda: self.duplicate_status_label.config(
-                text="✅ No duplicates found", foreground="green"))
+            self.ui.post(lambda: self.duplicate_status_label.config(
+                text="✅ No duplicates found", foreground="green"), key="duplicate_status")
             
             # Store user_id as string for consistency with database
             user_id_str = str(user_id)
@@ -712,11 +740,11 @@ class UnifiedBiometricGUI:
             
             self.log(f"Registration successful for {user_name}")
             self.safe_light('green')
-            self.root.after(0, self.registration_complete, True, user_id, user_name, employee_data)
+            self.ui.post(self.registration_complete, True, user_id, user_name, employee_data)
             
         except Exception as e:
             self.log(f"Registration error: {str(e)}")
-            self.root.after(0, self.registration_complete, False, None, None, employee_data)
+            self.ui.post(self.registration_complete, False, None, None, employee_data)
 
     def create_employee_in_backend(self, employee_data, fingerprint_template):
         """Create employee in MongoDB backend"""
@@ -776,13 +804,13 @@ class UnifiedBiometricGUI:
             self.log(f"❌ Error creating employee in backend: {str(e)}")
             return False
 
-    def registration_complete(self, success, user_id, user_name, employee_data=None):
-        """Callback when fingerprint registration is complete"""
+    def registration_complete(self, success, user_id, user_name, employee_data=None, reason=None):
+        """Callback when fingerprint registration is complete (reason: why it failed, for the banner)"""
         self.btn_register.config(state=tk.NORMAL)
 
         if success:
             self.log(f"✅ Fingerprint registered successfully for {user_name} ({user_id})")
-            messagebox.showinfo("Success", f"Fingerprint registered successfully for {user_name}!")
+            self.toast.success(f"✅ Fingerprint registered for {user_name}")
             
             # Clear form
             self.clear_form_fields()
@@ -795,7 +823,7 @@ class UnifiedBiometricGUI:
             self.update_users_list()
         else:
             self.log(f"❌ Registration failed for {user_name}")
-            messagebox.showerror("Error", f"Registration failed for {user_name}")
+            self.toast.error(f"❌ {reason or 'Registration failed'}", duration_ms=6000)
             self.progress_bar['value'] = 0
             self.progress_label.config(text="Registration failed")
 
@@ -843,105 +871,109 @@ class UnifiedBiometricGUI:
         """Perform the actual fingerprint scan and attendance recording"""
         try:
             # Update progress
-            self.root.after(0, lambda: self.attendance_progress_var.set(10))
-            self.root.after(0, lambda: self.attendance_status_label.config(text="Initializing scan..."))
+            self.set_attendance_progress(10, "Initializing scan...")
 
             # Wait a moment for device to be ready
-            time.sleep(0.5)
+            if self.cancel.sleep(0.5):
+                return
 
             # Capture fingerprint
-            self.root.after(0, lambda: self.attendance_progress_var.set(30))
-            self.root.after(0, lambda: self.attendance_status_label.config(text="Capturing fingerprint..."))
+            self.set_attendance_progress(30, "Capturing fingerprint...")
 
             capture = self.capture_fingerprint()
             if not capture:
-                self.root.after(0, self.attendance_scan_failed, "Fingerprint capture failed or timeout")
+                self.ui.post(self.attendance_scan_failed, "Fingerprint capture failed or timeout")
                 return
 
             template, img = capture
 
-            # Convert to hex string
-            self.root.after(0, lambda: self.attendance_progress_var.set(60))
-            self.root.after(0, lambda: self.attendance_status_label.config(text="Processing fingerprint..."))
+            # Poor captures get a "press again" before any matching or upload
+            quality = assess_capture(img)
+            if not quality["ok"]:
+                self.log(f"👆 Capture rejected in {quality['ms']:.1f} ms: {quality['reason']}")
+                self.ui.post(self.attendance_scan_failed, f"Press again - {quality['reason']}")
+                return
+
+            self.set_attendance_progress(60, "Processing fingerprint...")
 
-            template_hex = bytes(template).hex()
-            
             # Debug logging
             self.log(f"🔍 DEBUG: Template type: {type(template)}")
             self.log(f"🔍 DEBUG: Template length: {len(template)}")
-            self.log(f"🔍 DEBUG: Template hex length: {len(template_hex)}")
 
-            # Send to backend
-            self.root.after(0, lambda: self.attendance_progress_var.set(80))
-            self.root.after(0, lambda: self.attendance_status_label.config(text="Recording attendance..."))
+            match = self.identify_at_edge(template)
 
-            success, result = self.record_attendance(template_hex)
+            # Send to backend (raw bytes; the backend converts to hex for matching)
+            self.set_attendance_progress(80, "Recording attendance...")
+
+            success, result = self.record_attendance(template, match)
+            archive_scan(template, img, {
+                "source": "biometric_system_gui",
+                "employeeId": result.get('employee', {}).get('employeeId') if success else (match or {}).get('employeeId'),
+                "success": success,
+                "message": result.get('message') if success else result
+            }, None)
 
             if success:
-                self.root.after(0, lambda: self.attendance_progress_var.set(100))
-                self.root.after(0, lambda: self.attendance_status_label.config(text="Attendance recorded successfully!"))
-                self.root.after(0, self.attendance_scan_success, result)
+                self.set_attendance_progress(100, "Attendance recorded successfully!")
+                self.ui.post(self.attendance_scan_success, result)
             else:
-                self.root.after(0, self.attendance_scan_failed, result)
+                self.ui.post(self.attendance_scan_failed, result)
 
         except Exception as e:
-            self.root.after(0, self.attendance_scan_failed, f"Scan error: {str(e)}")
+            self.ui.post(self.attendance_scan_failed, f"Scan error: {str(e)}")
 
         finally:
             self.is_capturing = False
-            self.root.after(0, lambda: self.btn_scan_attendance.config(state=tk.NORMAL))
+            self.ui.post(lambda: self.btn_scan_attendance.config(state=tk.NORMAL), key="attendance_button")
 
-    def capture_fingerprint(self, timeout=15):
-        """✅ Capture a fingerprint with timeout - COMPLETELY FIXED VERSION"""
-        if not self.zkfp2:
-            self.log("❌ Device not initialized - cannot capture")
-            return None
-            
-        start_time = time.time()
+    def set_attendance_progress(self, value, text):
+        """Queue a coalesced progress bar / status label update (safe from worker threads)"""
+        self.ui.post(self.attendance_progress_var.set, value, key="attendance_progress")
+        self.ui.post(lambda: self.attendance_status_label.config(text=text), key="attendance_status")
+
+    def capture_fingerprint(self, timeout=15, priority=PRIORITY_ATTENDANCE):
+        """✅ Capture a fingerprint with timeout, queued behind higher-priority device requests"""
         self.log(f"🔍 Starting fingerprint capture (timeout: {timeout}s)")
-        
-        while time.time() - start_time < timeout:
-            try:
-                # Single capture attempt with proper error handling
-                capture = self.zkfp2.AcquireFingerprint()
-                
-                if capture and len(capture) >= 2:
-                    template, img = capture
-                    self.log("✅ Fingerprint captured successfully")
-                    return capture
-                else:
-                    # No finger detected, continue trying
-                    pass
-                    
-            except Exception as e:
-                error_msg = str(e)
-                self.log(f"⚠️ Capture attempt failed: {error_msg}")
-                
-                # Check for specific error types
-                if "Invalid Handle" in error_msg:
-                    self.log("❌ Invalid Handle error - device connection lost")
-                    return None
-                elif "Device not connected" in error_msg:
-                    self.log("❌ Device not connected error")
-                    return None
-                # For other errors, continue trying
-                
-            time.sleep(0.1)
-            
-        self.log(f"⏰ Fingerprint capture timeout after {timeout}s")
-        return None
+        request = self.arbiter.capture(priority, timeout)
+        self.cancel.on_cancel(request.cancel)
+        try:
+            capture = request.result()
+        except DeviceUnavailable as e:
+            self.log(f"❌ {str(e)} - cannot capture")
+            return None
+        finally:
+            self.cancel.remove_callback(request.cancel)
+
+        if capture:
+            self.log("✅ Fingerprint captured successfully")
+        else:
+            self.log(f"⏰ Fingerprint capture timeout after {timeout}s")
+        return capture
 
-    def record_attendance(self, fingerprint_template):
-        """Send fingerprint to backend for attendance recording"""
+    def identify_at_edge(self, template):
+        """Edge mode: DBIdentify through the arbiter; returns the match, or None to upload the template"""
+        if not self.edge:
+            return None
         try:
-            payload = {
-                "fingerprint_template": fingerprint_template
-            }
+            match = self.arbiter.call(
+                PRIORITY_ATTENDANCE, lambda zkfp2: self.edge.identify(zkfp2, template)).result()
+        except Exception as e:
+            self.log(f"⚠️ Edge identification failed, sending template: {str(e)}")
+            return None
+        if match:
+            self.log(f"🔍 Edge match: {match['employeeId']} (FID {match['fid']}, score {match['score']})")
+        else:
+            self.log("🔍 No edge match - sending template to the backend")
+        return match
 
-            headers = {'Content-Type': 'application/json'}
+    def record_attendance(self, fingerprint_template, match=None):
+        """Send fingerprint (or the edge match for it) to backend for attendance recording"""
+        try:
             self.log(f"📤 Sending attendance request to {self.backend_url}/api/attendance/record")
-            response = requests.post(f"{self.backend_url}/api/attendance/record",
-                                   json=payload, headers=headers, timeout=10)
+            if match:
+                response = self.backend.record_identified(match, fingerprint_template, timeout=10)
+            else:
+                response = self.backend.record_attendance(fingerprint_template, timeout=10)
 
             if response.status_code == 200:
                 result = response.json()
@@ -982,6 +1014,7 @@ class UnifiedBiometricGUI:
 {result.get('message', '')}"""
 
             self.display_attendance_result(message, "success")
+            self.toast.success(f"✅ {employee.get('name', 'Unknown')} - {attendance.get('time', 'N/A')}")
 
             # Auto-clear after 10 seconds
             self.root.after(10000, self.clear_attendance_result)
@@ -999,6 +1032,7 @@ Error: {error_message}
 Please try again or contact administrator if the problem persists."""
 
             self.display_attendance_result(message, "error")
+            self.toast.error(f"❌ {error_message}")
 
         except Exception as e:
             self.log(f"Error displaying failed result: {str(e)}")
@@ -1041,14 +1075,18 @@ Please try again or contact administrator if the problem persists."""
             print(f"Error clearing logs: {str(e)}")
 
     def log(self, message):
-        """Log message to console and GUI"""
+        """Log message to console and GUI (safe from worker threads)"""
         timestamp = time.strftime('%H:%M:%S')
         log_message = f"[{timestamp}] {message}"
         print(log_message)
         
-        # Add to GUI log
+        # The widget is written by the Tk thread, one insert per frame
+        self.ui.append("log", self.write_log_lines, log_message)
+
+    def write_log_lines(self, lines):
+        """Append a frame's worth of log lines to the GUI log"""
         try:
-            self.log_text.insert(tk.END, log_message + "\n")
+            self.log_text.insert(tk.END, "\n".join(lines) + "\n")
             self.log_text.see(tk.END)
         except:
             pass
@@ -1107,6 +1145,7 @@ Please try again or contact administrator if the problem persists."""
             self.root.update()
             
             # Clean up any existing connection first
+            self.arbiter.detach()
             if self.zkfp2:
                 try:
                     self.log("🧹 Cleaning up existing device connection...")
@@ -1131,6 +1170,9 @@ Please try again or contact administrator if the problem persists."""
                 try:
                     self.log("🔌 Opening device connection...")
                     self.zkfp2.OpenDevice(0)
+                    self.arbiter.attach(self.zkfp2)
+                    if self.edge:
+                        self.edge.reset()
                     self.log("✅ Device opened successfully")
                 except Exception as open_e:
                     self.log(f"❌ Failed to open device: {str(open_e)}")
@@ -1158,7 +1200,7 @@ Please try again or contact administrator if the problem persists."""
                 self.load_users_to_device()
                 
                 self.log("🎉 Device initialization completed successfully!")
-                messagebox.showinfo("Success", "Device initialized successfully!")
+                self.toast.success("Device initialized")
             else:
                 self.log("❌ No devices found")
                 messagebox.showerror("Error", "No devices found!")
@@ -1175,6 +1217,7 @@ Please try again or contact administrator if the problem persists."""
             self.device_status_label.config(text="Disconnecting...", foreground="orange")
             self.root.update()
             
+            self.arbiter.detach()
             if self.zkfp2:
                 try:
                     self.log("🧹 Cleaning up device resources...")
@@ -1201,32 +1244,21 @@ Please try again or contact administrator if the problem persists."""
             self.btn_scan_attendance.config(state=tk.DISABLED)
             
             self.log("🎉 Device termination completed successfully!")
-            messagebox.showinfo("Success", "Device terminated successfully!")
+            self.toast.info("Device terminated")
             
         except Exception as e:
             self.log(f"❌ Termination error: {str(e)}")
             messagebox.showerror("Error", f"Failed to terminate device:\n{str(e)}")
 
-    def safe_light(self, color):
-        """✅ Safe wrapper para sa Light() function"""
-        try:
-            with self.device_lock:
-                if self.zkfp2:
-                    # Map 'off' to a valid color or skip
-                    if color == 'off':
-                        return  # Skip turning off light
-                    # Only try light control if device is properly initialized
-                    try:
-                        self.zkfp2.Light(color)
-                    except Exception as light_error:
-                        # Silently ignore light control errors to prevent threading issues
-                        pass
-        except Exception as e:
-            # Silently ignore all light control errors
-            pass
+    def safe_light(self, color, priority=PRIORITY_ENROLLMENT):
+        """✅ Safe wrapper para sa Light() function (queued on the arbiter, never waits)"""
+        if color == 'off':
+            return  # Skip turning off light
+        # The result is never read, so light control errors are silently ignored
+        self.arbiter.call(priority, lambda zkfp2: zkfp2.Light(color))
 
     def load_users_from_backend(self):
-        """✅ Load all users from MongoDB backend"""
+        """✅ Load all users from MongoDB backend (runs in a background thread)"""
         try:
             if not self.check_backend_connection():
                 self.log("❌ Backend server not running - cannot load users")
@@ -1235,25 +1267,33 @@ Please try again or contact administrator if the problem persists."""
             response = requests.get("http://localhost:5000/api/employees", timeout=10)
             if response.status_code == 200:
                 employees = response.json()
-                self.registered_users = {}
+                users = {}
                 
                 for emp in employees:
                     if emp.get('fingerprintEnrolled'):
                         user_id = emp.get('employeeId')
                         user_name = f"{emp.get('firstName', '')} {emp.get('lastName', '')}"
-                        self.registered_users[user_id] = {
+                        users[user_id] = {
                             'name': user_name,
                             'template': None,  # Template not stored in MongoDB for security
                             'template_length': 0,
                             'employee_data': emp
                         }
                 
-                self.log(f"✅ Loaded {len(self.registered_users)} enrolled users from MongoDB")
-                self.update_users_list()
+                self.log(f"✅ Loaded {len(users)} enrolled users from MongoDB")
+                self.ui.post(self.set_registered_users, users)
                 
         except Exception as e:
             self.log(f"❌ Error loading users from backend: {str(e)}")
 
+    def set_registered_users(self, users):
+        """Replace the roster with one loaded in the background (Tk thread)"""
+        # Keep anyone registered in this session before the backend answered
+        users.update({user_id: info for user_id, info in self.registered_users.items() if user_id not in users})
+        self.registered_users = users
+        self.update_users_list()
+        self.log_startup_time("Roster loaded")
+
     def load_users_to_device(self):
         """✅ Load users from database to device - DISABLED to prevent errors"""
         try:
@@ -1349,7 +1389,7 @@ Please try again or contact administrator if the problem persists."""
                 self.update_users_list()
                 self.btn_delete_user.config(state=tk.DISABLED)
                 
-                messagebox.showinfo("Success", f"User {user_name} deleted successfully!")
+                self.toast.success(f"User {user_name} deleted")
                 self.log(f"✅ User {user_name} (ID: {user_id}) deleted completely")
             else:
                 messagebox.showerror("Error", "Failed to delete user from database!")
@@ -1381,11 +1421,15 @@ Please try again or contact administrator if the problem persists."""
 
     def on_closing(self):
         """Handle window closing"""
+        self.ui.stop()
+        self.cancel.cancel("Window closed")
+        self.arbiter.stop()
         try:
             if self.zkfp2:
                 self.zkfp2.Terminate()
         except:
             pass
+        close_scan_archive(timeout=2)  # Flush queued scans to disk
         self.root.destroy()
 
 def main():
@@ -0,0 +1,94 @@
+"""
+Cancellation Tokens for Capture and Enrollment Loops
+Every loop that polls the scanner checks a CancelToken between polls and sleeps
+with token.sleep(), so cancelling stops the loop (and lets it release the device)
+within one poll interval instead of waiting out its 15-30 s timeout.
+
+GUIs cancel the token from on_closing() or a Cancel button. Bridge scripts spawned
+by the backend call cancel_on_termination(), which cancels on SIGTERM/SIGINT
+(SIGBREAK on Windows) or when the caller closes the stdin pipe.
+"""
+
+import os
+import sys
+import stat
+import signal
+import threading
+
+class CaptureCancelled(Exception):
+    """Raised by CancelToken.check() once the token is cancelled"""
+
+class CancelToken:
+    """Thread-safe, one-way cancellation flag with callbacks"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.callbacks = []
+        self.reason = None
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def cancel(self, reason="Cancelled"):
+        """Cancel once; later calls are ignored"""
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.reason = reason
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️  Cancel callback failed: {str(e)}", file=sys.stderr)
+
+    def on_cancel(self, callback):
+        """Run callback when cancelled (immediately if it already is), e.g. DeviceRequest.cancel"""
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        """Forget a callback registered with on_cancel (e.g. once its request has finished)"""
+        with self.lock:
+            if callback in self.callbacks:
+                self.callbacks.remove(callback)
+
+    def sleep(self, seconds):
+        """Sleep unless cancelled first; returns True if cancelled"""
+        return self.event.wait(seconds)
+
+    def check(self):
+        """Raise CaptureCancelled if cancelled"""
+        if self.event.is_set():
+            raise CaptureCancelled(self.reason)
+
+def _stdin_is_pipe():
+    try:
+        return stat.S_ISFIFO(os.fstat(sys.stdin.fileno()).st_mode)
+    except (AttributeError, OSError, ValueError):
+        return False
+
+def _watch_stdin(token):
+    try:
+        while sys.stdin.buffer.read(4096):
+            pass  # The caller sends nothing; only EOF matters
+    except (OSError, ValueError):
+        pass
+    token.cancel("Caller closed the connection")
+
+def cancel_on_termination(token):
+    """Cancel token when the calling process terminates us or closes our stdin pipe (main thread only)"""
+    for name in ("SIGTERM", "SIGINT", "SIGBREAK"):
+        signum = getattr(signal, name, None)
+        if signum is not None:
+            signal.signal(signum, lambda received, frame: token.cancel(f"Received signal {received}"))
+    # Only a pipe: a terminal or NUL/devnull stdin must not cancel anything
+    if _stdin_is_pipe():
+        threading.Thread(target=_watch_stdin, args=(token,), daemon=True).start()
+    return token
@@ -13,6 +13,7 @@ import os
 from pyzkfp import ZKFP2
 from pymongo import MongoClient
 from datetime import datetime
+from gallery_partition import KIOSK_SITE
 
 def get_database_connection():
     """Connect to MongoDB database"""
@@ -177,7 +178,7 @@ def capture_and_record_attendance():
             "time": datetime.utcnow(),
             "status": status,
             "deviceType": "biometric",
-            "location": "Main Office"
+            "location": KIOSK_SITE
         }
 
         # Insert attendance record
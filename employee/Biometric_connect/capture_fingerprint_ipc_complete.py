@@ -14,6 +14,29 @@ from pyzkfp import ZKFP2
 from pymongo import MongoClient
 from datetime import datetime
 import time
+from bson import ObjectId
+from attendance_day_key import manila_day_key, find_day_attendance
+from template_replica import sync_local_replica
+from gallery_partition import (
+    KIOSK_SITE, KIOSK_PARTITIONS, CROSS_SITE_FALLBACK, describe_partitions, identify_other_partitions
+)
+from fingerprint_templates import TEMPLATE_PROJECTION, iter_employee_templates
+from scan_debounce import get_debounce_cache
+from cancellation import CancelToken, cancel_on_termination
+
+# DBMatch score (0-100) a login fingerprint must reach against the claimed employee's template
+VERIFY_MATCH_THRESHOLD = int(os.environ.get("VERIFY_MATCH_THRESHOLD", "60"))
+
+# Verify-mode lookup: the stored templates plus everything the login response returns
+LOGIN_PROJECTION = {
+    **TEMPLATE_PROJECTION,
+    "email": 1,
+    "position": 1,
+    "department": 1,
+    "salary": 1,
+    "hireDate": 1,
+    "passwordChanged": 1
+}
 
 def get_database_connection():
     """Connect to MongoDB database with retry logic"""
@@ -113,8 +136,9 @@ def check_device_health():
             "error": f"Device initialization failed: {str(e)}"
         }
 
-def capture_and_record_attendance():
+def capture_and_record_attendance(cancel=None):
     """Capture fingerprint and directly record attendance in database"""
+    cancel = cancel or CancelToken()
     try:
         # First, connect to database
         db, client = get_database_connection()
@@ -146,7 +170,7 @@ def capture_and_record_attendance():
         timeout = 25  # 25 seconds timeout for low-end hardware
 
         captured_template = None
-        while time.time() - start_time < timeout:
+        while time.time() - start_time < timeout and not cancel.cancelled:
             try:
                 capture = zkfp2.AcquireFingerprint()
                 if capture:
@@ -156,11 +180,19 @@ def capture_and_record_attendance():
 
             except Exception as e:
                 print(f"Capture attempt failed: {e}", file=sys.stderr)
-                time.sleep(0.1)
+                cancel.sleep(0.1)
 
         # Terminate device connection - MUST keep device open for matching!
         # zkfp2.Terminate()  # ← DON'T terminate yet, need for matching!
 
+        if cancel.cancelled:
+            zkfp2.Terminate()
+            print(f"🛑 Capture cancelled: {cancel.reason}", file=sys.stderr)
+            return {
+                "success": False,
+                "error": f"Capture cancelled: {cancel.reason}"
+            }
+
         if not captured_template:
             zkfp2.Terminate()
             return {
@@ -169,15 +201,15 @@ def capture_and_record_attendance():
             }
 
         # ✅ FIX: Use pyzkfp's DB matching API correctly
-        # Get all enrolled employees
+        # Get this kiosk's partitions of the local replica (synced incrementally from MongoDB)
         employees_collection = db.employees
-        enrolled_employees = list(employees_collection.find({
-            "fingerprintEnrolled": True,
-            "isActive": True,
-            "fingerprintTemplate": {"$exists": True, "$ne": None}
-        }))
+        replica = sync_local_replica(db)
+        load_started = time.perf_counter()
+        enrolled_templates = replica.load_gallery(active_only=True, partitions=KIOSK_PARTITIONS)
 
-        if not enrolled_employees:
+        # A site with nobody enrolled yet can still match other sites' employees
+        fallback_enabled = bool(KIOSK_PARTITIONS) and CROSS_SITE_FALLBACK
+        if not enrolled_templates and not fallback_enabled:
             zkfp2.Terminate()
             return {
                 "success": False,
@@ -192,23 +224,24 @@ def capture_and_record_attendance():
             print(f"✅ Fingerprint database initialized", file=sys.stderr)
 
             # Step 2: Add all enrolled templates to the database
-            employee_map = {}  # Map fingerprint ID to employee
+            employee_map = {}  # Map fingerprint ID to employee _id
             fid_counter = 1  # ✅ FIX: Start from 1, not 0! (0 means no match)
             
-            for emp in enrolled_employees:
+            for entry in enrolled_templates:
                 try:
-                    stored_template = base64.b64decode(emp['fingerprintTemplate'])
                     fid = fid_counter  # Use sequential ID starting from 1
-                    zkfp2.DBAdd(fid, stored_template)
-                    employee_map[fid] = emp
-                    print(f"  Added {emp.get('employeeId')} (fid={fid})", file=sys.stderr)
+                    zkfp2.DBAdd(fid, entry['template'])
+                    employee_map[fid] = ObjectId(entry['employee_key'])
+                    print(f"  Added {entry['employeeId']} (fid={fid})", file=sys.stderr)
                     fid_counter += 1
                 except Exception as e:
                     # ✅ FIX: Skip invalid templates (like EMP-1491) but continue
-                    print(f"⚠️ Skipping {emp.get('employeeId')}: {e}", file=sys.stderr)
+                    print(f"⚠️ Skipping {entry['employeeId']}: {e}", file=sys.stderr)
                     continue
+            print(f"📊 Gallery ({describe_partitions()}): {len(employee_map)} templates loaded in "
+                  f"{(time.perf_counter() - load_started) * 1000:.0f} ms", file=sys.stderr)
 
-            if not employee_map:
+            if not employee_map and not fallback_enabled:
                 zkfp2.DBFree()
                 zkfp2.Terminate()
                 return {
@@ -218,17 +251,27 @@ def capture_and_record_attendance():
 
             # Step 3: Perform 1-to-N matching
             print(f"🔍 Performing 1-to-N fingerprint matching...", file=sys.stderr)
-            match_result = zkfp2.DBIdentify(captured_template)
+            identify_started = time.perf_counter()
+            match_result = zkfp2.DBIdentify(captured_template) if employee_map else (0, 0)
             
             # DBIdentify returns [fid, score]
             # fid=0 means NO MATCH, fid>=1 means match found
             matched_fid = match_result[0]
             match_score = match_result[1]
 
-            print(f"Match result: fid={matched_fid}, score={match_score}", file=sys.stderr)
+            print(f"Match result: fid={matched_fid}, score={match_score} "
+                  f"({(time.perf_counter() - identify_started) * 1000:.0f} ms)", file=sys.stderr)
 
             # ✅ FIX: Check if fid is 0 (no match) OR not in our map
-            if matched_fid == 0 or matched_fid not in employee_map:
+            matched_key = employee_map.get(matched_fid) if matched_fid else None
+            if matched_key is None:
+                # Not one of this site's employees; maybe a visitor from another site
+                fallback_entry, fallback_score = identify_other_partitions(
+                    zkfp2, replica, captured_template, active_only=True)
+                if fallback_entry:
+                    matched_key = ObjectId(fallback_entry['employee_key'])
+                    match_score = fallback_score
+            if matched_key is None:
                 print(f"❌ No match found (fid={matched_fid}, threshold not met)", file=sys.stderr)
                 zkfp2.DBFree()
                 zkfp2.Terminate()
@@ -237,8 +280,19 @@ def capture_and_record_attendance():
                     "error": "Fingerprint not recognized - please enroll first or contact administrator"
                 }
             
-            # Match found!
-            employee = employee_map[matched_fid]
+            # Match found! Fetch only the matched employee's profile
+            employee = employees_collection.find_one(
+                {"_id": matched_key},
+                {"fingerprintTemplate": 0, "fingerprintTemplates": 0}
+            )
+            if not employee:
+                # Matched a replica entry whose employee no longer exists
+                zkfp2.DBFree()
+                zkfp2.Terminate()
+                return {
+                    "success": False,
+                    "error": "Fingerprint not recognized - please enroll first or contact administrator"
+                }
             print(f"✅ Matched: {employee.get('employeeId')} - {employee.get('firstName')} {employee.get('lastName')} (score={match_score})", file=sys.stderr)
 
             # Step 4: Clean up
@@ -263,6 +317,13 @@ def capture_and_record_attendance():
                 "error": "Fingerprint not recognized - please enroll first or contact administrator"
             }
 
+        # A repeat press within the debounce window gets the previous answer without a DB lookup
+        debounce = get_debounce_cache()
+        previous_result = debounce.get(employee["_id"])
+        if previous_result:
+            print(f"🔁 Repeat scan within {debounce.ttl:.0f}s - returning previous result", file=sys.stderr)
+            return previous_result
+
         # Determine Time In or Time Out based on last attendance
         attendance_collection = db.attendances
 
@@ -279,13 +340,18 @@ def capture_and_record_attendance():
         # Get today's date in Philippines timezone (date only, no time)
         today = current_time_ph.replace(hour=0, minute=0, second=0, microsecond=0)
         
-        # Find last attendance record for this employee TODAY
-        last_attendance = attendance_collection.find_one(
-            {
+        day_key = manila_day_key(current_time_ph)
+        
+        # Find today's attendance record for this employee with a point query on
+        # (employee, dayKey); records written before dayKey existed are matched the old way
+        last_attendance = find_day_attendance(
+            attendance_collection,
+            employee["_id"],
+            day_key,
+            legacy_filter={
                 "employeeId": employee["employeeId"],
                 "date": today.replace(tzinfo=None)  # Store as naive datetime in DB
-            },
-            sort=[("_id", -1)]
+            }
         )
 
         # Convert to naive datetime for MongoDB storage (MongoDB stores UTC internally)
@@ -297,16 +363,18 @@ def capture_and_record_attendance():
             # No attendance today - this is Time In
             status = "Time In"
             attendance_record = {
+                "employee": employee["_id"],
                 "employeeId": employee["employeeId"],
                 "employeeName": f"{employee['firstName']} {employee['lastName']}",
                 "date": today_naive,
+                "dayKey": day_key,
                 "timeIn": current_time,
                 "timeOut": None,
                 "status": "present",
                 "timeInStatus": None,  # Will be calculated by backend
                 "dayType": None,  # Will be calculated by backend
                 "deviceType": "biometric",
-                "location": "Main Office",
+                "location": KIOSK_SITE,
                 "archived": False,
                 "time": current_time  # Keep for compatibility
             }
@@ -336,13 +404,15 @@ def capture_and_record_attendance():
             # DENY: Only ONE Time In/Out cycle allowed per day!
             time_in_str = last_attendance['timeIn'].strftime('%I:%M %p') if last_attendance.get('timeIn') else 'N/A'
             time_out_str = last_attendance['timeOut'].strftime('%I:%M %p') if last_attendance.get('timeOut') else 'N/A'
-            return {
+            result = {
                 "success": False,
                 "error": f"Attendance already completed for today. {employee['firstName']} {employee['lastName']} has already timed in at {time_in_str} and timed out at {time_out_str}. Multiple attendance records per day are not allowed."
             }
+            debounce.put(employee["_id"], "completed", result)
+            return result
 
         if inserted_id:
-            return {
+            result = {
                 "success": True,
                 "message": f"Attendance recorded successfully ({status})",
                 "employee": {
@@ -357,6 +427,8 @@ def capture_and_record_attendance():
                     "id": inserted_id
                 }
             }
+            debounce.put(employee["_id"], "time_in" if status == "Time In" else "time_out", result)
+            return result
         else:
             return {
                 "success": False,
@@ -369,8 +441,9 @@ def capture_and_record_attendance():
             "error": f"Biometric attendance recording failed: {str(e)}"
         }
 
-def capture_fingerprint():
+def capture_fingerprint(cancel=None):
     """Capture a single fingerprint from ZKTeco device (legacy mode)"""
+    cancel = cancel or CancelToken()
     try:
         # Initialize ZKTeco device
         zkfp2 = ZKFP2()
@@ -393,7 +466,7 @@ def capture_fingerprint():
         start_time = time.time()
         timeout = 25  # 25 seconds timeout for low-end hardware
 
-        while time.time() - start_time < timeout:
+        while time.time() - start_time < timeout and not cancel.cancelled:
             try:
                 capture = zkfp2.AcquireFingerprint()
                 if capture:
@@ -413,7 +486,15 @@ def capture_fingerprint():
 
             except Exception as e:
                 print(f"Capture attempt failed: {e}", file=sys.stderr)
-                time.sleep(0.1)
+                cancel.sleep(0.1)
+
+        if cancel.cancelled:
+            zkfp2.Terminate()
+            print(f"🛑 Capture cancelled: {cancel.reason}", file=sys.stderr)
+            return {
+                "success": False,
+                "error": f"Capture cancelled: {cancel.reason}"
+            }
 
         # Timeout reached
         zkfp2.Terminate()
@@ -429,8 +510,62 @@ def capture_fingerprint():
             "error": f"Device initialization failed: {str(e)}"
         }
 
-def capture_and_login():
-    """Capture fingerprint and lookup employee for login (IPC)"""
+def verify_login_fingerprint(zkfp2, employees_collection, employee_id, template):
+    """
+    1:1 verification when the login form supplies the employee ID: one lookup on the
+    employeeId index and a DBMatch per stored template, independent of headcount
+    Returns (employee, None) on a match or (None, error message)
+    """
+    employee = employees_collection.find_one(
+        {"employeeId": employee_id, "fingerprintEnrolled": True, "isActive": {"$ne": False}},
+        LOGIN_PROJECTION
+    )
+    if not employee:
+        return None, "No active enrolled employee with that ID"
+
+    best_score = 0
+    for template_index, stored_template in iter_employee_templates(employee):
+        score = zkfp2.DBMatch(stored_template, template)
+        best_score = max(best_score, score)
+        if score >= VERIFY_MATCH_THRESHOLD:
+            print(f"✅ Login verified: {employee_id} (template {template_index}, score={score})", file=sys.stderr)
+            return employee, None
+
+    print(f"❌ Login verify failed for {employee_id} (best score={best_score})", file=sys.stderr)
+    return None, "Fingerprint does not match this employee ID"
+
+def login_response(employees_collection, employee):
+    """Record the login and return the employee profile for the caller"""
+    # Update last login timestamp
+    employees_collection.update_one(
+        {"_id": employee["_id"]},
+        {"$set": {"lastLogin": datetime.utcnow()}}
+    )
+
+    return {
+        "success": True,
+        "message": "Biometric login successful",
+        "employee": {
+            "id": str(employee["_id"]),
+            "employeeId": employee["employeeId"],
+            "firstName": employee["firstName"],
+            "lastName": employee["lastName"],
+            "email": employee["email"],
+            "position": employee.get("position", ""),
+            "department": employee.get("department", ""),
+            "salary": employee.get("salary", 0),
+            "hireDate": employee.get("hireDate", "").isoformat() if employee.get("hireDate") else None,
+            "passwordChanged": employee.get("passwordChanged", False)
+        }
+    }
+
+def capture_and_login(cancel=None, employee_id=None):
+    """
+    Capture fingerprint and lookup employee for login (IPC)
+    With employee_id the capture is verified 1:1 against that employee only;
+    without it the whole gallery is searched (1:N)
+    """
+    cancel = cancel or CancelToken()
     try:
         # First, connect to database
         db, client = get_database_connection()
@@ -462,7 +597,7 @@ def capture_and_login():
         timeout = 25  # 25 seconds timeout for low-end hardware
 
         captured_template = None
-        while time.time() - start_time < timeout:
+        while time.time() - start_time < timeout and not cancel.cancelled:
             try:
                 capture = zkfp2.AcquireFingerprint()
                 if capture:
@@ -472,7 +607,15 @@ def capture_and_login():
 
             except Exception as e:
                 print(f"Capture attempt failed: {e}", file=sys.stderr)
-                time.sleep(0.1)
+                cancel.sleep(0.1)
+
+        if cancel.cancelled:
+            zkfp2.Terminate()
+            print(f"🛑 Capture cancelled: {cancel.reason}", file=sys.stderr)
+            return {
+                "success": False,
+                "error": f"Capture cancelled: {cancel.reason}"
+            }
 
         if not captured_template:
             zkfp2.Terminate()
@@ -481,15 +624,30 @@ def capture_and_login():
                 "error": "Fingerprint capture timeout - no finger detected within 25 seconds"
             }
 
-        # Look up employee by fingerprint using DB matching
         employees_collection = db.employees
-        enrolled_employees = list(employees_collection.find({
-            "fingerprintEnrolled": True,
-            "isActive": True,
-            "fingerprintTemplate": {"$exists": True, "$ne": ""}
-        }))
 
-        if not enrolled_employees:
+        if employee_id:
+            try:
+                employee, verify_error = verify_login_fingerprint(
+                    zkfp2, employees_collection, employee_id, captured_template)
+            except Exception as e:
+                print(f"❌ Login verify error: {e}", file=sys.stderr)
+                employee, verify_error = None, f"Biometric login failed: {str(e)}"
+            zkfp2.Terminate()
+            if verify_error:
+                return {
+                    "success": False,
+                    "error": verify_error
+                }
+            return login_response(employees_collection, employee)
+
+        # Look up employee by fingerprint using DB matching against this kiosk's partitions
+        replica = sync_local_replica(db)
+        load_started = time.perf_counter()
+        enrolled_templates = replica.load_gallery(active_only=True, partitions=KIOSK_PARTITIONS)
+
+        fallback_enabled = bool(KIOSK_PARTITIONS) and CROSS_SITE_FALLBACK
+        if not enrolled_templates and not fallback_enabled:
             zkfp2.Terminate()
             return {
                 "success": False,
@@ -507,19 +665,20 @@ def capture_and_login():
             employee_map = {}
             fid_counter = 1  # ✅ FIX: Start from 1, not 0!
             
-            for emp in enrolled_employees:
+            for entry in enrolled_templates:
                 try:
-                    stored_template = base64.b64decode(emp['fingerprintTemplate'])
                     fid = fid_counter
-                    zkfp2.DBAdd(fid, stored_template)
-                    employee_map[fid] = emp
-                    print(f"  Added {emp.get('employeeId')} (fid={fid})", file=sys.stderr)
+                    zkfp2.DBAdd(fid, entry['template'])
+                    employee_map[fid] = ObjectId(entry['employee_key'])
+                    print(f"  Added {entry['employeeId']} (fid={fid})", file=sys.stderr)
                     fid_counter += 1
                 except Exception as e:
-                    print(f"⚠️ Skipping {emp.get('employeeId')}: {e}", file=sys.stderr)
+                    print(f"⚠️ Skipping {entry['employeeId']}: {e}", file=sys.stderr)
                     continue
+            print(f"📊 Login gallery ({describe_partitions()}): {len(employee_map)} templates loaded in "
+                  f"{(time.perf_counter() - load_started) * 1000:.0f} ms", file=sys.stderr)
 
-            if not employee_map:
+            if not employee_map and not fallback_enabled:
                 zkfp2.DBFree()
                 zkfp2.Terminate()
                 return {
@@ -529,15 +688,24 @@ def capture_and_login():
 
             # Perform 1-to-N matching
             print(f"🔍 Login: Performing fingerprint matching...", file=sys.stderr)
-            match_result = zkfp2.DBIdentify(captured_template)
+            identify_started = time.perf_counter()
+            match_result = zkfp2.DBIdentify(captured_template) if employee_map else (0, 0)
             
             matched_fid = match_result[0]
             match_score = match_result[1]
 
-            print(f"Login match result: fid={matched_fid}, score={match_score}", file=sys.stderr)
+            print(f"Login match result: fid={matched_fid}, score={match_score} "
+                  f"({(time.perf_counter() - identify_started) * 1000:.0f} ms)", file=sys.stderr)
 
             # ✅ FIX: Check for fid=0 (no match)
-            if matched_fid == 0 or matched_fid not in employee_map:
+            matched_key = employee_map.get(matched_fid) if matched_fid else None
+            if matched_key is None:
+                fallback_entry, fallback_score = identify_other_partitions(
+                    zkfp2, replica, captured_template, active_only=True)
+                if fallback_entry:
+                    matched_key = ObjectId(fallback_entry['employee_key'])
+                    match_score = fallback_score
+            if matched_key is None:
                 zkfp2.DBFree()
                 zkfp2.Terminate()
                 return {
@@ -545,7 +713,18 @@ def capture_and_login():
                     "error": "Fingerprint not recognized - please enroll first or contact administrator"
                 }
             
-            employee = employee_map[matched_fid]
+            employee = employees_collection.find_one(
+                {"_id": matched_key},
+                {"fingerprintTemplate": 0, "fingerprintTemplates": 0}
+            )
+            if not employee:
+                # Matched a replica entry whose employee no longer exists
+                zkfp2.DBFree()
+                zkfp2.Terminate()
+                return {
+                    "success": False,
+                    "error": "Fingerprint not recognized - please enroll first or contact administrator"
+                }
             print(f"✅ Login matched: {employee.get('employeeId')} (score={match_score})", file=sys.stderr)
 
             # Clean up
@@ -570,28 +749,7 @@ def capture_and_login():
                 "error": "Fingerprint not recognized - please enroll first or contact administrator"
             }
 
-        # Update last login timestamp
-        employees_collection.update_one(
-            {"_id": employee["_id"]},
-            {"$set": {"lastLogin": datetime.utcnow()}}
-        )
-
-        return {
-            "success": True,
-            "message": "Biometric login successful",
-            "employee": {
-                "id": str(employee["_id"]),
-                "employeeId": employee["employeeId"],
-                "firstName": employee["firstName"],
-                "lastName": employee["lastName"],
-                "email": employee["email"],
-                "position": employee.get("position", ""),
-                "department": employee.get("department", ""),
-                "salary": employee.get("salary", 0),
-                "hireDate": employee.get("hireDate", "").isoformat() if employee.get("hireDate") else None,
-                "passwordChanged": employee.get("passwordChanged", False)
-            }
-        }
+        return login_response(employees_collection, employee)
 
     except Exception as e:
         return {
@@ -601,21 +759,25 @@ def capture_and_login():
 
 def main():
     """Main function with IPC support"""
+    # SIGTERM or the caller closing our stdin stops capture within one poll
+    cancel = cancel_on_termination(CancelToken())
+
     # Check command line arguments
     if len(sys.argv) > 1:
         if sys.argv[1] == "--health":
             result = check_device_health()
         elif sys.argv[1] == "--direct":
             # Direct database access mode (IPC) for attendance
-            result = capture_and_record_attendance()
+            result = capture_and_record_attendance(cancel)
         elif sys.argv[1] == "--login":
-            # Direct database access mode (IPC) for login
-            result = capture_and_login()
+            # Direct database access mode (IPC) for login; "--login <employeeId>" verifies 1:1
+            employee_id = sys.argv[2].strip() if len(sys.argv) > 2 else None
+            result = capture_and_login(cancel, employee_id or None)
         else:
             result = {"success": False, "error": "Invalid argument"}
     else:
         # Default mode - just capture fingerprint
-        result = capture_fingerprint()
+        result = capture_fingerprint(cancel)
 
     # Output JSON result to stdout
     print(json.dumps(result))
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Batch Duplicate Fingerprint Auditor
+Loads enrolled templates into SDK caches and runs DBIdentify once per template
+(N identifies instead of N^2 DBMatch calls), reporting every match between
+templates of different employees.
+
+The gallery is split into shards that are searched in parallel worker processes.
+Progress is checkpointed per shard so an interrupted sweep can be resumed. FIDs
+follow _id order and the checkpoint stores a digest of the ordered gallery; a
+checkpoint for a different gallery is refused (rerun with --fresh). Templates the
+SDK rejects are left out of their shard and listed as skipped in the report.
+
+Usage: python check_duplicate_fingerprints.py [--min-score N] [--workers N]
+           [--shards N] [--checkpoint FILE] [--fresh]
+"""
+
+import sys
+import os
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from fingerprint_templates import (
+    ENROLLED_EMPLOYEE_QUERY, TEMPLATE_PROJECTION,
+    iter_employee_templates, employee_display_name
+)
+
+DEFAULT_CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "duplicate_audit_checkpoint.json")
+
+# DBIdentify already applies the SDK threshold; raise this to only report stronger matches
+DEFAULT_MIN_SCORE = 0
+
+# Probe list shared by every shard search in a worker process
+_probes = None
+
+def log(message):
+    """Log to stderr so it doesn't interfere with JSON output"""
+    print(message, file=sys.stderr)
+
+def load_gallery(db):
+    """
+    Load every valid enrolled template, ordered by _id so FIDs and shards are stable
+    across runs
+    Returns (entries, employees): entries are (fid, employee_key, template_index, template)
+    with fid starting at 1 (0 means no match), employees maps employee_key -> info
+    """
+    entries = []
+    employees = {}
+    fid = 1
+    for employee in db.employees.find(ENROLLED_EMPLOYEE_QUERY, TEMPLATE_PROJECTION).sort('_id', 1):
+        employee_key = str(employee['_id'])
+        employees[employee_key] = {
+            "employeeId": employee.get('employeeId'),
+            "name": employee_display_name(employee)
+        }
+        for template_index, template in iter_employee_templates(employee):
+            entries.append((fid, employee_key, template_index, template))
+            fid += 1
+    return entries, employees
+
+def gallery_digest(entries):
+    """SHA-256 of the ordered (fid, employee, template index, template) list"""
+    digest = hashlib.sha256()
+    for fid, employee_key, template_index, template in entries:
+        digest.update(f"{fid}:{employee_key}:{template_index}:".encode())
+        digest.update(template)
+    return digest.hexdigest()
+
+def _init_worker(probes):
+    global _probes
+    _probes = probes
+
+def audit_shard(shard_index, shard, min_score):
+    """
+    Search every probe template against one gallery shard
+    The probe's own employee is removed from the cache first, and every match found is
+    removed too before identifying again, so all cross-employee matches are reported.
+    A template the SDK rejects is skipped (and reported) instead of failing the shard
+    Returns (shard_index, matches, identifies, skipped)
+    """
+    from pyzkfp import ZKFP2
+
+    zkfp2 = ZKFP2()
+    zkfp2.Init()
+    zkfp2.DBInit()
+    try:
+        templates = {}
+        fids_by_employee = {}
+        skipped = []
+
+        def skip(fid, employee_key, template_index, stage, error):
+            log(f"  ⚠️  Skipping FID {fid} ({stage}): {str(error)}")
+            skipped.append({"fid": fid, "employee": employee_key, "templateIndex": template_index,
+                            "stage": stage, "error": str(error)})
+
+        for fid, employee_key, template_index, template in shard:
+            try:
+                zkfp2.DBAdd(fid, template)
+            except Exception as e:
+                skip(fid, employee_key, template_index, "load", e)
+                continue
+            templates[fid] = (employee_key, template_index, template)
+            fids_by_employee.setdefault(employee_key, []).append(fid)
+
+        matches = []
+        identifies = 0
+        for probe_fid, probe_employee, probe_index, probe_template in _probes:
+            own_fids = fids_by_employee.get(probe_employee, [])
+            for fid in own_fids:
+                zkfp2.DBDel(fid)
+
+            removed = []
+            while True:
+                identifies += 1
+                try:
+                    fid, score = zkfp2.DBIdentify(probe_template)
+                except Exception as e:
+                    skip(probe_fid, probe_employee, probe_index, "identify", e)
+                    break
+                if fid <= 0 or fid not in templates or score < min_score:
+                    break
+                match_employee, match_index, _ = templates[fid]
+                matches.append({
+                    "probeFid": probe_fid,
+                    "probeEmployee": probe_employee,
+                    "probeTemplateIndex": probe_index,
+                    "matchFid": fid,
+                    "matchEmployee": match_employee,
+                    "matchTemplateIndex": match_index,
+                    "score": score
+                })
+                zkfp2.DBDel(fid)
+                removed.append(fid)
+
+            for fid in own_fids + removed:
+                try:
+                    zkfp2.DBAdd(fid, templates[fid][2])
+                except Exception as e:
+                    # Out of the cache now: leave it out of the rest of this shard
+                    employee_key, template_index, _ = templates.pop(fid)
+                    fids_by_employee[employee_key].remove(fid)
+                    skip(fid, employee_key, template_index, "reload", e)
+
+        return shard_index, matches, identifies, skipped
+    finally:
+        zkfp2.DBFree()
+        zkfp2.Terminate()
+
+def load_checkpoint(path, gallery_size, shard_count, digest):
+    """
+    Load a checkpoint for resuming; None if there is none
+    Raises ValueError if it belongs to a different gallery or sharding, since resuming
+    it would skip or mis-map shards
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if checkpoint.get('galleryDigest') != digest or checkpoint.get('gallerySize') != gallery_size \
+            or checkpoint.get('shards') != shard_count:
+        raise ValueError(f"Checkpoint {path} is for a different gallery or shard count - "
+                         f"rerun with --fresh to start over")
+    return checkpoint
+
+def save_checkpoint(path, checkpoint):
+    """Write the checkpoint atomically"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+def merge_matches(raw_matches, employees):
+    """Collapse matches found from both sides into one entry per template pair (best score)"""
+    pairs = {}
+    for match in raw_matches:
+        key = tuple(sorted((match['probeFid'], match['matchFid'])))
+        if key not in pairs or match['score'] > pairs[key]['score']:
+            pairs[key] = match
+
+    report = []
+    for match in sorted(pairs.values(), key=lambda m: -m['score']):
+        a = employees.get(match['probeEmployee'], {})
+        b = employees.get(match['matchEmployee'], {})
+        report.append({
+            "score": match['score'],
+            "employeeA": {"_id": match['probeEmployee'], "templateIndex": match['probeTemplateIndex'], **a},
+            "employeeB": {"_id": match['matchEmployee'], "templateIndex": match['matchTemplateIndex'], **b}
+        })
+    return report
+
+def run_audit(db, min_score=DEFAULT_MIN_SCORE, workers=None, shard_count=None,
+              checkpoint_path=DEFAULT_CHECKPOINT, fresh=False):
+    """Run the sweep and return the report"""
+    entries, employees = load_gallery(db)
+    log(f"📊 Loaded {len(entries)} templates from {len(employees)} enrolled employees")
+
+    workers = workers or os.cpu_count() or 1
+    shard_count = max(1, min(shard_count or workers, len(entries) or 1))
+    shards = [entries[i::shard_count] for i in range(shard_count)]
+
+    digest = gallery_digest(entries)
+    checkpoint = None if fresh else load_checkpoint(checkpoint_path, len(entries), shard_count, digest)
+    if checkpoint is None:
+        checkpoint = {
+            "galleryDigest": digest,
+            "gallerySize": len(entries),
+            "shards": shard_count,
+            "completedShards": [],
+            "matches": [],
+            "skipped": [],
+            "identifies": 0
+        }
+    else:
+        log(f"♻️  Resuming: {len(checkpoint['completedShards'])}/{shard_count} shards already done")
+
+    pending = [i for i in range(shard_count) if i not in checkpoint['completedShards']]
+    if pending:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)),
+                                 initializer=_init_worker, initargs=(entries,)) as executor:
+            futures = [executor.submit(audit_shard, i, shards[i], min_score) for i in pending]
+            for future in as_completed(futures):
+                shard_index, matches, identifies, skipped = future.result()
+                checkpoint['completedShards'].append(shard_index)
+                checkpoint['matches'].extend(matches)
+                checkpoint.setdefault('skipped', []).extend(skipped)
+                checkpoint['identifies'] += identifies
+                save_checkpoint(checkpoint_path, checkpoint)
+                log(f"✅ Shard {shard_index + 1}/{shard_count} done ({len(matches)} raw matches, "
+                    f"{len(skipped)} skipped)")
+
+    report = merge_matches(checkpoint['matches'], employees)
+    # A probe the SDK cannot identify with is skipped once per shard; report each FID once
+    skipped = {}
+    for entry in checkpoint.get('skipped', []):
+        skipped.setdefault(entry['fid'], {**entry, **employees.get(entry['employee'], {})})
+    return {
+        "templates": len(entries),
+        "employees": len(employees),
+        "shards": shard_count,
+        "identifies": checkpoint['identifies'],
+        "duplicates": report,
+        "skipped": [skipped[fid] for fid in sorted(skipped)]
+    }
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Audit enrolled fingerprints for cross-employee duplicates")
+    parser.add_argument('--min-score', type=int, default=DEFAULT_MIN_SCORE,
+                        help="Only report matches with at least this DBIdentify score")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--shards', type=int, default=None, help="Gallery shards (default: one per worker)")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help="Checkpoint file for resuming")
+    parser.add_argument('--fresh', action='store_true', help="Ignore any existing checkpoint")
+    args = parser.parse_args()
+
+    from integrated_capture import get_database_connection
+
+    db, client, connection_error = get_database_connection()
+    if connection_error:
+        print(json.dumps({"success": False, "message": connection_error}))
+        sys.exit(1)
+
+    try:
+        report = run_audit(db, args.min_score, args.workers, args.shards, args.checkpoint, args.fresh)
+        result = {
+            "success": True,
+            "message": f"Found {len(report['duplicates'])} cross-employee fingerprint matches "
+                       f"({len(report['skipped'])} templates skipped)",
+            **report
+        }
+    except Exception as e:
+        result = {"success": False, "message": f"Duplicate audit failed: {str(e)}"}
+    finally:
+        client.close()
+
+    print(json.dumps(result))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Fingerprint Device Arbiter
+One worker thread owns the open ZKFP2 handle and serves every request against it,
+so registration and attendance never call into the SDK at the same time.
+
+Scheduling:
+  - Requests are ordered by priority (attendance before enrollment), then FIFO
+  - A capture is served one AcquireFingerprint poll at a time and re-queued between
+    polls, so short calls (DBMatch, DBMerge, Light) from other requests interleave
+  - Only the highest-priority pending capture polls the sensor; an enrollment capture
+    pauses while an attendance scan is waiting for a finger
+  - Any request can be cancelled; a cancelled capture stops within one poll
+"""
+
+import sys
+import time
+import itertools
+import threading
+
+PRIORITY_ATTENDANCE = 0
+PRIORITY_ENROLLMENT = 10
+
+CAPTURE_POLL_INTERVAL = 0.1  # seconds between sensor polls of one capture
+
+# SDK errors after which polling again is pointless
+FATAL_DEVICE_ERRORS = ("Invalid Handle", "Device not connected")
+
+class DeviceUnavailable(Exception):
+    """No device is attached, or it was detached while the request was pending"""
+
+class DeviceRequest:
+    """Handle for a queued device request; result() blocks until it is served"""
+
+    def __init__(self, priority, operation=None, timeout=None):
+        self.priority = priority
+        self.operation = operation    # fn(zkfp2) for one-shot calls, None for captures
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.next_poll = 0.0
+        self.cancelled = False
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    @property
+    def is_capture(self):
+        return self.operation is None
+
+    def cancel(self):
+        """Withdraw the request; result() then returns None"""
+        self.cancelled = True
+
+    def result(self, timeout=None):
+        """Wait for the request and return its value (None on timeout or cancel); re-raises device errors"""
+        self.done.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def _finish(self, value=None, error=None):
+        self.value = value
+        self.error = error
+        self.done.set()
+
+class DeviceArbiter:
+    """Serializes all access to one ZKFP2 handle through a priority queue"""
+
+    def __init__(self, log=None):
+        self.log = log or (lambda message: print(message, file=sys.stderr))
+        self.zkfp2 = None
+        self.cond = threading.Condition()
+        self.queue = []  # (priority, sequence, request); short, so it is scanned in order
+        self.sequence = itertools.count()
+        self.busy = False
+        self.stopped = False
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    # --- handle ownership ---
+
+    def attach(self, zkfp2):
+        """Hand an opened device to the arbiter"""
+        with self.cond:
+            self.zkfp2 = zkfp2
+            self.cond.notify_all()
+
+    def detach(self):
+        """
+        Take the device back (e.g. before Terminate): fails everything pending with
+        DeviceUnavailable and waits for the request in progress to finish its current step
+        """
+        with self.cond:
+            zkfp2, self.zkfp2 = self.zkfp2, None
+            self._fail_pending(DeviceUnavailable("Device disconnected"))
+            while self.busy:
+                self.cond.wait()
+        return zkfp2
+
+    def stop(self):
+        """Detach and end the worker thread"""
+        zkfp2 = self.detach()
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        self.worker.join(timeout=1)
+        return zkfp2
+
+    # --- requests ---
+
+    def call(self, priority, operation):
+        """Queue operation(zkfp2) as one uninterrupted step"""
+        return self._submit(DeviceRequest(priority, operation))
+
+    def capture(self, priority, timeout):
+        """Queue a fingerprint capture; result() is (template, image) or None on timeout/cancel"""
+        return self._submit(DeviceRequest(priority, timeout=timeout))
+
+    def _submit(self, request):
+        with self.cond:
+            if self.zkfp2 is None:
+                request._finish(error=DeviceUnavailable("Device not connected"))
+                return request
+            self.queue.append((request.priority, next(self.sequence), request))
+            self.cond.notify_all()
+        return request
+
+    def _fail_pending(self, error):
+        for _, _, request in self.queue:
+            request._finish(error=error)
+        self.queue = []
+
+    # --- worker ---
+
+    def _next_request(self):
+        """Pick the next runnable request (called with the lock held); returns (request, wait_seconds)"""
+        now = time.monotonic()
+        sensor_priority = None
+        earliest = None
+        chosen = None
+        for entry in sorted(self.queue):
+            request = entry[2]
+            if request.cancelled:
+                self.queue.remove(entry)
+                request._finish()
+                continue
+            if request.is_capture:
+                if request.deadline is not None and now >= request.deadline:
+                    self.queue.remove(entry)
+                    request._finish()
+                    continue
+                # The sensor belongs to the highest-priority capture waiting for a finger
+                if sensor_priority is None:
+                    sensor_priority = request.priority
+                elif request.priority > sensor_priority:
+                    continue
+                if request.next_poll > now:
+                    earliest = request.next_poll if earliest is None else min(earliest, request.next_poll)
+                    continue
+            chosen = entry
+            break
+        if chosen is None:
+            return None, (earliest - now if earliest is not None else None)
+        self.queue.remove(chosen)
+        return chosen[2], 0
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while True:
+                    if self.stopped:
+                        return
+                    request, wait = (self._next_request() if self.zkfp2 is not None else (None, None))
+                    if request is not None:
+                        break
+                    self.cond.wait(wait)
+                zkfp2 = self.zkfp2
+                self.busy = True
+            requeue = False
+            try:
+                requeue = self._step(zkfp2, request)
+            finally:
+                with self.cond:
+                    self.busy = False
+                    if requeue:
+                        if self.zkfp2 is None:
+                            request._finish(error=DeviceUnavailable("Device disconnected"))
+                        else:
+                            # Back of its priority level, so equal-priority captures take turns
+                            self.queue.append((request.priority, next(self.sequence), request))
+                    self.cond.notify_all()
+
+    def _step(self, zkfp2, request):
+        """Serve one step; returns True if a capture should be polled again"""
+        if not request.is_capture:
+            try:
+                request._finish(request.operation(zkfp2))
+            except Exception as e:
+                request._finish(error=e)
+            return False
+
+        try:
+            capture = zkfp2.AcquireFingerprint()
+        except Exception as e:
+            message = str(e)
+            if any(fatal in message for fatal in FATAL_DEVICE_ERRORS):
+                request._finish(error=DeviceUnavailable(message))
+                return False
+            self.log(f"⚠️ Capture attempt failed: {message}")
+            capture = None
+
+        if capture and len(capture) >= 2:
+            request._finish(capture)
+            return False
+        request.next_poll = time.monotonic() + CAPTURE_POLL_INTERVAL
+        return True
@@ -0,0 +1,132 @@
+"""
+Edge Identification for the Attendance GUIs
+In edge mode the kiosk keeps the enrolled gallery in the scanner's SDK cache and
+identifies each scan itself with DBIdentify, so /api/attendance/record receives only
+{employeeId, fid, score, capturedAt} (~100 bytes instead of a ~4 KB template) and the
+backend no longer compares the scan against every stored template.
+
+The gallery comes from the shared snapshot when a publisher is running, otherwise
+from the local template replica synced from MongoDB. It is fetched on a background
+thread and installed into the SDK cache by the thread that owns the device, on its
+next scan. A scan with no edge match is uploaded as before, which also covers
+employees enrolled since the last refresh. A kiosk scoped to KIOSK_PARTITIONS
+caches only its own partitions; other sites' employees are matched by that upload.
+
+Enable with BIOMETRIC_EDGE_MODE=1; the backend only accepts edge matches signed
+with a registered kiosk key (KIOSK_ID / EDGE_KIOSK_SECRET, see backend_client.py).
+"""
+
+import os
+import sys
+import time
+import threading
+from datetime import datetime, timezone
+from integrated_capture import get_database_connection, load_gallery_into_device, GALLERY_REFRESH_INTERVAL
+from template_replica import get_replica, load_local_gallery
+from gallery_snapshot import read_shared_gallery
+from gallery_partition import KIOSK_PARTITIONS
+from hot_candidates import HotCandidates
+
+EDGE_MODE = os.environ.get("BIOMETRIC_EDGE_MODE", "0") == "1"
+
+def fetch_gallery():
+    """Current gallery: the shared snapshot, else the replica (synced first if MongoDB is reachable)"""
+    # The snapshot holds the whole company, so a site-scoped kiosk reads the replica
+    gallery = None if KIOSK_PARTITIONS else read_shared_gallery()
+    if gallery:
+        return gallery
+    db, client, connection_error = get_database_connection()
+    if connection_error:
+        print(f"⚠️  {connection_error} - using the last synced gallery", file=sys.stderr)
+        return get_replica().load_gallery(partitions=KIOSK_PARTITIONS)
+    try:
+        return load_local_gallery(db, partitions=KIOSK_PARTITIONS)
+    finally:
+        client.close()
+
+class EdgeIdentifier:
+    """Keeps the SDK cache loaded with the gallery and identifies scans against it"""
+
+    def __init__(self, log=None):
+        self.log = log or (lambda message: print(message, file=sys.stderr))
+        self.lock = threading.Lock()
+        self.gallery = None          # last fetched gallery, re-installed after a reconnect
+        self.pending = None          # fetched but not yet in the SDK cache
+        self.employee_map = {}       # fid -> employee info for what is in the SDK cache
+        self.hot = HotCandidates()   # tried 1:1 before DBIdentify; ranked by this kiosk's matches
+        self.fetched_at = 0.0
+        self.refreshing = False
+
+    def reset(self):
+        """The device was (re)opened and its cache is empty; reinstall on the next scan"""
+        with self.lock:
+            self.employee_map = {}
+            if self.pending is None:
+                self.pending = self.gallery
+        if self.gallery is None:
+            self.refresh_async()
+
+    def refresh_async(self):
+        """Fetch the gallery on a background thread; it is installed on the next scan"""
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        threading.Thread(target=self._refresh, daemon=True).start()
+
+    def _refresh(self):
+        try:
+            gallery = fetch_gallery()
+            with self.lock:
+                if gallery is self.gallery:
+                    return  # Same snapshot generation as the one installed
+                self.gallery = self.pending = gallery
+            self.log(f"🔄 Edge gallery fetched: {len(gallery)} templates")
+        except Exception as e:
+            self.log(f"⚠️ Edge gallery refresh failed: {str(e)}")
+        finally:
+            with self.lock:
+                self.refreshing = False
+                self.fetched_at = time.time()
+
+    def install(self, zkfp2, gallery):
+        """Replace the SDK cache with gallery (device thread)"""
+        try:
+            zkfp2.DBFree()
+        except Exception:
+            pass  # Nothing cached yet
+        zkfp2.DBInit()
+        employee_map = load_gallery_into_device(zkfp2, gallery)
+        self.hot.set_gallery(gallery, employee_map)
+        with self.lock:
+            self.employee_map = employee_map
+        employees = len({str(employee["_id"]) for employee in employee_map.values()})
+        self.log(f"✅ Edge gallery installed: {len(employee_map)} templates, {employees} employees")
+
+    def identify(self, zkfp2, template, captured_at=None):
+        """
+        Identify template against the SDK cache (device thread): hot candidates 1:1 first,
+        then DBIdentify; a freshly fetched gallery is installed before matching
+        Returns {employeeId, fid, score, capturedAt} or None
+        """
+        captured_at = captured_at or datetime.now(timezone.utc)
+        if time.time() - self.fetched_at >= GALLERY_REFRESH_INTERVAL:
+            self.refresh_async()
+        with self.lock:
+            gallery, self.pending = self.pending, None
+        if gallery is not None:
+            self.install(zkfp2, gallery)
+        if not self.employee_map:
+            return None
+
+        fid, score = self.hot.match(zkfp2, template) or zkfp2.DBIdentify(template)
+        employee = self.employee_map.get(fid) if fid > 0 and score > 0 else None
+        if not employee:
+            return None
+        self.hot.touch(employee["_id"])
+        return {
+            "employeeId": employee["employeeId"],
+            "fid": fid,
+            "score": score,
+            "capturedAt": captured_at.isoformat()
+        }
@@ -12,10 +12,37 @@ import threading
 import time
 import json
 import os
+import hashlib
 from pyzkfp import ZKFP2
+from toast_banner import ToastBanner
+from ui_event_bus import UIEventBus
+from cancellation import CancelToken
+from backend_client import BackendClient
+from capture_quality import assess_capture
+from scan_archive import archive_scan, close_scan_archive
 from PIL import Image, ImageTk
 import io
 from datetime import datetime, timedelta
+import pytz
+
+MANILA_TZ = pytz.timezone('Asia/Manila')
+
+# Time-in rules, mirrored from payroll-backend utils/attendanceCalculator.js
+# (validateTimeInRealTime) so the check runs locally instead of as a second request
+FULL_DAY_CUTOFF = (9, 30)   # On time up to 9:30 AM inclusive
+LATEST_TIME_IN = (17, 0)    # No time-in after 5:00 PM
+DEFAULT_DAILY_RATE = 550
+
+# Hashed the way getTimeInRules() hashes them; while the backend reports a different
+# hash its rules have changed, and time-ins are validated by the server instead
+TIME_IN_RULES = {
+    'fullDayCutoff': {'hour': FULL_DAY_CUTOFF[0], 'minute': FULL_DAY_CUTOFF[1]},
+    'latestTimeIn': {'hour': LATEST_TIME_IN[0], 'minute': LATEST_TIME_IN[1]},
+    'timezone': 'Asia/Manila'
+}
+TIME_IN_RULES_HASH = hashlib.sha256(json.dumps(TIME_IN_RULES, separators=(',', ':')).encode()).hexdigest()
+
+RULES_REFRESH_SECONDS = 300  # background refresh of the salary rate and rules snapshot
 
 class EnhancedAttendanceGUI:
     def __init__(self, root):
@@ -28,9 +55,27 @@ class EnhancedAttendanceGUI:
         self.is_capturing = False
         self.current_scan_thread = None
         self.backend_url = "http://localhost:5000"
+        # Templates go up as raw bytes on a kept-alive session (see backend_client.py)
+        self.backend = BackendClient(self.backend_url, log=self.log)
+
+        # Rules snapshot used for local time-in validation; refreshed in the background
+        self.daily_rate = None
+        self.rules_hash = None  # backend's time-in rules hash; None until fetched
+
+        # Cancelled on close: stops the rules refresh and any capture within one poll
+        self.cancel = CancelToken()
+
+        # Worker threads post widget updates here; the Tk thread applies them once per frame
+        self.ui = UIEventBus(self.root)
 
         self.setup_ui()
-        self.check_backend_connection()
+        self.ui.start()
+        # Scan results are shown in a self-expiring banner so nobody has to click OK
+        self.toast = ToastBanner(self.root)
+        # The window is usable right away; the backend status fills in when the check returns
+        threading.Thread(target=self.check_backend_connection, daemon=True).start()
+
+        threading.Thread(target=self.refresh_rules_snapshot, daemon=True).start()
 
     def setup_ui(self):
         """Setup the main UI components"""
@@ -115,28 +160,36 @@ class EnhancedAttendanceGUI:
         self.result_text.config(state=tk.DISABLED)
 
     def log(self, message):
-        """Log message to result text area"""
-        self.result_text.config(state=tk.NORMAL)
+        """Log message to result text area (safe from worker threads)"""
         timestamp = datetime.now().strftime('%H:%M:%S')
-        self.result_text.insert(tk.END, f"[{timestamp}] {message}\n")
+        # The widget is written by the Tk thread, one insert per frame
+        self.ui.append("log", self.write_log_lines, f"[{timestamp}] {message}")
+        print(f"[{timestamp}] {message}")
+
+    def write_log_lines(self, lines):
+        """Append a frame's worth of log lines to the result text area"""
+        self.result_text.config(state=tk.NORMAL)
+        self.result_text.insert(tk.END, "\n".join(lines) + "\n")
         self.result_text.see(tk.END)
         self.result_text.config(state=tk.DISABLED)
-        print(f"[{timestamp}] {message}")
 
     def check_backend_connection(self):
-        """Check if backend is accessible"""
+        """Check if backend is accessible (safe from worker threads)"""
         try:
             response = requests.get(f"{self.backend_url}/api/employees", timeout=3)
             if response.status_code == 200:
-                self.backend_status_label.config(text="Connected ✓", foreground="green")
+                self.set_backend_status("Connected ✓", "green")
                 self.log("✅ Backend connection successful")
             else:
-                self.backend_status_label.config(text="Error", foreground="red")
+                self.set_backend_status("Error", "red")
                 self.log("⚠️ Backend returned non-200 status")
         except Exception as e:
-            self.backend_status_label.config(text="Disconnected ✗", foreground="red")
+            self.set_backend_status("Disconnected ✗", "red")
             self.log(f"❌ Backend connection failed: {str(e)}")
 
+    def set_backend_status(self, text, color):
+        self.ui.post(lambda: self.backend_status_label.config(text=text, foreground=color), key="backend_status")
+
     def connect_device(self):
         """Connect to fingerprint device"""
         try:
@@ -156,7 +209,7 @@ class EnhancedAttendanceGUI:
                 self.btn_disconnect.config(state=tk.NORMAL)
                 self.btn_scan.config(state=tk.NORMAL)
                 
-                messagebox.showinfo("Success", "Device connected successfully!\n\nReady to scan fingerprints.")
+                self.toast.success("Device connected - ready to scan fingerprints")
             else:
                 raise Exception("No fingerprint devices found")
 
@@ -198,43 +251,57 @@ class EnhancedAttendanceGUI:
     def perform_attendance_scan(self):
         """Perform the actual fingerprint scan with Phase 2 validation"""
         try:
-            self.root.after(0, lambda: self.progress_var.set(10))
-            self.root.after(0, lambda: self.scan_status_label.config(text="Capturing fingerprint..."))
+            self.set_scan_progress(10, "Capturing fingerprint...")
 
             # Capture fingerprint
             capture = self.capture_fingerprint()
             if not capture:
-                self.root.after(0, self.scan_failed, "Fingerprint capture failed or timeout")
+                self.ui.post(self.scan_failed, "Fingerprint capture failed or timeout")
                 return
 
             template, img = capture
-            template_hex = bytes(template).hex()
 
-            self.root.after(0, lambda: self.progress_var.set(40))
-            self.root.after(0, lambda: self.scan_status_label.config(text="Matching fingerprint..."))
+            # Poor captures get a "press again" before any matching or upload
+            quality = assess_capture(img, self.zkfp2)
+            if not quality["ok"]:
+                self.log(f"👆 Capture rejected in {quality['ms']:.1f} ms: {quality['reason']}")
+                self.ui.post(self.scan_failed, f"Press again - {quality['reason']}")
+                return
+
+            self.set_scan_progress(40, "Matching fingerprint...")
 
-            # Send to backend for matching and recording
-            success, result = self.record_attendance_with_validation(template_hex)
+            # Send to backend for matching and recording (raw bytes, matched as hex server-side)
+            success, result = self.record_attendance_with_validation(template)
+            archive_scan(template, img, {
+                "source": "enhanced_attendance_gui",
+                "employeeId": result.get('employee', {}).get('employeeId') if success else None,
+                "success": success,
+                "message": result.get('message') if success else result
+            }, self.zkfp2)
 
             if success:
-                self.root.after(0, lambda: self.progress_var.set(100))
-                self.root.after(0, lambda: self.scan_status_label.config(text="Success!"))
-                self.root.after(0, self.scan_success, result)
+                self.set_scan_progress(100, "Success!")
+                self.ui.post(self.scan_success, result)
             else:
-                self.root.after(0, self.scan_failed, result)
+                self.ui.post(self.scan_failed, result)
 
         except Exception as e:
-            self.root.after(0, self.scan_failed, f"Scan error: {str(e)}")
+            self.ui.post(self.scan_failed, f"Scan error: {str(e)}")
 
         finally:
             self.is_capturing = False
-            self.root.after(0, lambda: self.btn_scan.config(state=tk.NORMAL))
+            self.ui.post(lambda: self.btn_scan.config(state=tk.NORMAL), key="scan_button")
+
+    def set_scan_progress(self, value, text):
+        """Queue a coalesced progress bar / status label update (safe from worker threads)"""
+        self.ui.post(self.progress_var.set, value, key="scan_progress")
+        self.ui.post(lambda: self.scan_status_label.config(text=text), key="scan_status")
 
     def capture_fingerprint(self, timeout=20):
         """Capture fingerprint from device"""
         start_time = time.time()
 
-        while time.time() - start_time < timeout:
+        while time.time() - start_time < timeout and not self.cancel.cancelled:
             try:
                 if self.zkfp2:
                     capture = self.zkfp2.AcquireFingerprint()
@@ -243,7 +310,7 @@ class EnhancedAttendanceGUI:
             except Exception as e:
                 self.log(f"Capture attempt failed: {str(e)}")
 
-            time.sleep(0.1)
+            self.cancel.sleep(0.1)
 
         return None
 
@@ -251,12 +318,8 @@ class EnhancedAttendanceGUI:
         """Send fingerprint to backend with Phase 2 validation"""
         try:
             # Step 1: Match fingerprint and record attendance
-            payload = {"fingerprint_template": fingerprint_template}
-            headers = {'Content-Type': 'application/json'}
-            
             self.log(f"📤 Matching fingerprint...")
-            response = requests.post(f"{self.backend_url}/api/attendance/record",
-                                   json=payload, headers=headers, timeout=10)
+            response = self.backend.record_attendance(fingerprint_template, timeout=10)
 
             if response.status_code != 200:
                 error_data = response.json() if response.headers.get('content-type') == 'application/json' else {}
@@ -264,33 +327,17 @@ class EnhancedAttendanceGUI:
                 return False, error_msg
 
             result = response.json()
-            employee = result.get('employee', {})
             attendance = result.get('attendance', {})
             
-            employee_id = employee.get('employeeId')
-            
-            # Step 2: Real-time validation for time-in
+            # Step 2: Real-time validation for time-in, computed locally from the
+            # rules snapshot (no second round trip) while it matches the backend's
             if attendance and not attendance.get('timeOut'):
-                # This is a time-in scan, validate it
-                now = datetime.now()
-                time_in = now.strftime('%H:%M:%S')
-                date = now.strftime('%Y-%m-%d')
-                
-                self.log(f"⏰ Validating time-in at {time_in}...")
-                
-                validation_response = requests.post(
-                    f"{self.backend_url}/api/attendance/validate-timein",
-                    json={
-                        'timeIn': time_in,
-                        'date': date,
-                        'employeeId': employee_id
-                    },
-                    timeout=5
-                )
-                
-                if validation_response.status_code == 200:
-                    validation_data = validation_response.json()
-                    validation = validation_data.get('validation', {})
+                now = datetime.now(MANILA_TZ)
+                if self.rules_hash == TIME_IN_RULES_HASH:
+                    validation = self.validate_time_in(now)
+                else:
+                    validation = self.validate_time_in_on_server(now, result.get('employee', {}).get('employeeId'))
+                if validation:
                     result['validation'] = validation  # Add validation to result
                     self.log(f"✅ Validation: {validation.get('status')}")
 
@@ -301,6 +348,82 @@ class EnhancedAttendanceGUI:
         except Exception as e:
             return False, f"Error: {str(e)}"
 
+    def refresh_rules_snapshot(self):
+        """Background loop: keep the current salary rate and the backend's time-in rules hash"""
+        while not self.cancel.cancelled:
+            try:
+                response = requests.get(f"{self.backend_url}/api/salary-rate/current", timeout=5)
+                if response.status_code == 200:
+                    self.daily_rate = response.json().get('rate', {}).get('dailyRate') or DEFAULT_DAILY_RATE
+                response = requests.get(f"{self.backend_url}/api/attendance/timein-rules", timeout=5)
+                # An older backend without the endpoint keeps the server validation
+                self.rules_hash = response.json().get('hash') if response.status_code == 200 else None
+                if self.rules_hash != TIME_IN_RULES_HASH:
+                    print("⚠️ Backend time-in rules differ from this kiosk's; validating on the server")
+            except Exception as e:
+                print(f"⚠️ Rules snapshot refresh failed (keeping last): {str(e)}")
+            self.cancel.sleep(RULES_REFRESH_SECONDS)
+
+    def validate_time_in_on_server(self, now, employee_id):
+        """Time-in validation from /api/attendance/validate-timein; None if it fails"""
+        time_in = now.strftime('%H:%M:%S')
+        self.log(f"⏰ Validating time-in at {time_in}...")
+        try:
+            response = requests.post(
+                f"{self.backend_url}/api/attendance/validate-timein",
+                json={'timeIn': time_in, 'date': now.strftime('%Y-%m-%d'), 'employeeId': employee_id},
+                timeout=5
+            )
+            if response.status_code == 200:
+                return response.json().get('validation', {})
+        except requests.exceptions.RequestException as e:
+            self.log(f"⚠️ Time-in validation failed: {str(e)}")
+        return None
+
+    def validate_time_in(self, now):
+        """
+        Time-in validation with the same result shape as /api/attendance/validate-timein
+        now: timezone-aware Manila datetime of the scan
+        """
+        time_in = now.strftime('%H:%M:%S')
+        date = now.strftime('%Y-%m-%d')
+        minutes = now.hour * 60 + now.minute
+        daily_rate = self.daily_rate or DEFAULT_DAILY_RATE
+        employee_info = {
+            'dailyRate': daily_rate,
+            'expectedFullDayPay': daily_rate,
+            'expectedHalfDayPay': daily_rate / 2
+        }
+
+        if minutes > LATEST_TIME_IN[0] * 60 + LATEST_TIME_IN[1] or \
+                (minutes == LATEST_TIME_IN[0] * 60 + LATEST_TIME_IN[1] and now.second > 0):
+            validation = {
+                'isValid': False,
+                'status': 'Error',
+                'message': '❌ Time-in not allowed after 5:00 PM. Please contact your supervisor.',
+                'dayType': 'Invalid',
+                'expectedPay': 'No pay'
+            }
+        elif minutes < FULL_DAY_CUTOFF[0] * 60 + FULL_DAY_CUTOFF[1] or \
+                (minutes == FULL_DAY_CUTOFF[0] * 60 + FULL_DAY_CUTOFF[1] and now.second == 0):
+            validation = {
+                'isValid': True,
+                'status': 'On Time',
+                'message': 'Good morning! Time-in recorded successfully.',
+                'dayType': 'Full Day',
+                'expectedPay': 'Full day salary'
+            }
+        else:
+            validation = {
+                'isValid': True,
+                'status': 'Half Day',
+                'message': 'Warning: You arrived after 9:30 AM. This will be recorded as HALF DAY. You must work at least 4 hours to receive half-day pay.',
+                'dayType': 'Half Day (Conditional)',
+                'expectedPay': 'Half day salary (if 4+ hours worked)'
+            }
+
+        return {**validation, 'timeIn': time_in, 'date': date, 'employeeInfo': employee_info}
+
     def scan_success(self, result):
         """Handle successful scan with Phase 2 validation display"""
         try:
@@ -331,8 +454,7 @@ class EnhancedAttendanceGUI:
 ═══════════════════════════════════════════════════
 """
                 self.log(f"✅ TIME-OUT: {employee_name} at {time_recorded}")
-                messagebox.showinfo("✅ Time-Out Recorded", 
-                    f"Time-Out recorded successfully!\n\n{employee_name}\n{time_recorded}")
+                self.toast.success(f"✅ Time-Out recorded\n{employee_name} - {time_recorded}")
             
             elif validation:
                 # TIME-IN DISPLAY WITH VALIDATION
@@ -367,8 +489,7 @@ class EnhancedAttendanceGUI:
 ═══════════════════════════════════════════════════
 """
                     self.log(f"✅ TIME-IN (ON TIME): {employee_name} at {time_recorded}")
-                    messagebox.showinfo("✅ On Time!", 
-                        f"Good morning!\n\n{employee_name}\nTime-In: {time_recorded}\n\nFull Day Credited: ₱{expected_pay}")
+                    self.toast.success(f"✅ On Time! {employee_name}\nTime-In: {time_recorded} - Full Day Credited: ₱{expected_pay}")
                 
                 else:  # Half Day
                     # YELLOW - WARNING
@@ -399,8 +520,8 @@ Work minimum 4 hours to qualify for half-day pay.
 ═══════════════════════════════════════════════════
 """
                     self.log(f"⚠️ TIME-IN (HALF DAY): {employee_name} at {time_recorded}")
-                    messagebox.showwarning("⚠️ Half Day Warning", 
-                        f"Late Arrival!\n\n{employee_name}\nTime-In: {time_recorded}\n\n{message_text}\n\nExpected: ₱{expected_pay}")
+                    self.toast.warning(f"⚠️ Late Arrival: {employee_name}\nTime-In: {time_recorded} - Expected: ₱{expected_pay}",
+                                       duration_ms=6000)
             
             else:
                 # BASIC DISPLAY (fallback if validation not available)
@@ -416,6 +537,7 @@ Work minimum 4 hours to qualify for half-day pay.
 ═══════════════════════════════════════════════════
 """
                 self.log(f"✅ ATTENDANCE: {employee_name} at {time_recorded}")
+                self.toast.success(f"✅ Attendance recorded\n{employee_name} - {time_recorded}")
 
             # Display in text area
             self.result_text.config(state=tk.NORMAL)
@@ -426,6 +548,20 @@ Work minimum 4 hours to qualify for half-day pay.
         except Exception as e:
             self.log(f"Error displaying result: {str(e)}")
 
+    def on_closing(self):
+        """Stop the capture and refresh threads, then release the device"""
+        self.ui.stop()
+        self.cancel.cancel("Window closed")
+        if self.current_scan_thread is not None:
+            self.current_scan_thread.join(timeout=1)
+        try:
+            if self.zkfp2:
+                self.zkfp2.Terminate()
+        except:
+            pass
+        close_scan_archive(timeout=2)  # Flush queued scans to disk
+        self.root.destroy()
+
     def scan_failed(self, error_message):
         """Handle failed scan"""
         self.progress_var.set(0)
@@ -437,12 +573,13 @@ Work minimum 4 hours to qualify for half-day pay.
         self.result_text.config(state=tk.DISABLED)
         
         self.log(f"❌ Scan failed: {error_message}")
-        messagebox.showerror("Scan Failed", f"Attendance scan failed:\n\n{error_message}")
+        self.toast.error(f"❌ Scan failed: {error_message}\nPlease try again.", duration_ms=5000)
 
 
 def main():
     root = tk.Tk()
     app = EnhancedAttendanceGUI(root)
+    root.protocol("WM_DELETE_WINDOW", app.on_closing)
     root.mainloop()
 
 
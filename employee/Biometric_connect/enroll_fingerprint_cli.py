@@ -10,16 +10,19 @@ from pyzkfp import ZKFP2
 from pymongo import MongoClient
 import os
 from datetime import datetime
+from cancellation import CancelToken, cancel_on_termination
 
 def log(message):
     """Log to stderr so it doesn't interfere with JSON output"""
     print(message, file=sys.stderr)
 
-def enroll_fingerprint(employee_data):
+def enroll_fingerprint(employee_data, cancel=None):
     """
     Enroll fingerprint for employee
+    Capture stops within one poll once cancel is cancelled
     Returns: dict with success status and template data
     """
+    cancel = cancel or CancelToken()
     try:
         # Extract employee info
         employee_id = employee_data.get('_id') or employee_data.get('employeeId')
@@ -62,7 +65,7 @@ def enroll_fingerprint(employee_data):
             # Import time module at the top of the loop
             import time
             
-            while capture_attempts < max_attempts:
+            while capture_attempts < max_attempts and not cancel.cancelled:
                 capture_attempts += 1
                 
                 try:
@@ -72,7 +75,7 @@ def enroll_fingerprint(employee_data):
                     if result is None:
                         # Device returned None - continue waiting
                         # ✅ CRITICAL FIX: Add delay to prevent tight CPU polling
-                        time.sleep(0.1)  # 100ms delay between attempts
+                        cancel.sleep(0.1)  # 100ms delay between attempts
                         continue
                     
                     tmp, img = result
@@ -82,21 +85,31 @@ def enroll_fingerprint(employee_data):
                         log(f"✅ Scan {i+1}/3 captured successfully!")
                         if i < 2:  # Don't wait after last scan
                             log("   Remove your finger and wait 2 seconds...")
-                            time.sleep(2)
+                            cancel.sleep(2)
                         break
                     else:
                         # No valid template - add small delay before retry
-                        time.sleep(0.1)
+                        cancel.sleep(0.1)
                     
                 except (TypeError, ValueError) as e:
                     # Handle unpacking errors gracefully
                     log(f"⚠️  Capture attempt {capture_attempts}: {str(e)}")
-                    time.sleep(0.1)  # Add delay before retry
+                    cancel.sleep(0.1)  # Add delay before retry
                     continue
                 except Exception as e:
                     log(f"❌ Unexpected error during capture: {str(e)}")
                     raise
             
+            if cancel.cancelled:
+                zkfp2.CloseDevice()
+                zkfp2.Terminate()
+                log(f"🛑 Enrollment cancelled: {cancel.reason}")
+                return {
+                    "success": False,
+                    "error": f"Enrollment cancelled: {cancel.reason}",
+                    "message": "Fingerprint enrollment cancelled"
+                }
+            
             # Check if we got the fingerprint
             if len(templates) != i + 1:
                 return {
@@ -140,7 +153,6 @@ def enroll_fingerprint(employee_data):
                         break
                     except Exception as conn_err:
                         if attempt < max_retries - 1:
-                            import time
                             time.sleep(retry_delay)
                             retry_delay *= 2
                             continue
@@ -224,8 +236,8 @@ def main():
         employee_data_json = sys.argv[2]
         employee_data = json.loads(employee_data_json)
         
-        # Perform enrollment
-        result = enroll_fingerprint(employee_data)
+        # Perform enrollment; SIGTERM or the bridge closing our stdin cancels it
+        result = enroll_fingerprint(employee_data, cancel_on_termination(CancelToken()))
         
         # Print JSON result to stdout
         print(json.dumps(result))
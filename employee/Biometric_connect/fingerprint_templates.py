@@ -0,0 +1,67 @@
+"""
+Enrolled Fingerprint Template Helpers
+Shared decoding of the templates stored on employee documents:
+  - fingerprintTemplates: [{"template": <base64>}, ...]  (multi-template format)
+  - fingerprintTemplate: <base64 or hex>                 (legacy single template)
+"""
+
+import base64
+import binascii
+
+# ZKTeco templates are 2048 bytes
+TEMPLATE_SIZE = 2048
+
+# Employees that have at least one stored template
+ENROLLED_EMPLOYEE_QUERY = {
+    "fingerprintEnrolled": True,
+    "$or": [
+        {"fingerprintTemplates": {"$exists": True, "$ne": []}},
+        {"fingerprintTemplate": {"$exists": True, "$ne": None}}
+    ]
+}
+
+# Only the fields needed to load a gallery
+TEMPLATE_PROJECTION = {
+    "employeeId": 1,
+    "firstName": 1,
+    "lastName": 1,
+    "fingerprintTemplate": 1,
+    "fingerprintTemplates": 1
+}
+
+def decode_template(value):
+    """
+    Decode a stored template (base64, or hex as written by enroll_fingerprint_cli.py)
+    Returns bytes, or None if the value is empty, undecodable or not TEMPLATE_SIZE bytes
+    """
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        if len(value) == TEMPLATE_SIZE * 2:
+            template = bytes.fromhex(value)
+        else:
+            template = base64.b64decode(value)
+    except (ValueError, binascii.Error):
+        return None
+    if len(template) != TEMPLATE_SIZE:
+        return None
+    return template
+
+def iter_employee_templates(employee):
+    """
+    Yield (template_index, template_bytes) for every valid template of an employee
+    The multi-template array takes precedence over the legacy single template
+    """
+    if employee.get('fingerprintTemplates'):
+        for index, fp_data in enumerate(employee['fingerprintTemplates']):
+            template = decode_template((fp_data or {}).get('template'))
+            if template is not None:
+                yield index, template
+    elif employee.get('fingerprintTemplate'):
+        template = decode_template(employee['fingerprintTemplate'])
+        if template is not None:
+            yield 0, template
+
+def employee_display_name(employee):
+    """First and last name for logs"""
+    return f"{employee.get('firstName', '')} {employee.get('lastName', '')}".strip() or 'Unknown'
@@ -0,0 +1,62 @@
+"""
+Site-Scoped Gallery Partitions
+In a multi-branch deployment every kiosk used to load every enrolled employee, so
+gallery size, load time and identify time grew with the whole company. Each
+employee's partition value (their department by default) is kept in the local
+replica, and a kiosk assigned to one or more partitions loads only those; the
+rest of the company is searched on a local miss only, a chunk at a time.
+
+  KIOSK_SITE               site recorded as the attendance location (default "Main Office")
+  GALLERY_PARTITION_FIELD  employee field the gallery is partitioned on (default
+                           "department"; changing it forces a full replica sync)
+  KIOSK_PARTITIONS         comma-separated partition values this kiosk loads;
+                           empty (default) loads the whole company
+  CROSS_SITE_FALLBACK      1 (default) to search the other partitions on a local
+                           miss, 0 to reject anyone outside the kiosk's partitions
+
+Employees without a partition value are never local to any kiosk and are only
+found through the fallback.
+"""
+
+import os
+import sys
+import time
+from tiered_gallery import COLD_CHUNK_SIZE, search_chunks
+
+KIOSK_SITE = os.environ.get("KIOSK_SITE", "Main Office")
+PARTITION_FIELD = os.environ.get("GALLERY_PARTITION_FIELD", "department")
+KIOSK_PARTITIONS = tuple(value.strip() for value in os.environ.get("KIOSK_PARTITIONS", "").split(",") if value.strip())
+CROSS_SITE_FALLBACK = os.environ.get("CROSS_SITE_FALLBACK", "1") == "1"
+
+def partition_value(employee):
+    """Partition an employee document belongs to, or None"""
+    value = employee.get(PARTITION_FIELD)
+    if value is None:
+        return None
+    return str(value).strip() or None
+
+def describe_partitions(partitions=KIOSK_PARTITIONS):
+    return ", ".join(partitions) if partitions else "all partitions"
+
+def identify_other_partitions(zkfp2, replica, template, partitions=KIOSK_PARTITIONS,
+                              active_only=False, chunk_size=COLD_CHUNK_SIZE):
+    """
+    Cross-site fallback after a miss in the local partitions: search every other
+    employee in chunks. The local gallery is freed first so each DBIdentify scans only
+    its chunk; the SDK cache is left empty (for one-shot callers that exit after).
+    Returns (gallery entry, score) or (None, score); (None, 0) without searching when
+    the fallback is off
+    """
+    if not partitions or not CROSS_SITE_FALLBACK:
+        return None, 0
+    started = time.perf_counter()
+    try:
+        zkfp2.DBFree()
+    except Exception:
+        pass  # Nothing cached
+    zkfp2.DBInit()
+    chunks = replica.iter_gallery_chunks(chunk_size, exclude_partitions=partitions, active_only=active_only)
+    found, score, searched, chunk_count = search_chunks(zkfp2, chunks, template)
+    print(f"🌐 Cross-site fallback: {chunk_count} chunks, {searched} templates in "
+          f"{(time.perf_counter() - started) * 1000:.0f} ms ({'match' if found else 'no match'})", file=sys.stderr)
+    return found, score
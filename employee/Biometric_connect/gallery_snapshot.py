@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Shared-Memory Gallery Snapshot
+One publisher process keeps the enrolled gallery in multiprocessing.shared_memory;
+every capture/identify process on the host attaches to it instead of decoding and
+holding its own copy of every template and employee record.
+
+Layout:
+  control segment "<name>": seqlock-protected (generation, data segment name)
+  data segment "<name>_g<generation>": header, fixed-width employee records,
+                                       then the 2048-byte templates back to back
+A new generation is written to a fresh data segment and then announced in the
+control segment, so readers never see a half-written gallery; they notice the
+new generation with one small read of the control segment they stay attached to,
+and re-attach. A publisher that exits withdraws the snapshot (empty data segment
+name), which is what sends readers looking for a restarted publisher.
+
+Each process keeps one long-lived reader (get_snapshot_reader). The gallery it
+hands out points into the shared segment - templates are memoryviews, not
+decoded copies - and stays the same list object until a new generation is
+published, so matchers reload their SDK cache only on a new generation. The SDK
+is still handed bytes: each template is copied out for the DBAdd / DBMatch call
+itself and released again.
+
+Run the publisher (keeps the snapshot fresh from the local template replica):
+    python gallery_snapshot.py [--name NAME] [--interval SECONDS]
+"""
+
+import sys
+import json
+import time
+import struct
+import argparse
+import threading
+from multiprocessing import shared_memory
+from fingerprint_templates import TEMPLATE_SIZE
+
+DEFAULT_SNAPSHOT_NAME = "payroll_fp_gallery"
+DEFAULT_REFRESH_INTERVAL = 30  # seconds
+
+# Control segment: seq (odd while being written), generation, data segment name
+CONTROL_FORMAT = '<QQ64s'
+CONTROL_SIZE = struct.calcsize(CONTROL_FORMAT)
+
+# Data segment header: magic, layout version, generation, entry count
+HEADER_FORMAT = '<4sIQI'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+SNAPSHOT_MAGIC = b'FPGS'
+SNAPSHOT_VERSION = 1
+
+# Fixed-width employee record per template: employee _id, employeeId, first, last, template index
+RECORD_FORMAT = '<24s32s48s48sI'
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+def log(message):
+    """Log to stderr so it doesn't interfere with JSON output"""
+    print(message, file=sys.stderr)
+
+def _attach(name):
+    """Attach to an existing segment without letting this process's resource tracker unlink it on exit"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Older versions register every attach with the tracker (POSIX only); skip that for readers
+    from multiprocessing import resource_tracker
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+def _encode(value, size):
+    """UTF-8 encode and truncate to size bytes without splitting a character"""
+    data = (value or '').encode('utf-8')[:size]
+    return data.decode('utf-8', 'ignore').encode('utf-8')
+
+def _decode(value):
+    return value.rstrip(b'\0').decode('utf-8', 'ignore')
+
+class GallerySnapshotPublisher:
+    """Writes gallery generations; the publisher must outlive its readers' need for the segments"""
+
+    def __init__(self, name=DEFAULT_SNAPSHOT_NAME):
+        self.name = name
+        self.generation = 0
+        self.current = None
+        try:
+            self.control = shared_memory.SharedMemory(name=name, create=True, size=CONTROL_SIZE)
+        except FileExistsError:
+            # Left behind by a previous publisher: take it over and continue its generations.
+            # Its last data segment becomes ours, so the first publish() unlinks it
+            self.control = _attach(name)
+            _, self.generation, data_name = struct.unpack_from(CONTROL_FORMAT, self.control.buf, 0)
+            data_name = _decode(data_name)
+            if data_name:
+                try:
+                    self.current = _attach(data_name)
+                except FileNotFoundError:
+                    pass
+
+    def publish(self, entries):
+        """
+        Publish a new generation
+        entries: dicts with employee_key, employeeId, firstName, lastName, templateIndex, template
+        Returns the new generation number
+        """
+        entries = [entry for entry in entries if len(entry['template']) == TEMPLATE_SIZE]
+        generation = self.generation + 1
+        data_name = f"{self.name}_g{generation}"
+        records_size = RECORD_SIZE * len(entries)
+        size = HEADER_SIZE + records_size + TEMPLATE_SIZE * len(entries)
+
+        try:
+            data = shared_memory.SharedMemory(name=data_name, create=True, size=max(size, 1))
+        except FileExistsError:
+            # Written but never announced by a publisher that died; replace it
+            stale = _attach(data_name)
+            stale.close()
+            self._unlink(stale)
+            data = shared_memory.SharedMemory(name=data_name, create=True, size=max(size, 1))
+        buf = data.buf
+        struct.pack_into(HEADER_FORMAT, buf, 0, SNAPSHOT_MAGIC, SNAPSHOT_VERSION, generation, len(entries))
+        templates_offset = HEADER_SIZE + records_size
+        for i, entry in enumerate(entries):
+            struct.pack_into(
+                RECORD_FORMAT, buf, HEADER_SIZE + i * RECORD_SIZE,
+                _encode(entry['employee_key'], 24), _encode(entry['employeeId'], 32),
+                _encode(entry.get('firstName'), 48), _encode(entry.get('lastName'), 48),
+                entry.get('templateIndex', 0)
+            )
+            offset = templates_offset + i * TEMPLATE_SIZE
+            buf[offset:offset + TEMPLATE_SIZE] = entry['template']
+        del buf
+
+        self._announce(generation, data_name)
+
+        # Readers still attached to the previous generation keep their mapping
+        previous = self.current
+        self.current = data
+        self.generation = generation
+        if previous is not None:
+            previous.close()
+            self._unlink(previous)
+        return generation
+
+    def _announce(self, generation, data_name):
+        """Write (generation, data segment name): seq odd while writing, even again once consistent"""
+        seq = struct.unpack_from('<Q', self.control.buf, 0)[0]
+        seq += seq % 2  # A publisher that died mid-announce left it odd
+        struct.pack_into('<Q', self.control.buf, 0, seq + 1)
+        struct.pack_into('<Q64s', self.control.buf, 8, generation, data_name.encode('ascii'))
+        struct.pack_into('<Q', self.control.buf, 0, seq + 2)
+
+    @staticmethod
+    def _unlink(shm):
+        try:
+            shm.unlink()
+        except (FileNotFoundError, OSError):
+            pass  # Windows frees segments when the last handle closes
+
+    def close(self):
+        """Withdraw the snapshot"""
+        # Readers keep the control segment mapped; tell them to look for a new publisher
+        self._announce(self.generation, '')
+        if self.current is not None:
+            self.current.close()
+            self._unlink(self.current)
+            self.current = None
+        self.control.close()
+        self._unlink(self.control)
+
+class GallerySnapshotReader:
+    """Zero-copy view of the published gallery; call refresh() to pick up new generations"""
+
+    def __init__(self, name=DEFAULT_SNAPSHOT_NAME):
+        self.name = name
+        self.lock = threading.RLock()
+        self.control = _attach(name)
+        self.data = None
+        self.retired = []    # superseded data segments whose templates are still in use
+        self.generation = 0
+        self.count = 0
+        self._gallery = None
+        self._records_offset = HEADER_SIZE
+        self._templates_offset = HEADER_SIZE
+        self.refresh()
+
+    def published_generation(self):
+        """Read (generation, data segment name) consistently from the control segment"""
+        while True:
+            seq = struct.unpack_from('<Q', self.control.buf, 0)[0]
+            if seq % 2:
+                time.sleep(0)
+                continue
+            generation, data_name = struct.unpack_from('<Q64s', self.control.buf, 8)
+            if struct.unpack_from('<Q', self.control.buf, 0)[0] == seq:
+                return generation, _decode(data_name)
+
+    def _reattach_control(self):
+        """Follow a restarted publisher, which may have created a new control segment; True if attached"""
+        try:
+            control = _attach(self.name)
+        except FileNotFoundError:
+            return False  # Publisher gone; keep serving the generation we have
+        self.control.close()
+        self.control = control
+        return True
+
+    def refresh(self):
+        """Attach to the newest generation; returns True if it changed"""
+        with self.lock:
+            self._close_retired()
+            generation, data_name = self.published_generation()
+            reattached = False
+            if not data_name:
+                # Withdrawn (or nothing published yet): only now look for a new control segment
+                reattached = self._reattach_control()
+                if reattached:
+                    generation, data_name = self.published_generation()
+            if not data_name or (generation == self.generation and not reattached):
+                return False
+            try:
+                data = _attach(data_name)
+            except FileNotFoundError:
+                return False  # Superseded while we looked; the next refresh gets the newer one
+
+            magic, version, data_generation, count = struct.unpack_from(HEADER_FORMAT, data.buf, 0)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                data.close()
+                raise ValueError(f"Unsupported gallery snapshot layout in {data_name}")
+
+            if self.data is not None:
+                # Matchers may still hold the old generation's templates; close it once they let go
+                self._gallery = None
+                self.retired.append(self.data)
+                self._close_retired()
+            self.data = data
+            self.generation = data_generation
+            self.count = count
+            self._templates_offset = HEADER_SIZE + RECORD_SIZE * count
+            return True
+
+    def _close_retired(self):
+        in_use = []
+        for data in self.retired:
+            try:
+                data.close()
+            except BufferError:
+                in_use.append(data)  # A template memoryview is still alive
+        self.retired = in_use
+
+    def __len__(self):
+        return self.count
+
+    def template(self, index):
+        """memoryview of one template inside the shared segment (release it before close())"""
+        offset = self._templates_offset + index * TEMPLATE_SIZE
+        return self.data.buf[offset:offset + TEMPLATE_SIZE]
+
+    def entry(self, index, with_template=True):
+        """Decode one record; the template is copied out as bytes"""
+        employee_key, employee_id, first_name, last_name, template_index = struct.unpack_from(
+            RECORD_FORMAT, self.data.buf, self._records_offset + index * RECORD_SIZE)
+        entry = {
+            "employee_key": _decode(employee_key),
+            "employeeId": _decode(employee_id),
+            "firstName": _decode(first_name),
+            "lastName": _decode(last_name),
+            "templateIndex": template_index
+        }
+        if with_template:
+            with self.template(index) as view:
+                entry["template"] = bytes(view)
+        return entry
+
+    def entries(self):
+        """Every entry in the replica's load_gallery() format, templates copied out"""
+        return [self.entry(i) for i in range(self.count)]
+
+    def gallery(self):
+        """
+        Every entry in load_gallery() format with the template as a memoryview into the
+        shared segment (no copy); the same list until refresh() attaches a new generation
+        """
+        with self.lock:
+            if self._gallery is None:
+                self._gallery = [{**self.entry(i, with_template=False), "template": self.template(i)}
+                                 for i in range(self.count)]
+            return self._gallery
+
+    def close(self):
+        with self.lock:
+            self._gallery = None
+            if self.data is not None:
+                self.retired.append(self.data)
+                self.data = None
+            self._close_retired()
+            self.control.close()
+
+def get_snapshot_reader(name=DEFAULT_SNAPSHOT_NAME):
+    """Process-wide reader for name, or None while no publisher is running (retried on the next call)"""
+    with _readers_lock:
+        if name not in _readers:
+            try:
+                _readers[name] = GallerySnapshotReader(name)
+            except FileNotFoundError:
+                return None
+        return _readers[name]
+
+def read_shared_gallery(name=DEFAULT_SNAPSHOT_NAME):
+    """
+    Zero-copy gallery from the published snapshot, or None if no publisher is running
+    Returns the same list object until a new generation is published, so a caller
+    can skip reloading its SDK cache when `gallery is previous_gallery`
+    """
+    reader = get_snapshot_reader(name)
+    if reader is None:
+        return None
+    if reader.refresh():
+        log(f"📎 Using shared gallery snapshot generation {reader.generation} ({len(reader)} templates)")
+    if reader.generation == 0:
+        return None
+    return reader.gallery()
+
+def main():
+    """Publisher loop: sync the local replica and publish a generation whenever it changes"""
+    parser = argparse.ArgumentParser(description="Publish the enrolled gallery into shared memory")
+    parser.add_argument('--name', default=DEFAULT_SNAPSHOT_NAME, help="Shared memory snapshot name")
+    parser.add_argument('--interval', type=float, default=DEFAULT_REFRESH_INTERVAL,
+                        help="Seconds between replica syncs")
+    args = parser.parse_args()
+
+    from integrated_capture import get_database_connection
+    from template_replica import get_replica
+
+    db, client, connection_error = get_database_connection()
+    if connection_error:
+        print(json.dumps({"success": False, "message": connection_error}))
+        sys.exit(1)
+
+    replica = get_replica()
+    publisher = GallerySnapshotPublisher(args.name)
+    published = False
+    try:
+        while True:
+            try:
+                stats = replica.sync(db)
+                changed = stats["upserted"] or stats["deleted"]
+            except Exception as e:
+                log(f"⚠️  Replica sync failed, keeping current snapshot: {str(e)}")
+                changed = False
+
+            if changed or not published:
+                started = time.perf_counter()
+                generation = publisher.publish(replica.load_gallery())
+                published = True
+                log(f"📢 Published generation {generation} in {(time.perf_counter() - started) * 1000:.1f} ms")
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        log("🛑 Publisher stopped")
+    finally:
+        publisher.close()
+        client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Hot-First Candidate Search
+Most scans at a kiosk come from a small, predictable set of people - everyone who
+timed in this morning times out this afternoon. The matcher first DBMatches the
+probe 1:1 against the templates of the K most recently seen employees and only
+falls back to DBIdentify over the whole gallery when none of them reaches
+HOT_MATCH_THRESHOLD, so a typical identify no longer grows with headcount.
+
+Ranking: seeded from today's open shifts (latest Time In first); every identified
+employee then moves to the front, and whoever times out drops out.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import timezone
+
+HOT_CANDIDATE_COUNT = int(os.environ.get("HOT_CANDIDATE_COUNT", "16"))
+
+# DBMatch score (0-100) a hot candidate must reach; below it DBIdentify decides
+HOT_MATCH_THRESHOLD = int(os.environ.get("HOT_MATCH_THRESHOLD", "60"))
+
+def _sort_key(value):
+    # Records read from MongoDB are naive UTC; ones written this session are Manila-aware
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+class HotCandidates:
+    """Recency-ranked employees most likely to scan next at this kiosk"""
+
+    def __init__(self, size=HOT_CANDIDATE_COUNT, threshold=HOT_MATCH_THRESHOLD):
+        self.size = size
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.ranked = OrderedDict()  # employee_key -> None, most recent last
+        self.templates = {}          # employee_key -> [template, ...] from the loaded gallery
+        self.fids = {}               # employee_key -> fid in the SDK cache
+        self.hits = 0
+        self.misses = 0
+
+    def set_gallery(self, gallery, employee_map):
+        """Point at a freshly loaded gallery; employees no longer in it are dropped"""
+        templates = {}
+        for entry in gallery:
+            templates.setdefault(entry['employee_key'], []).append(entry['template'])
+        fids = {str(employee['_id']): fid for fid, employee in employee_map.items()}
+        with self.lock:
+            self.templates = templates
+            self.fids = fids
+            for key in [key for key in self.ranked if key not in fids]:
+                del self.ranked[key]
+
+    def seed(self, records):
+        """Rank today's open shifts, latest Time In first (records: attendance documents)"""
+        open_shifts = [record for record in records if record.get('timeIn') and not record.get('timeOut')]
+        for record in sorted(open_shifts, key=lambda record: _sort_key(record['timeIn'])):
+            self.touch(record['employee'])
+
+    def touch(self, employee_key):
+        """Move an employee to the front of the ranking"""
+        key = str(employee_key)
+        with self.lock:
+            self.ranked.pop(key, None)
+            self.ranked[key] = None
+            while len(self.ranked) > self.size:
+                self.ranked.popitem(last=False)
+
+    def discard(self, employee_key):
+        """Drop an employee who is done for the day"""
+        with self.lock:
+            self.ranked.pop(str(employee_key), None)
+
+    def match(self, zkfp2, template):
+        """
+        DBMatch template against the hot candidates, most recent first
+        Returns (fid, score) of the first candidate at or above the threshold, or None
+        """
+        with self.lock:
+            candidates = [(self.fids.get(key), self.templates.get(key, ())) for key in reversed(self.ranked)]
+        for fid, templates in candidates:
+            if fid is None:
+                continue
+            for candidate in templates:
+                # Snapshot templates are memoryviews; the SDK is only ever given bytes
+                score = zkfp2.DBMatch(bytes(candidate), template)
+                if score >= self.threshold:
+                    self.hits += 1
+                    return fid, score
+        self.misses += 1
+        return None
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
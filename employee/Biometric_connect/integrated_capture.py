@@ -1,7 +1,16 @@
 #!/usr/bin/env python3
 """
 Integrated Fingerprint Capture for Employee Management System
-Supports: --capture, --health, --direct (attendance)
+Supports: --capture, --health, --direct (attendance), --serve (long-lived attendance kiosk),
+--metrics [hours] (scan reject / rescan rates)
+
+--serve is not spawned by the backend (routes/biometricIntegrated.js runs --direct per
+scan). It is the kiosk's own service: start `python integrated_capture.py --serve`
+at login or under a service wrapper (Task Scheduler / NSSM on Windows, systemd
+elsewhere) with MONGODB_URI set and restart it on exit. It holds the scanner open,
+so nothing else may use that device - don't combine it with the backend's --direct
+attendance on the same kiosk. It prints one JSON line per scan on stdout, logs to
+stderr, and stops cleanly on SIGTERM / Ctrl+C or when a parent closes its stdin pipe.
 """
 
 import sys
@@ -13,7 +22,21 @@ from pyzkfp import ZKFP2
 from pymongo import MongoClient
 from datetime import datetime, timedelta
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 import pytz  # For timezone handling
+from attendance_day_key import manila_day_key, find_day_attendance
+from template_replica import sync_local_replica
+from gallery_snapshot import read_shared_gallery
+from scan_debounce import get_debounce_cache
+from attendance_state import DayAttendanceState
+from cancellation import CancelToken, cancel_on_termination
+from hot_candidates import HotCandidates
+from tiered_gallery import TieredGallery, use_tiered_gallery, hot_tier_keys
+from gallery_partition import KIOSK_PARTITIONS, CROSS_SITE_FALLBACK
+from scan_metrics import get_scan_metrics
+from capture_quality import assess_capture
+from scan_archive import archive_scan, close_scan_archive
+from scan_event_log import ScanEvent, log_scan_event
 
 # Manila timezone
 MANILA_TZ = pytz.timezone('Asia/Manila')
@@ -53,6 +76,18 @@ def calculate_work_hours(time_in, time_out):
     hours = max(0.0, total_seconds / 3600.0)
     return hours
 
+def determine_attendance_status(work_hours):
+    """
+    Map worked hours to an attendance status
+    >= 6.5 hours is a full day, >= 4 hours is a half day, anything shorter stays present
+    """
+    if work_hours >= 6.5:
+        return "present"  # Full day (>= 6.5 hours)
+    elif work_hours >= 4:
+        return "half-day"  # Half day (>= 4 hours but < 6.5 hours)
+    else:
+        return "present"  # Too short, keep as present
+
 def get_database_connection():
     """Connect to MongoDB database"""
     try:
@@ -118,8 +153,9 @@ def check_device_health():
             "message": f"Device initialization failed: {str(e)}"
         }
 
-def capture_fingerprint_template(employee_id=None, first_name=None, last_name=None):
-    """Capture fingerprint and return template"""
+def capture_fingerprint_template(employee_id=None, first_name=None, last_name=None, cancel=None):
+    """Capture fingerprint and return template (stops within one poll once cancel is cancelled)"""
+    cancel = cancel or CancelToken()
     try:
         print(f"🖐️ Starting fingerprint capture for {first_name} {last_name}...", file=sys.stderr)
         
@@ -149,7 +185,7 @@ def capture_fingerprint_template(employee_id=None, first_name=None, last_name=No
             start_time = time.time()
             scan_success = False
             
-            while time.time() - start_time < scan_timeout:
+            while time.time() - start_time < scan_timeout and not cancel.cancelled:
                 capture = zkfp2.AcquireFingerprint()
                 if capture:
                     tmp, img = capture
@@ -158,7 +194,16 @@ def capture_fingerprint_template(employee_id=None, first_name=None, last_name=No
                         print(f"✅ Scan {i+1}/3 captured successfully!", file=sys.stderr)
                         scan_success = True
                         break
-                time.sleep(0.1)
+                cancel.sleep(0.1)
+            
+            if cancel.cancelled:
+                zkfp2.CloseDevice()
+                zkfp2.Terminate()
+                print(f"🛑 Capture cancelled: {cancel.reason}", file=sys.stderr)
+                return {
+                    "success": False,
+                    "message": f"Capture cancelled: {cancel.reason}"
+                }
             
             if not scan_success:
                 zkfp2.CloseDevice()
@@ -170,7 +215,7 @@ def capture_fingerprint_template(employee_id=None, first_name=None, last_name=No
             
             if i < 2:
                 print("⏳ Please lift finger and place again...", file=sys.stderr)
-                time.sleep(1)
+                cancel.sleep(1)
         
         # Merge templates into single registered template
         print("🔄 Merging fingerprint scans...", file=sys.stderr)
@@ -203,8 +248,275 @@ def capture_fingerprint_template(employee_id=None, first_name=None, last_name=No
             "message": f"Capture failed: {str(e)}"
         }
 
-def match_fingerprint_and_record_attendance():
+def load_gallery_into_device(zkfp2, gallery):
+    """
+    DBAdd every enrolled template (all fingers and samples) into the SDK cache
+    Each template gets its own FID; all FIDs of an employee map to one shared info
+    dict, so DBIdentify's best FID is the employee's best-scoring template (scores
+    are fused per employee by max) and a finger enrolled second is no longer rejected
+    Returns dict of FID -> employee info (with "templates": how many were loaded)
+    """
+    print(f"📊 Found {len(gallery)} enrolled templates", file=sys.stderr)
+    print(f"📊 Loading templates into device memory...", file=sys.stderr)
+
+    # Map FID to employee info
+    employee_map = {}
+    employees = {}  # employee_key -> shared employee info
+    fid = 1  # 0 means no match
+
+    # Load all templates into device memory using DBAdd
+    for entry in gallery:
+        try:
+            # Snapshot templates are memoryviews; the SDK is only ever given bytes
+            zkfp2.DBAdd(fid, bytes(entry['template']))
+        except Exception as e:
+            print(f"  ⚠️  Failed to load template for {entry['firstName'] or 'Unknown'}: {str(e)}", file=sys.stderr)
+            continue
+        employee = employees.get(entry['employee_key'])
+        if employee is None:
+            employee = employees[entry['employee_key']] = {
+                "_id": ObjectId(entry['employee_key']),
+                "employeeId": entry['employeeId'],
+                "firstName": entry['firstName'],
+                "lastName": entry['lastName'],
+                "templates": 0
+            }
+        employee["templates"] += 1
+        employee_map[fid] = employee
+        fid += 1
+
+    for employee in employees.values():
+        print(f"  ✅ Loaded: {employee['firstName']} {employee['lastName']} ({employee['templates']} templates)", file=sys.stderr)
+    print(f"📊 Successfully loaded {len(employee_map)} templates for {len(employees)} employees", file=sys.stderr)
+    return employee_map
+
+def identify_employee(zkfp2, employee_map, template, hot=None, event=None):
+    """
+    1:N match with DBIdentify; returns the employee info or None
+    With hot candidates, the most likely employees are DBMatched 1:1 first
+    A ScanEvent passed as event gets the FID and score
+    """
+    matched_employee = None
+    try:
+        hit = hot.match(zkfp2, template) if hot is not None else None
+        if hit:
+            fid, score = hit
+            matched_employee = employee_map.get(fid)
+            if event is not None:
+                event.fid, event.score = fid, score
+            if matched_employee:
+                print(f"🔥 HOT MATCH: {matched_employee.get('firstName')} {matched_employee.get('lastName')} (Score: {score})", file=sys.stderr)
+                hot.touch(matched_employee['_id'])
+                return matched_employee
+
+        print("🔍 Matching fingerprint using DBIdentify...", file=sys.stderr)
+        fid, score = zkfp2.DBIdentify(template)
+        print(f"📊 DBIdentify result - FID: {fid}, Score: {score}", file=sys.stderr)
+        if event is not None:
+            event.fid, event.score = fid, score
+
+        if fid > 0 and score > 0:
+            matched_employee = employee_map.get(fid)
+            if matched_employee:
+                print(f"✅ MATCH FOUND: {matched_employee.get('firstName')} {matched_employee.get('lastName')} "
+                      f"(Score: {score}, best of {matched_employee.get('templates', 1)} templates)", file=sys.stderr)
+                if hot is not None:
+                    hot.touch(matched_employee['_id'])
+            else:
+                print(f"⚠️ FID {fid} matched but not in employee map", file=sys.stderr)
+        else:
+            print(f"❌ No match (FID: {fid}, Score: {score})", file=sys.stderr)
+    except Exception as e:
+        print(f"❌ DBIdentify error: {str(e)}", file=sys.stderr)
+        import traceback
+        traceback.print_exc(file=sys.stderr)
+    return matched_employee
+
+def identify_employee_tiered(tiered, template, hot=None, event=None):
+    """identify_employee for a TieredGallery: hot tier, then cold chunks; logs identify cost per tier"""
+    matched_employee = None
+    try:
+        matched_employee, score, tier = tiered.identify(template, hot)
+        if event is not None:
+            event.score = score
+            event.tier = tier or ("fallback" if tiered.partitions and tiered.cross_partition else "cold")  # A miss searched every tier
+        if matched_employee:
+            print(f"✅ MATCH FOUND ({tier} tier): {matched_employee.get('firstName')} {matched_employee.get('lastName')} (Score: {score})", file=sys.stderr)
+        else:
+            print(f"❌ No match in any tier (Score: {score})", file=sys.stderr)
+    except Exception as e:
+        print(f"❌ DBIdentify error: {str(e)}", file=sys.stderr)
+        import traceback
+        traceback.print_exc(file=sys.stderr)
+    print(f"📊 Identify cost - {tiered.report()}", file=sys.stderr)
+    return matched_employee
+
+def scan_event(matched_employee, result):
+    """Archive metadata for a processed scan"""
+    return {
+        "source": "integrated_capture",
+        "employee": str(matched_employee['_id']) if matched_employee else None,
+        "employeeId": matched_employee.get('employeeId') if matched_employee else None,
+        "success": result.get("success"),
+        "action": result.get("action"),
+        "message": result.get("message")
+    }
+
+def record_attendance(db, matched_employee, day_state=None):
+    """
+    Record Time In / Time Out for a matched employee
+    With a warm DayAttendanceState the decision is made in memory and the write goes
+    through to MongoDB; without one, today's record is looked up first
+    """
+    employee_id = str(matched_employee['_id'])
+    employee_object_id = matched_employee['_id']
+
+    # A repeat press within the debounce window gets the previous answer without a DB lookup
+    debounce = get_debounce_cache()
+    previous_result = debounce.get(employee_id)
+    if previous_result:
+        print(f"🔁 Repeat scan within {debounce.ttl:.0f}s - returning previous result", file=sys.stderr)
+        return previous_result
+
+    # Use Manila timezone for all date/time operations
+    manila_now = datetime.now(MANILA_TZ)
+    today = manila_now.replace(hour=0, minute=0, second=0, microsecond=0)
+    tomorrow = today + timedelta(days=1)
+    day_key = manila_day_key(manila_now)
+
+    def lookup_attendance():
+        # Point query on (employee, dayKey), with the old date range only as a
+        # fallback for records written without a dayKey
+        return find_day_attendance(
+            db.attendances,
+            employee_object_id,
+            day_key,
+            legacy_filter={
+                "employee": employee_object_id,
+                "date": {
+                    "$gte": today,
+                    "$lt": tomorrow
+                }
+            }
+        )
+
+    # Check if attendance already exists for today
+    if day_state is not None:
+        day_state.ensure_current(manila_now)
+        attendance = day_state.get(employee_id)
+        if not attendance:
+            # The state may be minutes old, and the backend's /attendance/record writes no
+            # dayKey, so the unique index can't stop a second Time In; look before inserting
+            attendance = lookup_attendance()
+            if attendance:
+                day_state.put(employee_id, attendance)
+    else:
+        attendance = lookup_attendance()
+
+    current_time = manila_now
+    action = ""
+
+    if not attendance:
+        # Create new attendance record (Time In)
+        # Use today (midnight Manila time) for date field, current_time for timeIn
+        attendance_data = {
+            "employee": ObjectId(employee_id),
+            "employeeId": matched_employee.get('employeeId', employee_id),
+            "date": today,  # Store date as midnight Manila time for proper querying
+            "dayKey": day_key,  # Canonical Manila day for the (employee, dayKey) index
+            "timeIn": current_time,  # Store actual scan time in Manila timezone
+            "status": "present",
+            "archived": False,
+            "createdAt": current_time,
+            "updatedAt": current_time
+        }
+        try:
+            result = db.attendances.insert_one(attendance_data)
+            attendance_data['_id'] = result.inserted_id
+            action = "time_in"
+            message = f"✅ Time In recorded at {current_time.strftime('%I:%M %p')}"
+        except DuplicateKeyError:
+            # Another writer recorded Time In after the state was loaded
+            attendance = lookup_attendance()
+
+    if not action and attendance and not attendance.get('timeOut'):
+        # Update with Time Out and calculate work hours
+        time_in = attendance.get('timeIn')
+
+        # Ensure time_in is timezone-aware
+        if time_in.tzinfo is None:
+            time_in = MANILA_TZ.localize(time_in)
+
+        # Calculate work hours (excluding lunch break 12:00-12:59 PM)
+        work_hours = calculate_work_hours(time_in, current_time)
+
+        # Determine status based on work hours
+        status = determine_attendance_status(work_hours)
+
+        # Only if nobody else has timed this record out in the meantime
+        update = db.attendances.update_one(
+            {"_id": attendance['_id'], "timeOut": None},
+            {
+                "$set": {
+                    "timeOut": current_time,
+                    "status": status,
+                    "updatedAt": current_time
+                }
+            }
+        )
+        if update.matched_count:
+            attendance['timeOut'] = current_time
+            attendance['status'] = status
+            attendance_data = attendance
+            action = "time_out"
+            message = f"✅ Time Out recorded at {current_time.strftime('%I:%M %p')} ({work_hours:.2f} hrs)"
+        else:
+            attendance = lookup_attendance()
+
+    if not action:
+        if day_state is not None and attendance:
+            day_state.put(employee_id, attendance)
+        result = {
+            "success": False,
+            "message": "Attendance already completed for today"
+        }
+        debounce.put(employee_id, "completed", result)
+        return result
+
+    if day_state is not None:
+        day_state.put(employee_id, attendance_data)
+
+    result = {
+        "success": True,
+        "message": message,
+        "action": action,
+        "employee": {
+            "_id": employee_id,
+            "firstName": matched_employee.get('firstName'),
+            "lastName": matched_employee.get('lastName'),
+            "employeeId": matched_employee.get('employeeId')
+        },
+        "attendance": {
+            "_id": str(attendance_data['_id']),
+            "date": attendance_data['date'].isoformat() if isinstance(attendance_data['date'], datetime) else attendance_data['date'],
+            "timeIn": attendance_data['timeIn'].isoformat() if isinstance(attendance_data.get('timeIn'), datetime) else attendance_data.get('timeIn'),
+            "timeOut": attendance_data['timeOut'].isoformat() if isinstance(attendance_data.get('timeOut'), datetime) else None if not attendance_data.get('timeOut') else attendance_data.get('timeOut'),
+            "status": attendance_data.get('status', 'present')
+        }
+    }
+    debounce.put(employee_id, action, result)
+    return result
+
+def match_fingerprint_and_record_attendance(cancel=None):
     """Capture fingerprint, match against database, and record attendance"""
+    event = ScanEvent()
+    try:
+        return _match_and_record_attendance(cancel or CancelToken(), event)
+    finally:
+        log_scan_event(event)
+
+def _match_and_record_attendance(cancel, event):
+    """match_fingerprint_and_record_attendance; event collects outcome and stage timings"""
     try:
         print("🔍 Starting fingerprint matching for attendance...", file=sys.stderr)
         
@@ -235,244 +547,111 @@ def match_fingerprint_and_record_attendance():
         timeout = 20  # 20 seconds timeout
         start_time = time.time()
         capture_success = False
+        last_prompt = None
         
-        while time.time() - start_time < timeout:
-            capture = zkfp2.AcquireFingerprint()
+        while time.time() - start_time < timeout and not cancel.cancelled:
+            with event.stage("capture"):
+                capture = zkfp2.AcquireFingerprint()
             if capture:
                 tmp, img = capture
                 if tmp:
-                    print("✅ Fingerprint captured!", file=sys.stderr)
-                    capture_success = True
-                    break
-            time.sleep(0.1)
+                    # Poor captures are retried here instead of failing to match
+                    with event.stage("quality"):
+                        quality = assess_capture(img, zkfp2)
+                    if quality["ok"]:
+                        print("✅ Fingerprint captured!", file=sys.stderr)
+                        capture_success = True
+                        break
+                    if quality["reason"] != last_prompt:
+                        print(f"👆 Press again: {quality['reason']} ({quality['ms']:.1f} ms)", file=sys.stderr)
+                        last_prompt = quality["reason"]
+            cancel.sleep(0.1)
         
-        if not capture_success:
+        if cancel.cancelled:
+            event.outcome = "cancelled"
             zkfp2.CloseDevice()
             zkfp2.Terminate()
+            print(f"🛑 Scan cancelled: {cancel.reason}", file=sys.stderr)
             return {
                 "success": False,
-                "message": "Fingerprint capture timeout. Please try again."
+                "message": f"Scan cancelled: {cancel.reason}"
             }
         
-        # Initialize DB handle for DBIdentify (1:N matching)
-        db_handle = zkfp2.DBInit()
-        print(f"✅ Database handle initialized: {db_handle}", file=sys.stderr)
-        
-        # Get all employees with fingerprints
-        employees = list(db.employees.find({
-            "fingerprintEnrolled": True,
-            "$or": [
-                {"fingerprintTemplates": {"$exists": True, "$ne": []}},
-                {"fingerprintTemplate": {"$exists": True, "$ne": None}}
-            ]
-        }))
-        
-        print(f"📊 Found {len(employees)} employees with fingerprints", file=sys.stderr)
-        print(f"📊 Loading templates into device memory...", file=sys.stderr)
-        
-        # Map numeric ID to employee document
-        employee_map = {}
-        loaded_count = 0
-        skipped_count = 0
-        
-        # Load all templates into device memory using DBAdd
-        for idx, employee in enumerate(employees):
-            employee_id_str = employee.get('employeeId', str(employee['_id']))
-            
-            # Extract numeric ID for device
-            try:
-                if employee_id_str.startswith('EMP-') or employee_id_str.startswith('EMP'):
-                    numeric_id = int(''.join(filter(str.isdigit, employee_id_str)))
-                else:
-                    numeric_id = int(employee_id_str)
-            except:
-                numeric_id = idx + 1000  # Fallback: use index + offset
-            
-            # Try loading multi-template format first
-            if employee.get('fingerprintTemplates'):
-                for fp_data in employee['fingerprintTemplates']:
-                    try:
-                        stored_template_b64 = fp_data.get('template', '')
-                        if stored_template_b64:
-                            stored_template_bytes = base64.b64decode(stored_template_b64)
-                            
-                            # Validate template size (should be 2048 bytes for ZKTeco)
-                            if len(stored_template_bytes) != 2048:
-                                print(f"  ⚠️  Skipping {employee.get('firstName')} {employee.get('lastName')}: Invalid template size {len(stored_template_bytes)} bytes", file=sys.stderr)
-                                skipped_count += 1
-                                continue
-                            
-                            zkfp2.DBAdd(numeric_id, stored_template_bytes)
-                            employee_map[numeric_id] = employee
-                            loaded_count += 1
-                            print(f"  ✅ Loaded: {employee.get('firstName')} {employee.get('lastName')} (ID: {numeric_id})", file=sys.stderr)
-                            break  # Only load first template per employee
-                    except Exception as e:
-                        print(f"  ⚠️  Failed to load template for {employee.get('firstName', 'Unknown')}: {str(e)}", file=sys.stderr)
-                        skipped_count += 1
-                        continue
-            
-            # Try loading legacy single template format
-            elif employee.get('fingerprintTemplate'):
-                try:
-                    stored_template_b64 = employee['fingerprintTemplate']
-                    stored_template_bytes = base64.b64decode(stored_template_b64)
-                    
-                    # Validate template size (should be 2048 bytes for ZKTeco)
-                    if len(stored_template_bytes) != 2048:
-                        print(f"  ⚠️  Skipping {employee.get('firstName')} {employee.get('lastName')}: Invalid template size {len(stored_template_bytes)} bytes", file=sys.stderr)
-                        skipped_count += 1
-                        continue
-                    
-                    zkfp2.DBAdd(numeric_id, stored_template_bytes)
-                    employee_map[numeric_id] = employee
-                    loaded_count += 1
-                    print(f"  ✅ Loaded: {employee.get('firstName')} {employee.get('lastName')} (ID: {numeric_id})", file=sys.stderr)
-                except Exception as e:
-                    print(f"  ⚠️  Failed to load legacy template for {employee.get('firstName', 'Unknown')}: {str(e)}", file=sys.stderr)
-                    skipped_count += 1
-                    continue
-        
-        print(f"📊 Successfully loaded {loaded_count} templates (skipped {skipped_count} invalid)", file=sys.stderr)
-        
-        if loaded_count == 0:
-            zkfp2.DBFree(db_handle)
+        if not capture_success:
+            event.outcome = "poor_capture" if last_prompt else "timeout"
             zkfp2.CloseDevice()
             zkfp2.Terminate()
             return {
                 "success": False,
-                "message": "No valid templates found. Please enroll employees first."
+                "message": "Fingerprint capture timeout. Please try again."
             }
         
-        # Use DBIdentify for 1:N matching (proper way to match against stored templates)
-        print("🔍 Matching fingerprint using DBIdentify...", file=sys.stderr)
-        
-        matched_employee = None
-        try:
-            fid, score = zkfp2.DBIdentify(tmp)
-            print(f"📊 DBIdentify result - FID: {fid}, Score: {score}", file=sys.stderr)
-            
-            if fid > 0 and score > 0:
-                matched_employee = employee_map.get(fid)
-                if matched_employee:
-                    print(f"✅ MATCH FOUND: {matched_employee.get('firstName')} {matched_employee.get('lastName')} (Score: {score})", file=sys.stderr)
-                else:
-                    print(f"⚠️ FID {fid} matched but not in employee map", file=sys.stderr)
+        # Identify time includes loading the gallery, which dominates a one-shot scan
+        with event.stage("identify"):
+            # Initialize DB handle for DBIdentify (1:N matching)
+            db_handle = zkfp2.DBInit()
+            print(f"✅ Database handle initialized: {db_handle}", file=sys.stderr)
+        
+            # Only changed employees are synced from MongoDB into the local replica
+            replica = sync_local_replica(db)
+            day_state = None
+            tiered = None
+            if KIOSK_PARTITIONS or use_tiered_gallery(replica):
+                # More templates than the SDK cache is sized for, or a site-scoped kiosk:
+                # today's attendees stay resident and the rest of the roster (or of the
+                # company) is searched in chunks on a miss
+                day_state = DayAttendanceState(db.attendances)
+                day_state.load()
+                # One scan and exit: a cold sweep need not put the hot tier back
+                tiered = TieredGallery(zkfp2, replica, partitions=KIOSK_PARTITIONS, cross_partition=CROSS_SITE_FALLBACK,
+                                       restore_hot=False)
+                tiered.load(hot_tier_keys(day_state.records_list()))
+                employee_map = tiered.hot_map
             else:
-                print(f"❌ No match (FID: {fid}, Score: {score})", file=sys.stderr)
-        except Exception as e:
-            print(f"❌ DBIdentify error: {str(e)}", file=sys.stderr)
-            import traceback
-            traceback.print_exc(file=sys.stderr)
-        
+                # Templates come from the shared snapshot if a publisher is running
+                gallery = read_shared_gallery() or replica.load_gallery()
+                employee_map = load_gallery_into_device(zkfp2, gallery)
+
+            # A site with nobody enrolled yet can still match other sites' employees
+            if not employee_map and not (tiered and tiered.partitions and tiered.cross_partition):
+                zkfp2.DBFree(db_handle)
+                zkfp2.CloseDevice()
+                zkfp2.Terminate()
+                return {
+                    "success": False,
+                    "message": "No valid templates found. Please enroll employees first."
+                }
+
+            # Use DBIdentify for 1:N matching (proper way to match against stored templates)
+            if tiered:
+                matched_employee = identify_employee_tiered(tiered, tmp, event=event)
+            else:
+                matched_employee = identify_employee(zkfp2, employee_map, tmp, event=event)
+
         # Cleanup device resources
         zkfp2.DBFree()  # DBFree doesn't take parameters
         zkfp2.CloseDevice()
         zkfp2.Terminate()
-        
+
+        if get_scan_metrics().record(matched_employee):
+            print(f"🔁 Rescan after a reject - {get_scan_metrics().describe()}", file=sys.stderr)
+
+        event.outcome = "match" if matched_employee else "no_match"
+        event.employee = matched_employee['_id'] if matched_employee else None
         if not matched_employee:
-            return {
+            result = {
                 "success": False,
                 "message": "Fingerprint not recognized. Please enroll first."
             }
-        
-        # Record attendance
-        employee_id = str(matched_employee['_id'])
-        employee_object_id = matched_employee['_id']
-        
-        # Use Manila timezone for all date/time operations
-        manila_now = datetime.now(MANILA_TZ)
-        today = manila_now.replace(hour=0, minute=0, second=0, microsecond=0)
-        tomorrow = today + timedelta(days=1)
-        
-        # Check if attendance already exists for today using employee ObjectId (more reliable)
-        attendance = db.attendances.find_one({
-            "employee": employee_object_id,
-            "date": {
-                "$gte": today,
-                "$lt": tomorrow
-            }
-        })
-        
-        current_time = manila_now
-        action = ""
-        
-        if not attendance:
-            # Create new attendance record (Time In)
-            # Use today (midnight Manila time) for date field, current_time for timeIn
-            attendance_data = {
-                "employee": ObjectId(employee_id),
-                "employeeId": matched_employee.get('employeeId', employee_id),
-                "date": today,  # Store date as midnight Manila time for proper querying
-                "timeIn": current_time,  # Store actual scan time in Manila timezone
-                "status": "present",
-                "archived": False,
-                "createdAt": current_time,
-                "updatedAt": current_time
-            }
-            result = db.attendances.insert_one(attendance_data)
-            attendance_data['_id'] = result.inserted_id
-            action = "time_in"
-            message = f"✅ Time In recorded at {current_time.strftime('%I:%M %p')}"
-        elif not attendance.get('timeOut'):
-            # Update with Time Out and calculate work hours
-            time_in = attendance.get('timeIn')
-            
-            # Ensure time_in is timezone-aware
-            if time_in.tzinfo is None:
-                time_in = MANILA_TZ.localize(time_in)
-            
-            # Calculate work hours (excluding lunch break 12:00-12:59 PM)
-            work_hours = calculate_work_hours(time_in, current_time)
-            
-            # Determine status based on work hours
-            if work_hours >= 6.5:
-                status = "present"  # Full day (>= 6.5 hours)
-            elif work_hours >= 4:
-                status = "half-day"  # Half day (>= 4 hours but < 6.5 hours)
-            else:
-                status = "present"  # Too short, keep as present
-            
-            db.attendances.update_one(
-                {"_id": attendance['_id']},
-                {
-                    "$set": {
-                        "timeOut": current_time,
-                        "status": status,
-                        "updatedAt": current_time
-                    }
-                }
-            )
-            attendance['timeOut'] = current_time
-            attendance['status'] = status
-            attendance_data = attendance
-            action = "time_out"
-            message = f"✅ Time Out recorded at {current_time.strftime('%I:%M %p')} ({work_hours:.2f} hrs)"
         else:
-            return {
-                "success": False,
-                "message": "Attendance already completed for today"
-            }
-        
-        return {
-            "success": True,
-            "message": message,
-            "action": action,
-            "employee": {
-                "_id": employee_id,
-                "firstName": matched_employee.get('firstName'),
-                "lastName": matched_employee.get('lastName'),
-                "employeeId": matched_employee.get('employeeId')
-            },
-            "attendance": {
-                "_id": str(attendance_data['_id']),
-                "date": attendance_data['date'].isoformat() if isinstance(attendance_data['date'], datetime) else attendance_data['date'],
-                "timeIn": attendance_data['timeIn'].isoformat() if isinstance(attendance_data.get('timeIn'), datetime) else attendance_data.get('timeIn'),
-                "timeOut": attendance_data['timeOut'].isoformat() if isinstance(attendance_data.get('timeOut'), datetime) else None if not attendance_data.get('timeOut') else attendance_data.get('timeOut'),
-                "status": attendance_data.get('status', 'present')
-            }
-        }
-        
+            # Record attendance
+            with event.stage("record"):
+                result = record_attendance(db, matched_employee, day_state)
+
+        # Written by a background thread; main() flushes it before exiting
+        archive_scan(tmp, img, scan_event(matched_employee, result), zkfp2)
+        return result
+
     except Exception as e:
         print(f"❌ Error in attendance matching: {str(e)}", file=sys.stderr)
         try:
@@ -484,17 +663,171 @@ def match_fingerprint_and_record_attendance():
             "message": f"Attendance recording failed: {str(e)}"
         }
 
+# Long-lived --serve mode
+SERVE_POLL_INTERVAL = 0.1  # seconds between capture polls
+GALLERY_REFRESH_INTERVAL = 60  # seconds between gallery reloads into the SDK cache
+
+def serve_attendance(cancel=None):
+    """
+    Long-lived capture process for a kiosk: the device stays open, the gallery stays in
+    the SDK cache and today's attendance state is kept in memory (reloaded at Manila
+    midnight and reconciled while idle), so a Time Out or repeat scan needs no database
+    read; only a first scan of the day does a point lookup before inserting.
+    Prints one JSON result line per scan until cancel is cancelled (see the module
+    docstring for how to run it).
+    """
+    cancel = cancel or CancelToken()
+    db, client, connection_error = get_database_connection()
+    if connection_error:
+        return {
+            "success": False,
+            "message": connection_error
+        }
+    
+    zkfp2 = ZKFP2()
+    zkfp2.Init()
+    if zkfp2.GetDeviceCount() == 0:
+        zkfp2.Terminate()
+        client.close()
+        return {
+            "success": False,
+            "message": "No fingerprint device found"
+        }
+    zkfp2.OpenDevice(0)
+    zkfp2.DBInit()
+    
+    day_state = DayAttendanceState(db.attendances)
+    day_state.load()
+    # Whoever timed in this morning is the likeliest to scan next
+    hot = HotCandidates()
+    hot.seed(day_state.records_list())
+    employee_map = {}
+    gallery = None
+    tiered = None
+    metrics = get_scan_metrics()
+    gallery_loaded_at = 0
+    finger_down = False
+    scans = 0
+    print("📱 Attendance service ready. Place finger on scanner...", file=sys.stderr)
+    
+    try:
+        while not cancel.cancelled:
+            if time.time() - gallery_loaded_at >= GALLERY_REFRESH_INTERVAL:
+                replica = sync_local_replica(db)
+                if KIOSK_PARTITIONS or use_tiered_gallery(replica):
+                    # Today's attendees (and whoever was promoted since) stay resident
+                    tiered = tiered or TieredGallery(zkfp2, replica, partitions=KIOSK_PARTITIONS,
+                                                     cross_partition=CROSS_SITE_FALLBACK)
+                    gallery = tiered.load(hot_tier_keys(day_state.records_list()))
+                    employee_map = tiered.hot_map
+                    hot.set_gallery(gallery, employee_map)
+                else:
+                    # The shared snapshot is only DBAdded again when a new generation
+                    # has been published
+                    shared = read_shared_gallery()
+                    if tiered or not shared or shared is not gallery:
+                        tiered = None
+                        zkfp2.DBFree()
+                        zkfp2.DBInit()
+                        gallery = shared or replica.load_gallery()
+                        employee_map = load_gallery_into_device(zkfp2, gallery)
+                        hot.set_gallery(gallery, employee_map)
+                gallery_loaded_at = time.time()
+            
+            event = ScanEvent()
+            with event.stage("capture"):
+                capture = zkfp2.AcquireFingerprint()
+            if not capture or not capture[0]:
+                finger_down = False
+                # Idle: do the midnight reload / reconcile here, off the scan path
+                try:
+                    day_state.ensure_current()
+                except Exception as e:
+                    print(f"⚠️  Attendance state reconcile failed: {str(e)}", file=sys.stderr)
+                cancel.sleep(SERVE_POLL_INTERVAL)
+                continue
+            if finger_down:
+                # Same touch as the last scan; wait for the finger to lift
+                cancel.sleep(SERVE_POLL_INTERVAL)
+                continue
+            finger_down = True
+            
+            tmp, img = capture
+            with event.stage("quality"):
+                quality = assess_capture(img, zkfp2)
+            if not quality["ok"]:
+                # Rejected in milliseconds, before any matching; the next touch is a new scan
+                event.outcome = "poor_capture"
+                log_scan_event(event)
+                print(f"👆 Press again: {quality['reason']} ({quality['ms']:.1f} ms)", file=sys.stderr)
+                print(json.dumps({
+                    "success": False,
+                    "message": f"Press again - {quality['reason']}",
+                    "quality": quality
+                }), flush=True)
+                continue
+            matched_employee = None
+            try:
+                with event.stage("identify"):
+                    if tiered:
+                        matched_employee = identify_employee_tiered(tiered, tmp, hot, event)
+                    else:
+                        matched_employee = identify_employee(zkfp2, employee_map, tmp, hot, event)
+                event.outcome = "match" if matched_employee else "no_match"
+                event.employee = matched_employee['_id'] if matched_employee else None
+                if metrics.record(matched_employee):
+                    print(f"🔁 Rescan after a reject - {metrics.describe()}", file=sys.stderr)
+                if matched_employee:
+                    with event.stage("record"):
+                        result = record_attendance(db, matched_employee, day_state)
+                    if result.get("action") == "time_out":
+                        hot.discard(matched_employee['_id'])  # Done for the day
+                else:
+                    result = {
+                        "success": False,
+                        "message": "Fingerprint not recognized. Please enroll first."
+                    }
+            except Exception as e:
+                print(f"❌ Error in attendance matching: {str(e)}", file=sys.stderr)
+                event.outcome = "error"
+                result = {
+                    "success": False,
+                    "message": f"Attendance recording failed: {str(e)}"
+                }
+            scans += 1
+            log_scan_event(event)
+            archive_scan(tmp, img, scan_event(matched_employee, result), zkfp2)
+            print(json.dumps(result), flush=True)
+        print(f"🛑 Attendance service stopped: {cancel.reason} "
+              f"(hot candidate hit rate {hot.hit_rate():.0%} over {hot.hits + hot.misses} scans)", file=sys.stderr)
+        if tiered:
+            print(f"📊 Identify cost - {tiered.report()}", file=sys.stderr)
+        print(f"📊 Scan metrics: {metrics.describe()}", file=sys.stderr)
+    finally:
+        zkfp2.DBFree()
+        zkfp2.CloseDevice()
+        zkfp2.Terminate()
+        client.close()
+        close_scan_archive()
+    
+    return {
+        "success": True,
+        "message": f"Attendance service stopped after {scans} scans"
+    }
+
 def main():
     """Main entry point"""
     if len(sys.argv) < 2:
         result = {
             "success": False,
-            "message": "No operation specified. Use --capture, --health, or --direct"
+            "message": "No operation specified. Use --capture, --health, --direct, --serve or --metrics"
         }
         print(json.dumps(result))
         sys.exit(1)
     
     operation = sys.argv[1]
+    # SIGTERM/Ctrl+C or the backend closing our stdin stops capture within one poll
+    cancel = cancel_on_termination(CancelToken())
     
     if operation == "--health":
         result = check_device_health()
@@ -512,16 +845,30 @@ def main():
             first_name = "Unknown"
             last_name = ""
         
-        result = capture_fingerprint_template(employee_id, first_name, last_name)
+        result = capture_fingerprint_template(employee_id, first_name, last_name, cancel)
         print(json.dumps(result))
         sys.exit(0 if result["success"] else 1)
     
     elif operation == "--direct":
         # Match fingerprint and record attendance
-        result = match_fingerprint_and_record_attendance()
+        result = match_fingerprint_and_record_attendance(cancel)
+        print(json.dumps(result), flush=True)
+        close_scan_archive()
+        sys.exit(0 if result["success"] else 1)
+    
+    elif operation == "--serve":
+        # Long-lived kiosk process: one JSON line per scan until interrupted
+        result = serve_attendance(cancel)
         print(json.dumps(result))
         sys.exit(0 if result["success"] else 1)
     
+    elif operation == "--metrics":
+        # Reject / rescan rates recorded by every scan on this machine
+        hours = float(sys.argv[2]) if len(sys.argv) > 2 else 24
+        result = {"success": True, "metrics": get_scan_metrics().summary(hours)}
+        print(json.dumps(result))
+        sys.exit(0)
+    
     else:
         result = {
             "success": False,
@@ -11,9 +11,12 @@ from PIL import Image, ImageTk
 import threading
 import io
 import time
-import sqlite3
 import json
 import os
+from template_replica import get_replica
+from ui_event_bus import UIEventBus
+from cancellation import CancelToken
+from backend_client import BackendClient
 
 
 # ✅ Check kung may arguments (employee_id, name, at employee_data)
@@ -56,15 +59,30 @@ class FingerprintGUI:
         self.registration_in_progress = False
         self.scan_count = 0
         self.device_lock = threading.Lock()
+        self.cancel = CancelToken()  # Cancelled on close so capture loops stop within one poll
         self.template_count = 0  # Track template count manually since GetDBNum doesn't exist
         self.debug_mode = True  # Enable debug mode for duplicate detection
         self.skip_duplicate_check = False  # Enable duplicate detection
         
-        # MongoDB only - no local database needed
+        # MongoDB is the source of truth; fingerprint_database.db is the local template replica
+        self.replica = None
+
+        # Templates go up as raw bytes on a kept-alive session (see backend_client.py)
+        self.backend = BackendClient("http://localhost:5000", log=self.log)
+
+        # Background threads post widget updates here; the Tk thread applies them once per frame
+        self.ui = UIEventBus(self.root)
         self.setup_ui()
+        self.ui.start()
+        self.started_at = time.perf_counter()
+        self.init_database()
         
-        # Load users from MongoDB backend
-        self.load_users_from_backend()
+        # Show the local roster at once, then replace it with MongoDB's when the backend answers
+        self.load_users_from_replica()
+        threading.Thread(target=self.load_users_from_backend, daemon=True).start()
+
+    def log_startup_time(self, what):
+        self.log(f"⏱️ {what} {(time.perf_counter() - self.started_at) * 1000:.0f} ms after startup")
         
     def setup_ui(self):
         # Main container
@@ -373,17 +391,23 @@ class FingerprintGUI:
             return False
     
     def log(self, message):
-        """Add message to log"""
+        """Add message to log (safe from worker threads)"""
+        line = f"{time.strftime('%H:%M:%S')} - {message}"
+        if hasattr(self, 'log_text'):
+            # The widget is written by the Tk thread, one insert per frame
+            self.ui.append("log", self.write_log_lines, line)
+        else:
+            print(line)
+
+    def write_log_lines(self, lines):
+        """Append a frame's worth of log lines to the log widget"""
         try:
-            if hasattr(self, 'log_text'):
-                self.log_text.config(state=tk.NORMAL)
-                self.log_text.insert(tk.END, f"{time.strftime('%H:%M:%S')} - {message}\n")
-                self.log_text.see(tk.END)
-                self.log_text.config(state=tk.DISABLED)
-            else:
-                print(f"{time.strftime('%H:%M:%S')} - {message}")
+            self.log_text.config(state=tk.NORMAL)
+            self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+            self.log_text.see(tk.END)
+            self.log_text.config(state=tk.DISABLED)
         except Exception as e:
-            print(f"{time.strftime('%H:%M:%S')} - {message}")
+            print("\n".join(lines))
             print(f"Log error: {e}")
 
     def safe_light(self, color):
@@ -433,53 +457,30 @@ class FingerprintGUI:
             return False
     
     def init_database(self):
-        """✅ Initialize SQLite database"""
+        """✅ Open the local template replica (one long-lived WAL connection)"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS fingerprint_users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id TEXT UNIQUE NOT NULL,
-                    user_name TEXT NOT NULL,
-                    fingerprint_template BLOB,
-                    template_length INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
-            self.log("✅ Database initialized successfully")
+            self.replica = get_replica()
+            self.log(f"✅ Local template replica ready: {self.replica.path}")
             
         except Exception as e:
             self.log(f"❌ Database initialization error: {str(e)}")
     
-    def save_user_to_database(self, user_id, user_name, template, template_length):
-        """✅ Save user fingerprint data to database"""
+    def load_users_from_replica(self):
+        """✅ Fill the roster from the local replica (no network, shown before the backend answers)"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO fingerprint_users 
-                (user_id, user_name, fingerprint_template, template_length, updated_at)
-                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (user_id, user_name, template, template_length))
-            
-            conn.commit()
-            conn.close()
-            self.log(f"✅ User {user_name} saved to database")
-            return True
-            
+            if not self.replica:
+                return
+            self.registered_users = {
+                user_id: {'name': user_name, 'template': None, 'template_length': 0, 'employee_data': {}}
+                for user_id, user_name in self.replica.roster()
+            }
+            self.update_users_list()
+            self.log_startup_time(f"Local roster ({len(self.registered_users)} users) shown")
         except Exception as e:
-            self.log(f"❌ Database save error: {str(e)}")
-            return False
-    
+            self.log(f"⚠️  Could not read local roster: {str(e)}")
+
     def load_users_from_backend(self):
-        """✅ Load all users from MongoDB backend"""
+        """✅ Load all users from MongoDB backend (runs in a background thread)"""
         try:
             if not self.test_backend_connection():
                 self.log("❌ Backend server not running - cannot load users")
@@ -488,24 +489,33 @@ class FingerprintGUI:
             response = requests.get("http://localhost:5000/api/employees", timeout=10)
             if response.status_code == 200:
                 employees = response.json()
-                self.registered_users = {}
+                users = {}
                 
                 for emp in employees:
                     if emp.get('fingerprintEnrolled'):
                         user_id = emp.get('employeeId')
                         user_name = f"{emp.get('firstName', '')} {emp.get('lastName', '')}"
-                        self.registered_users[user_id] = {
+                        users[user_id] = {
                             'name': user_name,
                             'template': None,  # Template not stored in MongoDB for security
                             'template_length': 0,
                             'employee_data': emp
                         }
                 
-                self.log(f"✅ Loaded {len(self.registered_users)} enrolled users from MongoDB")
-                self.update_users_list()
+                self.log(f"✅ Loaded {len(users)} enrolled users from MongoDB")
+                self.ui.post(self.set_registered_users, users)
                 
         except Exception as e:
             self.log(f"❌ Error loading users from backend: {str(e)}")
+
+    def set_registered_users(self, users):
+        """Replace the roster with MongoDB's (Tk thread)"""
+        # Keep anyone registered in this session whose save the backend hasn't returned yet
+        users.update({user_id: info for user_id, info in self.registered_users.items()
+                      if user_id not in users and info.get('template') is not None})
+        self.registered_users = users
+        self.update_users_list()
+        self.log_startup_time("Roster loaded from MongoDB")
     
     def delete_user_from_database(self, user_id):
         """✅ Delete user from MongoDB backend"""
@@ -713,7 +723,8 @@ class FingerprintGUI:
             
             self.display_fingerprint_image(img)
             
-            time.sleep(1)
+            if self.cancel.sleep(1):
+                return
             
         try:
             self.log("Merging templates...")
@@ -760,26 +771,16 @@ class FingerprintGUI:
             
             try:
                 # Send fingerprint template to backend for duplicate check
-                duplicate_check_data = {
-                    "fingerprintTemplate": bytes(reg_temp).hex(),
-                    "excludeEmployeeId": None  # Don't exclude any employee for new registrations
-                }
-                
                 self.log(f"🔍 Sending duplicate check request for user: {user_id}")
-                self.log(f"🔍 Template length: {len(bytes(reg_temp).hex())}")
-                self.log(f"🔍 Template hex (first 100 chars): {bytes(reg_temp).hex()[:100]}...")
+                self.log(f"🔍 Template length: {len(bytes(reg_temp))} bytes")
                 
                 # Test backend connection first
                 self.log(f"🔍 Testing backend connection...")
                 test_response = requests.get("http://localhost:5000/api/fingerprint/test", timeout=5)
                 self.log(f"🔍 Backend test response: {test_response.status_code} - {test_response.text}")
                 
-                response = requests.post(
-                    "http://localhost:5000/api/fingerprint/check-duplicate",
-                    json=duplicate_check_data,
-                    headers={'Content-Type': 'application/json'},
-                    timeout=10
-                )
+                # No exclusion for new registrations
+                response = self.backend.check_duplicate(reg_temp, exclude_employee_id=None, timeout=10)
                 
                 self.log(f"🔍 Backend response status: {response.status_code}")
                 
@@ -858,7 +859,7 @@ class FingerprintGUI:
             
             self.template_count += 1  # Increment template count for new registration
             
-            # Save directly to MongoDB backend (no local SQLite)
+            # Save to MongoDB backend; the local replica picks the change up on its next sync
             if employee_data:
                 backend_success = self.create_employee_in_backend(employee_data, reg_temp)
                 if backend_success:
@@ -996,7 +997,7 @@ class FingerprintGUI:
         start_time = time.time()
         self.log(f"Starting fingerprint capture (timeout: {timeout}s)")
         
-        while time.time() - start_time < timeout:
+        while time.time() - start_time < timeout and not self.cancel.cancelled:
             try:
                 with self.device_lock:
                     if not self.zkfp2:
@@ -1015,7 +1016,7 @@ class FingerprintGUI:
                 self.log(f"Capture error: {str(e)}")
                 # Don't return immediately, keep trying
                 
-            time.sleep(0.1)
+            self.cancel.sleep(0.1)
             
         self.log(f"Fingerprint capture timeout after {timeout}s")
         return None
@@ -1148,6 +1149,19 @@ class FingerprintGUI:
             self.log(f"❌ Error deleting user: {str(e)}")
             messagebox.showerror("Error", f"Failed to delete user:\n{str(e)}")
     
+    def on_closing(self):
+        """Stop any capture in progress, then release the device"""
+        self.ui.stop()
+        self.cancel.cancel("Window closed")
+        try:
+            with self.device_lock:
+                if self.zkfp2:
+                    self.zkfp2.Terminate()
+                    self.zkfp2 = None
+        except:
+            pass
+        self.root.destroy()
+
     def update_users_list(self):
         """Update the users list treeview"""
         for item in self.users_tree.get_children():
@@ -1161,6 +1175,7 @@ class FingerprintGUI:
 def main():
     root = tk.Tk()
     app = FingerprintGUI(root)
+    root.protocol("WM_DELETE_WINDOW", app.on_closing)
 
     # Prefill form fields if employee data is provided (using database field names)
     if employee_data:
@@ -0,0 +1,151 @@
+"""
+Scan Archive for Audit and Dispute Resolution
+Keeps the image and template behind each attendance scan, written off the scan path:
+submit() only appends to a bounded in-memory queue and a background writer thread
+stores each scan as
+
+    <SCAN_ARCHIVE_DIR>/<YYYY-MM-DD>/<HHMMSS-ffffff>_<employeeId>.png|.webp  (image)
+    <SCAN_ARCHIVE_DIR>/<YYYY-MM-DD>/<HHMMSS-ffffff>_<employeeId>.tpl        (template)
+    <SCAN_ARCHIVE_DIR>/<YYYY-MM-DD>/index.jsonl                             (one line per scan)
+
+When the disk falls behind and the queue is full, the oldest queued scan is dropped
+(and counted) so capture never blocks on I/O.
+
+Disabled unless SCAN_ARCHIVE_DIR is set. SCAN_ARCHIVE_FORMAT is png (default) or
+webp (lossless); SCAN_ARCHIVE_QUEUE sets the queue size (default 64).
+"""
+
+import os
+import io
+import sys
+import json
+import gzip
+import threading
+from collections import deque
+from datetime import datetime
+import pytz
+from capture_quality import image_shape
+
+MANILA_TZ = pytz.timezone('Asia/Manila')
+
+ARCHIVE_DIR = os.environ.get("SCAN_ARCHIVE_DIR", "")
+ARCHIVE_FORMAT = os.environ.get("SCAN_ARCHIVE_FORMAT", "png").lower()
+ARCHIVE_QUEUE_SIZE = int(os.environ.get("SCAN_ARCHIVE_QUEUE", "64"))
+
+_archive = None
+_archive_lock = threading.Lock()
+
+def get_scan_archive():
+    """Process-wide archive, or None when SCAN_ARCHIVE_DIR is not set"""
+    global _archive
+    if not ARCHIVE_DIR:
+        return None
+    with _archive_lock:
+        if _archive is None:
+            _archive = ScanArchive(ARCHIVE_DIR, ARCHIVE_FORMAT, ARCHIVE_QUEUE_SIZE)
+        return _archive
+
+def archive_scan(template, image, event=None, zkfp2=None):
+    """Queue a scan on the process-wide archive; does nothing when archiving is off"""
+    archive = get_scan_archive()
+    if archive is not None:
+        archive.submit(template, image, event, zkfp2)
+
+def close_scan_archive(timeout=5):
+    """Flush and stop the process-wide archive (before a one-shot process exits)"""
+    global _archive
+    with _archive_lock:
+        archive, _archive = _archive, None
+    if archive is not None:
+        archive.close(timeout)
+
+class ScanArchive:
+    """Bounded drop-oldest queue drained to date-partitioned files by one writer thread"""
+
+    def __init__(self, root, image_format="png", max_queue=64):
+        if image_format not in ("png", "webp"):
+            raise ValueError(f"Unknown archive image format: {image_format} (expected png or webp)")
+        self.root = root
+        self.image_format = image_format
+        self.queue = deque(maxlen=max_queue)
+        self.condition = threading.Condition()
+        self.closed = False
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.thread = threading.Thread(target=self._run, name="scan-archive", daemon=True)
+        self.thread.start()
+
+    def submit(self, template, image, event=None, zkfp2=None):
+        """
+        Queue one scan; never blocks. event is JSON-serialisable metadata (employee,
+        action, result). Returns False if an older queued scan had to be dropped
+        """
+        shape = image_shape(image, zkfp2) if image else None
+        item = (datetime.now(MANILA_TZ), bytes(template) if template else b"",
+                bytes(image) if image else b"", shape, dict(event or {}))
+        with self.condition:
+            if self.closed:
+                return False
+            full = len(self.queue) == self.queue.maxlen
+            if full:
+                self.dropped += 1  # deque(maxlen) discards the oldest on append
+            self.queue.append(item)
+            self.condition.notify()
+        return not full
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed:
+                    self.condition.wait()
+                if not self.queue:
+                    return
+                item = self.queue.popleft()
+            try:
+                self._write(*item)
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"⚠️  Scan archive write failed: {str(e)}", file=sys.stderr)
+
+    def _write(self, captured_at, template, image, shape, event):
+        directory = os.path.join(self.root, captured_at.strftime("%Y-%m-%d"))
+        os.makedirs(directory, exist_ok=True)
+        employee_id = "".join(c for c in str(event.get("employeeId") or "unknown") if c.isalnum() or c in "-_")
+        stem = f"{captured_at.strftime('%H%M%S-%f')}_{employee_id}"
+
+        files = {}
+        if image:
+            if shape:
+                from PIL import Image  # Only needed once archiving is switched on
+                height, width = shape
+                buffer = io.BytesIO()
+                Image.frombytes("L", (width, height), image).save(
+                    buffer, format=self.image_format.upper(), **({"lossless": True} if self.image_format == "webp" else {}))
+                files["image"] = f"{stem}.{self.image_format}"
+                data = buffer.getvalue()
+            else:
+                # Unknown sensor size: keep the raw buffer
+                files["image"] = f"{stem}.raw.gz"
+                data = gzip.compress(image)
+            with open(os.path.join(directory, files["image"]), "wb") as f:
+                f.write(data)
+        if template:
+            files["template"] = f"{stem}.tpl"
+            with open(os.path.join(directory, files["template"]), "wb") as f:
+                f.write(template)
+
+        record = {"capturedAt": captured_at.isoformat(), **event, **files}
+        with open(os.path.join(directory, "index.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+
+    def close(self, timeout=5):
+        """Stop accepting scans and wait up to timeout seconds for the queue to drain"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join(timeout)
+        if self.dropped or self.failed or self.thread.is_alive():
+            print(f"⚠️  Scan archive: {self.written} written, {self.dropped} dropped, {self.failed} failed, "
+                  f"{len(self.queue)} unwritten", file=sys.stderr)
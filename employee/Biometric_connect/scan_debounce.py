@@ -0,0 +1,97 @@
+"""
+Repeat-Scan Debounce Cache
+People often press their finger twice; the second press should get the first
+press's answer instead of another attendance lookup (and a spurious Time Out).
+
+Results are kept for a short TTL, keyed by (matched employee, action), in the
+local replica database so one-shot scan processes share them.
+Window: SCAN_DEBOUNCE_SECONDS environment variable (default 60, 0 disables).
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+from template_replica import get_replica
+
+DEFAULT_DEBOUNCE_SECONDS = 60
+
+SQL_GET_RECENT = '''
+    SELECT result FROM scan_debounce
+    WHERE employee_key = ? AND recorded_at >= ?
+    ORDER BY recorded_at DESC LIMIT 1
+'''
+SQL_PUT = '''
+    INSERT INTO scan_debounce (employee_key, action, result, recorded_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT(employee_key, action) DO UPDATE SET
+        result = excluded.result,
+        recorded_at = excluded.recorded_at
+'''
+SQL_PURGE = 'DELETE FROM scan_debounce WHERE recorded_at < ?'
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def debounce_window():
+    """Configured debounce window in seconds"""
+    try:
+        return max(0.0, float(os.getenv('SCAN_DEBOUNCE_SECONDS', DEFAULT_DEBOUNCE_SECONDS)))
+    except ValueError:
+        return float(DEFAULT_DEBOUNCE_SECONDS)
+
+def get_debounce_cache():
+    """Process-wide cache on the replica's long-lived connection"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ScanDebounceCache(get_replica(), debounce_window())
+        return _cache
+
+class ScanDebounceCache:
+    """TTL cache of recent scan results keyed by (employee, action)"""
+
+    def __init__(self, replica, ttl=DEFAULT_DEBOUNCE_SECONDS):
+        self.replica = replica
+        self.ttl = ttl
+        with replica.lock, replica.conn:
+            replica.conn.execute('''
+                CREATE TABLE IF NOT EXISTS scan_debounce (
+                    employee_key TEXT NOT NULL,
+                    action TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    recorded_at REAL NOT NULL,
+                    PRIMARY KEY (employee_key, action)
+                )
+            ''')
+
+    def get(self, employee_key, now=None):
+        """Most recent result for this employee inside the window, marked as debounced, or None"""
+        if self.ttl <= 0:
+            return None
+        now = time.time() if now is None else now
+        try:
+            with self.replica.lock:
+                row = self.replica.conn.execute(SQL_GET_RECENT, (str(employee_key), now - self.ttl)).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️  Debounce cache read failed: {str(e)}", file=sys.stderr)
+            return None
+        if not row:
+            return None
+        result = json.loads(row[0])
+        result["debounced"] = True
+        return result
+
+    def put(self, employee_key, action, result, now=None):
+        """Remember a result and drop expired entries"""
+        if self.ttl <= 0:
+            return
+        now = time.time() if now is None else now
+        try:
+            with self.replica.lock, self.replica.conn:
+                self.replica.conn.execute(SQL_PUT, (str(employee_key), action, json.dumps(result, default=str), now))
+                self.replica.conn.execute(SQL_PURGE, (now - self.ttl,))
+        except sqlite3.Error as e:
+            # The attendance itself is already recorded; only the shortcut is lost
+            print(f"⚠️  Debounce cache write failed: {str(e)}", file=sys.stderr)
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Scan Event Log for Analytics
+Every attendance scan appends one fixed-size 64-byte record to an append-only
+binary file through mmap: timestamp, device, employee, FID, score, outcome, the
+gallery tier that matched and per-stage latencies (capture, quality, identify,
+record, total). Appending is a struct.pack_into into the mapped file under a file
+lock, so it is nearly free on the scan path, and millions of scans stay small
+(64 MB per million) and load instantly as a NumPy structured array.
+
+Files: <SCAN_EVENT_LOG_DIR>/<device>.<segment>.scanlog (device = KIOSK_ID, default
+the host name). Each segment is preallocated to SEGMENT_RECORDS records when it is
+created and never resized, because the GUI, --serve and --direct processes all map
+it and Windows refuses to resize a file another process has mapped; a full segment
+rolls over to the next. A 64-byte header holds the segment's record count.
+SCAN_EVENT_LOG=0 disables logging.
+
+Usage: python scan_event_log.py [directory-or-file ...]   (prints a JSON summary)
+"""
+
+import os
+import sys
+import json
+import mmap
+import time
+import glob
+import socket
+import struct
+import threading
+from contextlib import contextmanager
+import numpy as np
+from bson import ObjectId
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+EVENT_LOG_ENABLED = os.environ.get("SCAN_EVENT_LOG", "1") == "1"
+EVENT_LOG_DIR = os.environ.get("SCAN_EVENT_LOG_DIR",
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)), "scan_events"))
+DEVICE_NAME = os.environ.get("KIOSK_ID") or socket.gethostname()
+
+OUTCOMES = ("match", "no_match", "poor_capture", "timeout", "cancelled", "error")
+TIERS = ("full", "hot", "cold", "fallback")
+STAGES = ("capture", "quality", "identify", "record")
+
+MAGIC = b"SCANEVT1"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQ")  # magic, version, record size, record count
+HEADER_SIZE = 64
+RECORD = struct.Struct("<d16s12sihBB5f")
+RECORD_DTYPE = np.dtype([
+    ("timestamp", "<f8"),     # Unix time of the scan
+    ("device", "S16"),
+    ("employee", "S12"),      # raw ObjectId bytes, zeros when unmatched
+    ("fid", "<i4"),
+    ("score", "<i2"),
+    ("outcome", "u1"),        # index into OUTCOMES
+    ("tier", "u1"),           # index into TIERS
+    ("capture_ms", "<f4"),
+    ("quality_ms", "<f4"),
+    ("identify_ms", "<f4"),
+    ("record_ms", "<f4"),
+    ("total_ms", "<f4"),
+])
+assert RECORD.size == RECORD_DTYPE.itemsize == 64
+SEGMENT_RECORDS = 65536  # 4 MB per segment file
+
+class ScanEvent:
+    """One scan being timed; filled in along the scan path and appended at the end"""
+
+    def __init__(self):
+        self.timestamp = time.time()
+        self.started = time.perf_counter()
+        self.employee = None
+        self.fid = 0
+        self.score = 0
+        self.outcome = "error"
+        self.tier = "full"
+        self.stages = dict.fromkeys(STAGES, 0.0)
+
+    @contextmanager
+    def stage(self, name):
+        """Add the time spent in the with-block to stage name (ms)"""
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.stages[name] += (time.perf_counter() - started) * 1000
+
+    def pack_into(self, buffer, offset, device):
+        employee = ObjectId(self.employee).binary if self.employee else b""
+        RECORD.pack_into(
+            buffer, offset, self.timestamp, device, employee, self.fid, max(-32768, min(32767, int(self.score))),
+            OUTCOMES.index(self.outcome), TIERS.index(self.tier),
+            *(self.stages[name] for name in STAGES), (time.perf_counter() - self.started) * 1000)
+
+def _lock(file):
+    if fcntl:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+
+def _unlock(file):
+    if fcntl:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+class ScanEventLog:
+    """Append-only fixed-record log shared by every scan process on the device"""
+
+    def __init__(self, directory, device=DEVICE_NAME, segment_records=SEGMENT_RECORDS):
+        self.directory = directory
+        self.name = device
+        self.device = device.encode("utf-8")[:16]
+        self.segment_records = segment_records
+        self.lock = threading.Lock()
+        self.file = self.map = None
+        os.makedirs(directory, exist_ok=True)
+        self._open(max(self.segments(), default=0))
+
+    def segment_path(self, index):
+        return os.path.join(self.directory, f"{self.name}.{index:04d}.scanlog")
+
+    def segments(self):
+        """Indexes of this device's existing segment files"""
+        indexes = []
+        for path in glob.glob(os.path.join(glob.escape(self.directory), f"{glob.escape(self.name)}.*.scanlog")):
+            index = os.path.basename(path)[len(self.name) + 1:-len(".scanlog")]
+            if index.isdigit():
+                indexes.append(int(index))
+        return indexes
+
+    def _open(self, index):
+        """
+        Map segment index, creating and preallocating it first if needed. The current
+        segment stays mapped until the new one is ready, so a failure here only loses
+        the event being written
+        """
+        path = self.segment_path(index)
+        # Not append mode: the header is rewritten in place
+        file = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)), "r+b")
+        try:
+            _lock(file)
+            try:
+                file.seek(0)
+                header = file.read(HEADER_SIZE)
+                if len(header) < HEADER_SIZE or header[:len(MAGIC)] == bytes(len(MAGIC)):
+                    # New (or never initialised) segment: nobody has it mapped yet
+                    file.truncate(HEADER_SIZE + self.segment_records * RECORD.size)
+                    file.seek(0)
+                    file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, 0))
+                    file.flush()
+                mapped = mmap.mmap(file.fileno(), os.fstat(file.fileno()).st_size)
+            finally:
+                _unlock(file)
+            magic, version, record_size, _ = HEADER.unpack_from(mapped, 0)
+            if magic != MAGIC or record_size != RECORD.size:
+                mapped.close()
+                raise ValueError(f"{path} is not a version {VERSION} scan event log")
+        except BaseException:
+            file.close()
+            raise
+        if self.map is not None:
+            self.map.close()
+            self.file.close()
+        self.file, self.map, self.index = file, mapped, index
+        self.capacity = (len(mapped) - HEADER_SIZE) // RECORD.size
+
+    def append(self, event):
+        """Write one ScanEvent; the record count in the header is bumped last"""
+        with self.lock:
+            while True:
+                _lock(self.file)
+                try:
+                    count = HEADER.unpack_from(self.map, 0)[3]
+                    if count < self.capacity:
+                        event.pack_into(self.map, HEADER_SIZE + count * RECORD.size, self.device)
+                        struct.pack_into("<Q", self.map, 16, count + 1)
+                        return
+                finally:
+                    _unlock(self.file)
+                # Segment full: move to the next one (another process may have created it already)
+                self._open(self.index + 1)
+
+    def close(self):
+        with self.lock:
+            self.map.flush()
+            self.map.close()
+            self.file.close()
+
+_log = None
+_log_lock = threading.Lock()
+
+def get_scan_event_log():
+    """Process-wide log for this device, or None when disabled"""
+    global _log
+    if not EVENT_LOG_ENABLED:
+        return None
+    with _log_lock:
+        if _log is None:
+            _log = ScanEventLog(EVENT_LOG_DIR)
+        return _log
+
+def log_scan_event(event):
+    """Append event; analytics must never fail a scan"""
+    try:
+        log = get_scan_event_log()
+        if log is not None:
+            log.append(event)
+    except Exception as e:
+        print(f"⚠️  Scan event log write failed: {str(e)}", file=sys.stderr)
+
+def read_scan_events(path):
+    """Records of one log file as a read-only NumPy structured array (memory-mapped)"""
+    with open(path, "rb") as f:
+        magic, version, record_size, count = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or record_size != RECORD_DTYPE.itemsize:
+        raise ValueError(f"{path} is not a version {VERSION} scan event log")
+    if count == 0:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+def load_scan_events(*paths):
+    """All records from log files and/or directories of them, ordered by timestamp"""
+    files = []
+    for path in paths or (EVENT_LOG_DIR,):
+        files.extend(sorted(glob.glob(os.path.join(path, "*.scanlog"))) if os.path.isdir(path) else [path])
+    events = [read_scan_events(path) for path in files]
+    if not events:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    events = np.concatenate(events)
+    return events[np.argsort(events["timestamp"], kind="stable")]
+
+def summarize(events):
+    """Outcome counts, per-device volume and latency percentiles of matched / unmatched scans"""
+    outcomes = np.bincount(events["outcome"], minlength=len(OUTCOMES))
+    devices, per_device = np.unique(events["device"], return_counts=True)
+    identified = events[np.isin(events["outcome"], (OUTCOMES.index("match"), OUTCOMES.index("no_match")))]
+    latency = {}
+    for field in ("capture_ms", "quality_ms", "identify_ms", "record_ms", "total_ms"):
+        if len(identified):
+            p50, p95, p99 = np.percentile(identified[field], (50, 95, 99))
+            latency[field] = {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "p99": round(float(p99), 2)}
+    return {
+        "scans": int(len(events)),
+        "outcomes": {name: int(count) for name, count in zip(OUTCOMES, outcomes)},
+        "devices": {device.decode("utf-8", "replace"): int(count) for device, count in zip(devices, per_device)},
+        "meanScore": round(float(events["score"][events["outcome"] == 0].mean()), 1) if outcomes[0] else None,
+        "latency": latency
+    }
+
+if __name__ == "__main__":
+    print(json.dumps(summarize(load_scan_events(*sys.argv[1:])), indent=2))
@@ -0,0 +1,104 @@
+"""
+Scan Outcome Metrics
+A false reject costs far more than an identify: the employee has to scan again.
+Every attendance scan records whether it matched; a scan that follows a reject
+within RESCAN_WINDOW_SECONDS counts as a rescan, so the rescan rate shows how
+often people had to try twice.
+
+Outcomes are kept in the local replica database (like the debounce cache) so
+one-shot scan processes add to the same numbers. Rows older than
+SCAN_METRICS_RETENTION_DAYS are purged.
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import threading
+from template_replica import get_replica
+
+RESCAN_WINDOW_SECONDS = float(os.environ.get("RESCAN_WINDOW_SECONDS", "15"))
+SCAN_METRICS_RETENTION_DAYS = float(os.environ.get("SCAN_METRICS_RETENTION_DAYS", "7"))
+
+SQL_LAST_SCAN = 'SELECT matched, recorded_at FROM scan_outcomes ORDER BY recorded_at DESC LIMIT 1'
+SQL_INSERT = '''
+    INSERT INTO scan_outcomes (recorded_at, matched, rescan, employee_key, templates)
+    VALUES (?, ?, ?, ?, ?)
+'''
+SQL_PURGE = 'DELETE FROM scan_outcomes WHERE recorded_at < ?'
+SQL_SUMMARY = '''
+    SELECT COUNT(*), COALESCE(SUM(1 - matched), 0), COALESCE(SUM(rescan), 0),
+           COALESCE(SUM(CASE WHEN rescan = 1 AND matched = 1 THEN 1 ELSE 0 END), 0),
+           AVG(CASE WHEN matched = 1 THEN templates END)
+    FROM scan_outcomes WHERE recorded_at >= ?
+'''
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+def get_scan_metrics():
+    """Process-wide metrics on the replica's long-lived connection"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = ScanMetrics(get_replica())
+        return _metrics
+
+class ScanMetrics:
+    """Match / reject / rescan counts for attendance scans"""
+
+    def __init__(self, replica, rescan_window=RESCAN_WINDOW_SECONDS):
+        self.replica = replica
+        self.rescan_window = rescan_window
+        with replica.lock, replica.conn:
+            replica.conn.execute('''
+                CREATE TABLE IF NOT EXISTS scan_outcomes (
+                    recorded_at REAL NOT NULL,
+                    matched INTEGER NOT NULL,
+                    rescan INTEGER NOT NULL,
+                    employee_key TEXT,
+                    templates INTEGER
+                )
+            ''')
+            replica.conn.execute('CREATE INDEX IF NOT EXISTS idx_scan_outcomes_time ON scan_outcomes (recorded_at)')
+
+    def record(self, matched_employee, now=None):
+        """
+        Record one scan (matched_employee None for a reject), with how many of the
+        employee's templates were searched. Returns True if it was a rescan
+        """
+        now = time.time() if now is None else now
+        try:
+            with self.replica.lock, self.replica.conn:
+                last = self.replica.conn.execute(SQL_LAST_SCAN).fetchone()
+                rescan = bool(last) and not last[0] and now - last[1] <= self.rescan_window
+                key = str(matched_employee['_id']) if matched_employee else None
+                templates = matched_employee.get('templates') if matched_employee else None
+                self.replica.conn.execute(SQL_INSERT, (now, int(bool(matched_employee)), int(rescan), key, templates))
+                self.replica.conn.execute(SQL_PURGE, (now - SCAN_METRICS_RETENTION_DAYS * 86400,))
+            return rescan
+        except sqlite3.Error as e:
+            print(f"⚠️  Scan metrics write failed: {str(e)}", file=sys.stderr)
+            return False
+
+    def summary(self, hours=24, now=None):
+        """Scans, rejects and rescans over the last hours, with rates"""
+        now = time.time() if now is None else now
+        with self.replica.lock:
+            scans, rejects, rescans, recovered, templates = self.replica.conn.execute(
+                SQL_SUMMARY, (now - hours * 3600,)).fetchone()
+        return {
+            "hours": hours,
+            "scans": scans,
+            "rejects": rejects,
+            "rescans": rescans,
+            "rescansMatched": recovered,
+            "rejectRate": rejects / scans if scans else 0.0,
+            "rescanRate": rescans / scans if scans else 0.0,
+            "avgTemplatesPerMatch": templates or 0.0
+        }
+
+    def describe(self, hours=24):
+        summary = self.summary(hours)
+        return (f"{summary['scans']} scans in {hours}h, reject rate {summary['rejectRate']:.1%}, "
+                f"rescan rate {summary['rescanRate']:.1%}")
@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""
+Local Fingerprint Template Replica (fingerprint_database.db)
+Keeps a copy of every enrolled template on the kiosk so matchers load their
+gallery from local disk instead of pulling all templates from MongoDB per scan.
+
+- one long-lived SQLite connection per process (WAL journal, cached statements)
+- batched upserts inside a single transaction
+- incremental sync driven by an employees.updatedAt cursor, plus a periodic
+  reconcile of enrolled IDs to catch deletions and writers that skip updatedAt
+- each employee's gallery partition (gallery_partition.py) so a kiosk can load
+  only its own site
+
+Run directly to sync now:
+    python template_replica.py [--full]
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from fingerprint_templates import (
+    ENROLLED_EMPLOYEE_QUERY, TEMPLATE_PROJECTION, iter_employee_templates
+)
+from gallery_partition import PARTITION_FIELD, partition_value
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fingerprint_database.db')
+
+# How often the full ID reconcile runs (the cheap updatedAt sync runs on every call)
+RECONCILE_INTERVAL = timedelta(minutes=10)
+
+CURSOR_KEY = 'employees.updatedAt'
+RECONCILED_KEY = 'employees.reconciledAt'
+PARTITION_FIELD_KEY = 'gallery.partitionField'
+
+SYNC_PROJECTION = {**TEMPLATE_PROJECTION, "fingerprintEnrolled": 1, "isActive": 1, "updatedAt": 1,
+                   PARTITION_FIELD: 1}
+
+# Fixed SQL text so sqlite3 reuses the prepared statements from its statement cache
+SQL_UPSERT_USER = '''
+    INSERT INTO fingerprint_users
+        (user_id, user_name, first_name, last_name, employee_key, is_active,
+         partition_key, fingerprint_template, template_length, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(user_id) DO UPDATE SET
+        user_name = excluded.user_name,
+        first_name = COALESCE(NULLIF(excluded.first_name, ''), fingerprint_users.first_name),
+        last_name = COALESCE(NULLIF(excluded.last_name, ''), fingerprint_users.last_name),
+        employee_key = COALESCE(excluded.employee_key, fingerprint_users.employee_key),
+        is_active = excluded.is_active,
+        partition_key = COALESCE(excluded.partition_key, fingerprint_users.partition_key),
+        fingerprint_template = excluded.fingerprint_template,
+        template_length = excluded.template_length,
+        updated_at = CURRENT_TIMESTAMP
+'''
+SQL_DELETE_TEMPLATES = 'DELETE FROM fingerprint_templates WHERE user_id = ?'
+SQL_INSERT_TEMPLATE = '''
+    INSERT INTO fingerprint_templates (user_id, template_index, template)
+    VALUES (?, ?, ?)
+'''
+SQL_DELETE_USER_BY_KEY = 'DELETE FROM fingerprint_users WHERE employee_key = ?'
+SQL_DELETE_TEMPLATES_BY_KEY = '''
+    DELETE FROM fingerprint_templates
+    WHERE user_id IN (SELECT user_id FROM fingerprint_users WHERE employee_key = ?)
+'''
+SQL_GET_STATE = 'SELECT value FROM sync_state WHERE name = ?'
+SQL_SET_STATE = '''
+    INSERT INTO sync_state (name, value) VALUES (?, ?)
+    ON CONFLICT(name) DO UPDATE SET value = excluded.value
+'''
+# Gallery queries take a partition filter as {scope} (see _partition_scope); the text
+# only varies with the number of partitions, so cached statements are still reused
+SQL_LOAD_GALLERY = '''
+    SELECT u.employee_key, u.user_id, u.first_name, u.last_name, u.is_active,
+           t.template_index, t.template, u.partition_key
+    FROM fingerprint_users u
+    JOIN fingerprint_templates t ON t.user_id = u.user_id
+    WHERE u.employee_key IS NOT NULL{scope}
+    ORDER BY u.user_id, t.template_index
+'''
+
+# Keyset pagination over (user_id, template_index) so cold-tier chunks never load the whole gallery
+SQL_LOAD_GALLERY_CHUNK = '''
+    SELECT u.employee_key, u.user_id, u.first_name, u.last_name, u.is_active,
+           t.template_index, t.template, u.partition_key
+    FROM fingerprint_users u
+    JOIN fingerprint_templates t ON t.user_id = u.user_id
+    WHERE u.employee_key IS NOT NULL{scope} AND (t.user_id, t.template_index) > (?, ?)
+    ORDER BY t.user_id, t.template_index
+    LIMIT ?
+'''
+SQL_COUNT_TEMPLATES = '''
+    SELECT COUNT(*)
+    FROM fingerprint_users u
+    JOIN fingerprint_templates t ON t.user_id = u.user_id
+    WHERE u.employee_key IS NOT NULL{scope}
+'''
+
+# Columns added to fingerprint_users tables created by older versions of main.py
+USER_COLUMNS = {
+    "first_name": "TEXT NOT NULL DEFAULT ''",
+    "last_name": "TEXT NOT NULL DEFAULT ''",
+    "employee_key": "TEXT",
+    "is_active": "INTEGER NOT NULL DEFAULT 1",
+    "partition_key": "TEXT",
+}
+
+_replicas = {}
+_replicas_lock = threading.Lock()
+
+def log(message):
+    """Log to stderr so it doesn't interfere with JSON output"""
+    print(message, file=sys.stderr)
+
+def get_replica(path=DEFAULT_DB_PATH):
+    """Return the process-wide replica for path, opening it on first use"""
+    path = os.path.abspath(path)
+    with _replicas_lock:
+        if path not in _replicas:
+            _replicas[path] = TemplateReplica(path)
+        return _replicas[path]
+
+def _partition_scope(partitions=(), exclude_partitions=()):
+    """SQL filter (for {scope}) and parameters keeping or leaving out gallery partitions"""
+    scope = ''
+    params = []
+    if partitions:
+        scope += f" AND u.partition_key IN ({','.join('?' * len(partitions))})"
+        params.extend(partitions)
+    if exclude_partitions:
+        # Employees without a partition belong to no kiosk, so they are always "other"
+        scope += f" AND (u.partition_key IS NULL OR u.partition_key NOT IN ({','.join('?' * len(exclude_partitions))}))"
+        params.extend(exclude_partitions)
+    return scope, params
+
+def _utc_naive(value):
+    """Stored dates come back from pymongo as naive UTC; normalise anything else to that"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+class TemplateReplica:
+    """SQLite replica of enrolled templates, shared by every thread of the process"""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False, cached_statements=64)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA temp_store=MEMORY')
+        self._create_schema()
+
+    def _create_schema(self):
+        with self.lock, self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS fingerprint_users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    user_name TEXT NOT NULL,
+                    fingerprint_template BLOB,
+                    template_length INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            existing = {row[1] for row in self.conn.execute('PRAGMA table_info(fingerprint_users)')}
+            for column, definition in USER_COLUMNS.items():
+                if column not in existing:
+                    self.conn.execute(f'ALTER TABLE fingerprint_users ADD COLUMN {column} {definition}')
+
+            # ON CONFLICT(user_id) upserts need a unique index; it also serves employeeId lookups
+            self.conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_fingerprint_users_user_id ON fingerprint_users(user_id)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_fingerprint_users_employee_key ON fingerprint_users(employee_key)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_fingerprint_users_partition ON fingerprint_users(partition_key)')
+
+            # One row per stored template (multi-template enrollment)
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS fingerprint_templates (
+                    user_id TEXT NOT NULL,
+                    template_index INTEGER NOT NULL,
+                    template BLOB NOT NULL,
+                    PRIMARY KEY (user_id, template_index)
+                )
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    name TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def get_state(self, name):
+        with self.lock:
+            row = self.conn.execute(SQL_GET_STATE, (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, name, value):
+        self.conn.execute(SQL_SET_STATE, (name, value))
+
+    def upsert_users(self, users):
+        """
+        Upsert many users in one transaction
+        users: iterable of dicts with user_id, user_name, first_name, last_name,
+        employee_key, is_active, partition_key and templates [(template_index, bytes), ...]
+        """
+        user_rows = []
+        template_rows = []
+        user_ids = []
+        for user in users:
+            templates = list(user.get('templates') or [])
+            first = templates[0][1] if templates else None
+            user_rows.append((
+                user['user_id'], user.get('user_name') or '', user.get('first_name') or '',
+                user.get('last_name') or '', user.get('employee_key'), 1 if user.get('is_active', True) else 0,
+                user.get('partition_key'), first, len(first) if first else 0
+            ))
+            user_ids.append((user['user_id'],))
+            template_rows.extend((user['user_id'], index, template) for index, template in templates)
+
+        if not user_rows:
+            return 0
+        with self.lock, self.conn:
+            self.conn.executemany(SQL_UPSERT_USER, user_rows)
+            self.conn.executemany(SQL_DELETE_TEMPLATES, user_ids)
+            self.conn.executemany(SQL_INSERT_TEMPLATE, template_rows)
+        return len(user_rows)
+
+    def delete_employees(self, employee_keys):
+        """Remove employees (by MongoDB _id string) and their templates"""
+        rows = [(key,) for key in employee_keys]
+        if not rows:
+            return 0
+        with self.lock, self.conn:
+            self.conn.executemany(SQL_DELETE_TEMPLATES_BY_KEY, rows)
+            return self.conn.executemany(SQL_DELETE_USER_BY_KEY, rows).rowcount
+
+    def employee_keys(self):
+        with self.lock:
+            return {row[0] for row in self.conn.execute(
+                'SELECT employee_key FROM fingerprint_users WHERE employee_key IS NOT NULL')}
+
+    def roster(self):
+        """(employeeId, name) of every active locally enrolled employee - no template reads"""
+        with self.lock:
+            return self.conn.execute(
+                'SELECT user_id, user_name FROM fingerprint_users WHERE is_active = 1 ORDER BY user_id').fetchall()
+
+    def load_gallery(self, active_only=False, partitions=()):
+        """
+        Every locally stored template (only those of partitions, if given), ordered by
+        employee then template index
+        Returns dicts: employee_key, employeeId, firstName, lastName, partition, templateIndex, template
+        """
+        scope, params = _partition_scope(partitions)
+        with self.lock:
+            rows = self.conn.execute(SQL_LOAD_GALLERY.format(scope=scope), params).fetchall()
+        return [self._gallery_entry(row) for row in rows if row[4] or not active_only]
+
+    @staticmethod
+    def _gallery_entry(row):
+        employee_key, user_id, first_name, last_name, is_active, template_index, template, partition = row
+        return {
+            "employee_key": employee_key,
+            "employeeId": user_id,
+            "firstName": first_name,
+            "lastName": last_name,
+            "partition": partition,
+            "templateIndex": template_index,
+            "template": bytes(template)
+        }
+
+    def template_count(self, partitions=()):
+        """Number of stored templates (what a full gallery load would put in the SDK cache)"""
+        scope, params = _partition_scope(partitions)
+        with self.lock:
+            return self.conn.execute(SQL_COUNT_TEMPLATES.format(scope=scope), params).fetchone()[0]
+
+    def load_employees(self, employee_keys):
+        """Gallery entries of the given employees (by MongoDB _id string), ordered by template index"""
+        keys = list(employee_keys)
+        entries = []
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            with self.lock:
+                rows = self.conn.execute(
+                    f'''SELECT u.employee_key, u.user_id, u.first_name, u.last_name, u.is_active,
+                               t.template_index, t.template, u.partition_key
+                        FROM fingerprint_users u
+                        JOIN fingerprint_templates t ON t.user_id = u.user_id
+                        WHERE u.employee_key IN ({placeholders})
+                        ORDER BY u.user_id, t.template_index''', batch).fetchall()
+            entries.extend(self._gallery_entry(row) for row in rows)
+        return entries
+
+    def iter_gallery_chunks(self, chunk_size, exclude_keys=(), partitions=(), exclude_partitions=(),
+                            active_only=False):
+        """
+        Yield the gallery in lists of at most chunk_size entries, skipping exclude_keys;
+        partitions / exclude_partitions restrict it to or leave out gallery partitions
+        Only one chunk is held in memory at a time
+        """
+        exclude_keys = set(exclude_keys)
+        scope, params = _partition_scope(partitions, exclude_partitions)
+        sql = SQL_LOAD_GALLERY_CHUNK.format(scope=scope)
+        after = ('', -1)
+        while True:
+            with self.lock:
+                rows = self.conn.execute(sql, (*params, *after, chunk_size)).fetchall()
+            if not rows:
+                return
+            after = (rows[-1][1], rows[-1][5])
+            chunk = [self._gallery_entry(row) for row in rows
+                     if row[0] not in exclude_keys and (row[4] or not active_only)]
+            if chunk:
+                yield chunk
+
+    def sync(self, db, full=False):
+        """
+        Pull template changes from MongoDB
+        Incremental sync fetches only employees whose updatedAt moved past the cursor;
+        the ID reconcile runs on full syncs and every RECONCILE_INTERVAL
+        Returns stats dict
+        """
+        stats = {"upserted": 0, "deleted": 0, "full": False, "reconciled": False}
+        now = datetime.utcnow()
+        # Partition values of already synced employees are stale if the field changed
+        full = full or self.get_state(PARTITION_FIELD_KEY) != PARTITION_FIELD
+        cursor_value = None if full else self.get_state(CURSOR_KEY)
+
+        if cursor_value is None:
+            stats["full"] = True
+            query = ENROLLED_EMPLOYEE_QUERY
+        else:
+            query = {"updatedAt": {"$gt": datetime.fromisoformat(cursor_value)}}
+
+        upserts = []
+        removed = []
+        max_updated = None
+        for employee in db.employees.find(query, SYNC_PROJECTION):
+            updated_at = employee.get('updatedAt')
+            if isinstance(updated_at, datetime):
+                updated_at = _utc_naive(updated_at)
+                max_updated = updated_at if max_updated is None else max(max_updated, updated_at)
+            user = self._user_from_employee(employee)
+            if user:
+                upserts.append(user)
+            else:
+                removed.append(str(employee['_id']))
+
+        stats["upserted"] = self.upsert_users(upserts)
+        stats["deleted"] = self.delete_employees(removed)
+
+        last_reconcile = self.get_state(RECONCILED_KEY)
+        if stats["full"] or last_reconcile is None or \
+                now - datetime.fromisoformat(last_reconcile) >= RECONCILE_INTERVAL:
+            reconciled = self._reconcile(db)
+            stats["upserted"] += reconciled["upserted"]
+            stats["deleted"] += reconciled["deleted"]
+            stats["reconciled"] = True
+
+        with self.lock, self.conn:
+            if stats["full"]:
+                # Everything enrolled is now local; start incremental syncs from now
+                max_updated = max_updated or now
+                self._set_state(PARTITION_FIELD_KEY, PARTITION_FIELD)
+            if max_updated is not None:
+                # Never move the cursor past our own clock (some writers store Manila time as UTC)
+                self._set_state(CURSOR_KEY, min(max_updated, now).isoformat())
+            if stats["reconciled"]:
+                self._set_state(RECONCILED_KEY, now.isoformat())
+        return stats
+
+    def _reconcile(self, db):
+        """Compare enrolled IDs with the replica; fetch missing employees, drop stale ones"""
+        remote = {str(doc['_id']): doc['_id'] for doc in db.employees.find(ENROLLED_EMPLOYEE_QUERY, {"_id": 1})}
+        local = self.employee_keys()
+
+        missing = [remote[key] for key in remote.keys() - local]
+        upserts = []
+        if missing:
+            for employee in db.employees.find({"_id": {"$in": missing}}, SYNC_PROJECTION):
+                user = self._user_from_employee(employee)
+                if user:
+                    upserts.append(user)
+
+        return {
+            "upserted": self.upsert_users(upserts),
+            "deleted": self.delete_employees(local - remote.keys())
+        }
+
+    @staticmethod
+    def _user_from_employee(employee):
+        """Replica row for an employee document, or None if it has no usable template"""
+        if not employee.get('fingerprintEnrolled'):
+            return None
+        templates = list(iter_employee_templates(employee))
+        if not templates:
+            return None
+        first_name = employee.get('firstName', '')
+        last_name = employee.get('lastName', '')
+        return {
+            "user_id": employee.get('employeeId') or str(employee['_id']),
+            "user_name": f"{first_name} {last_name}".strip(),
+            "first_name": first_name,
+            "last_name": last_name,
+            "employee_key": str(employee['_id']),
+            "is_active": employee.get('isActive', True) is not False,
+            "partition_key": partition_value(employee),
+            "templates": templates
+        }
+
+def sync_local_replica(db, path=DEFAULT_DB_PATH):
+    """
+    Sync the replica (only changed employees cross the network) and return it
+    If MongoDB is unreachable the last synced copy is kept
+    """
+    replica = get_replica(path)
+    try:
+        stats = replica.sync(db)
+        if stats["upserted"] or stats["deleted"]:
+            log(f"🔄 Template replica synced: {stats['upserted']} updated, {stats['deleted']} removed")
+    except Exception as e:
+        log(f"⚠️  Template replica sync failed, using local copy: {str(e)}")
+    return replica
+
+def load_local_gallery(db, active_only=False, path=DEFAULT_DB_PATH, partitions=()):
+    """Gallery for the matchers: sync the replica and read templates from local disk"""
+    return sync_local_replica(db, path).load_gallery(active_only, partitions)
+
+def main():
+    """Main entry point - sync the replica now"""
+    parser = argparse.ArgumentParser(description="Sync the local fingerprint template replica from MongoDB")
+    parser.add_argument('--full', action='store_true', help="Ignore the sync cursor and reload every template")
+    parser.add_argument('--path', default=DEFAULT_DB_PATH, help="Replica database file")
+    args = parser.parse_args()
+
+    from integrated_capture import get_database_connection
+
+    db, client, connection_error = get_database_connection()
+    if connection_error:
+        print(json.dumps({"success": False, "message": connection_error}))
+        sys.exit(1)
+
+    try:
+        replica = get_replica(args.path)
+        stats = replica.sync(db, full=args.full)
+        result = {
+            "success": True,
+            "message": f"Replica synced ({stats['upserted']} updated, {stats['deleted']} removed)",
+            "templates": len(replica.load_gallery()),
+            **stats
+        }
+    except Exception as e:
+        result = {"success": False, "message": f"Replica sync failed: {str(e)}"}
+    finally:
+        client.close()
+
+    print(json.dumps(result))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
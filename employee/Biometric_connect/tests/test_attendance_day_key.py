@@ -0,0 +1,112 @@
+"""Manila day keys and the dayKey backfill"""
+
+import os
+import sys
+import unittest
+from datetime import datetime
+
+import pytz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from attendance_day_key import manila_day_key, backfill_day_keys, DAY_KEY_INDEX_NAME
+
+def matches(doc, query):
+    for field, condition in query.items():
+        if isinstance(condition, dict) and "$exists" in condition:
+            if (field in doc) != condition["$exists"]:
+                return False
+        elif isinstance(condition, dict) and "$type" in condition:
+            if not isinstance(doc.get(field), str):
+                return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+class FakeCursor(list):
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            # Missing values sort first, as in MongoDB
+            self[:] = sorted(self, key=lambda doc: (doc.get(field) is not None, doc.get(field)),
+                             reverse=direction < 0)
+        return self
+
+    def batch_size(self, size):
+        return self
+
+class FakeCollection:
+    """The few collection calls backfill_day_keys makes, over a list of dicts"""
+
+    def __init__(self, docs=()):
+        self.docs = [dict(doc) for doc in docs]
+        self.indexes = []
+
+    def find(self, query, projection=None):
+        return FakeCursor(dict(doc) for doc in self.docs if matches(doc, query))
+
+    def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            for doc in self.docs:
+                if matches(doc, operation._filter):
+                    doc.update(operation._doc["$set"])
+
+    def create_index(self, keys, **options):
+        self.indexes.append(options["name"])
+
+class FakeDatabase:
+    def __init__(self, employees, attendances):
+        self.employees = FakeCollection(employees)
+        self.attendances = FakeCollection(attendances)
+
+class ManilaDayKeyTest(unittest.TestCase):
+    def test_rolls_over_at_manila_midnight(self):
+        manila = pytz.timezone('Asia/Manila')
+        self.assertEqual(manila_day_key(manila.localize(datetime(2025, 10, 15, 23, 59, 59))), "2025-10-15")
+        self.assertEqual(manila_day_key(manila.localize(datetime(2025, 10, 16, 0, 0))), "2025-10-16")
+
+    def test_naive_values_are_utc(self):
+        # 15:59 UTC is 23:59 in Manila, 16:00 UTC is the next Manila day
+        self.assertEqual(manila_day_key(datetime(2025, 10, 15, 15, 59)), "2025-10-15")
+        self.assertEqual(manila_day_key(datetime(2025, 10, 15, 16, 0)), "2025-10-16")
+
+    def test_aware_values_in_other_zones(self):
+        self.assertEqual(manila_day_key(pytz.utc.localize(datetime(2025, 10, 15, 16, 30))), "2025-10-16")
+
+class BackfillDayKeysTest(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeDatabase(
+            employees=[{"_id": "oid-1", "employeeId": "EMP001"}],
+            attendances=[
+                {"_id": 1, "employee": "oid-1", "timeIn": datetime(2025, 10, 15, 0, 30)},
+                # Same Manila day, later: conflicts with record 1
+                {"_id": 2, "employeeId": "EMP001", "timeIn": datetime(2025, 10, 15, 9, 0)},
+                # 16:30 UTC is already the 16th in Manila
+                {"_id": 3, "employee": "oid-1", "timeIn": datetime(2025, 10, 15, 16, 30)},
+                # Day already keyed by an existing record
+                {"_id": 4, "employee": "oid-1", "date": datetime(2025, 10, 17, 1, 0)},
+                {"_id": 5, "employee": "oid-1", "dayKey": "2025-10-17"},
+                # No way to tell whose record this is
+                {"_id": 6, "employeeId": "EMP999", "timeIn": datetime(2025, 10, 15, 1, 0)},
+            ]
+        )
+
+    def keys(self):
+        return {doc["_id"]: doc.get("dayKey") for doc in self.db.attendances.docs}
+
+    def test_backfill_keeps_earliest_and_reports_conflicts(self):
+        stats = backfill_day_keys(self.db)
+        self.assertEqual(stats["scanned"], 5)
+        self.assertEqual(stats["updated"], 2)
+        self.assertEqual(self.keys(), {1: "2025-10-15", 2: None, 3: "2025-10-16", 4: None, 5: "2025-10-17", 6: None})
+        self.assertEqual(sorted(c["_id"] for c in stats["conflicts"]), ["2", "4"])
+        self.assertEqual(stats["unresolved"], ["6"])
+        self.assertEqual(self.db.attendances.indexes, [DAY_KEY_INDEX_NAME])
+
+    def test_dry_run_writes_nothing(self):
+        stats = backfill_day_keys(self.db, dry_run=True)
+        self.assertEqual(stats["updated"], 2)
+        self.assertEqual(self.keys()[1], None)
+        self.assertEqual(self.db.attendances.indexes, [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+"""Capture quality gate on synthetic sensor images"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import capture_quality
+from capture_quality import assess_capture, image_shape
+
+HEIGHT, WIDTH = 400, 300  # ZK9500
+BACKGROUND = 230
+
+def ridges(height=HEIGHT, width=WIDTH, period=8.0):
+    """Dark finger with sharp-edged ridges, like a good press"""
+    y, x = np.mgrid[0:height, 0:width]
+    return 110 + 70 * np.sign(np.sin(2 * np.pi * (x + 0.3 * y) / period))
+
+def to_image(pixels):
+    return np.clip(pixels, 0, 255).astype(np.uint8).tobytes()
+
+def background():
+    return np.full((HEIGHT, WIDTH), BACKGROUND, dtype=np.float64)
+
+class FakeDevice:
+    width = WIDTH
+    height = HEIGHT
+
+class AssessCaptureTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(capture_quality, "QUALITY_GATE_ENABLED", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_good_capture_passes(self):
+        pixels = background()
+        pixels[40:360, 30:270] = ridges()[40:360, 30:270]
+        result = assess_capture(to_image(pixels))
+        self.assertTrue(result["ok"], result)
+        self.assertIsNone(result["reason"])
+        self.assertGreater(result["coverage"], 0.5)
+
+    def test_faint_capture_rejected(self):
+        rng = np.random.default_rng(0)
+        pixels = background() - 10 + rng.normal(0, 3, (HEIGHT, WIDTH))
+        result = assess_capture(to_image(pixels))
+        self.assertFalse(result["ok"])
+        self.assertIn("faint", result["reason"])
+
+    def test_partial_finger_rejected(self):
+        pixels = background()
+        pixels[:120, :120] = ridges()[:120, :120]
+        pixels[300:, 200:] = 20  # dark edge keeps the contrast up
+        result = assess_capture(to_image(pixels))
+        self.assertFalse(result["ok"])
+        self.assertIn("part of the finger", result["reason"])
+        self.assertLess(result["coverage"], capture_quality.MIN_COVERAGE)
+
+    def test_blurred_capture_rejected(self):
+        y, x = np.mgrid[0:HEIGHT, 0:WIDTH]
+        # A smooth dark blob: plenty of contrast and coverage, no ridge edges
+        blob = np.exp(-(((y - 200) / 180.0) ** 2 + ((x - 150) / 140.0) ** 2))
+        pixels = BACKGROUND - 150 * blob
+        result = assess_capture(to_image(pixels))
+        self.assertFalse(result["ok"])
+        self.assertIn("blurred", result["reason"])
+
+    def test_unknown_size_is_let_through(self):
+        result = assess_capture(bytes(1000))
+        self.assertTrue(result["ok"])
+        self.assertIsNone(result["contrast"])
+
+    def test_gate_off_lets_everything_through(self):
+        with mock.patch.object(capture_quality, "QUALITY_GATE_ENABLED", False):
+            self.assertTrue(assess_capture(to_image(background()))["ok"])
+
+    def test_image_shape_prefers_device_size(self):
+        self.assertEqual(image_shape(bytes(WIDTH * HEIGHT), FakeDevice()), (HEIGHT, WIDTH))
+        self.assertEqual(image_shape(bytes(280 * 360)), (360, 280))
+        self.assertIsNone(image_shape(bytes(10)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+"""Duplicate audit shard search and checkpoints against a fake ZKFP2"""
+
+import os
+import sys
+import types
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import check_duplicate_fingerprints as audit
+
+class FakeZKFP2:
+    """SDK cache where identical templates match; b"BAD" is rejected, reload_failures fail once each"""
+    reload_failures = set()
+
+    def __init__(self):
+        self.cache = {}
+        self.added = set()
+
+    def Init(self):
+        pass
+
+    def Terminate(self):
+        pass
+
+    def DBInit(self):
+        return 1
+
+    def DBFree(self):
+        self.cache = {}
+
+    def DBAdd(self, fid, template):
+        if template == b"BAD":
+            raise Exception("Invalid template")
+        if fid in self.added and fid in FakeZKFP2.reload_failures:
+            FakeZKFP2.reload_failures.discard(fid)
+            raise Exception("DBAdd failed")
+        self.added.add(fid)
+        self.cache[fid] = template
+
+    def DBDel(self, fid):
+        del self.cache[fid]
+
+    def DBIdentify(self, template):
+        if template == b"BAD":
+            raise Exception("Invalid template")
+        for fid, cached in self.cache.items():
+            if cached == template:
+                return fid, 90
+        return 0, 0
+
+ENTRIES = [
+    (1, "a", 0, b"X"),
+    (2, "b", 0, b"X"),
+    (3, "c", 0, b"Y"),
+    (4, "d", 0, b"BAD"),
+    (5, "e", 0, b"Y"),
+]
+
+class AuditShardTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(sys.modules, {"pyzkfp": types.SimpleNamespace(ZKFP2=FakeZKFP2)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        FakeZKFP2.reload_failures = set()
+        audit._init_worker(ENTRIES)
+
+    def pairs(self, matches):
+        return {tuple(sorted((match["probeFid"], match["matchFid"]))) for match in matches}
+
+    def test_reports_cross_employee_matches(self):
+        shard_index, matches, identifies, skipped = audit.audit_shard(0, ENTRIES, 0)
+        self.assertEqual(self.pairs(matches), {(1, 2), (3, 5)})
+        self.assertEqual([(entry["fid"], entry["stage"]) for entry in skipped], [(4, "load"), (4, "identify")])
+
+    def test_failed_reload_is_skipped_not_fatal(self):
+        FakeZKFP2.reload_failures = {2}
+        shard_index, matches, identifies, skipped = audit.audit_shard(0, ENTRIES, 0)
+        self.assertIn((3, 5), self.pairs(matches))
+        self.assertIn((2, "reload"), [(entry["fid"], entry["stage"]) for entry in skipped])
+
+    def test_min_score(self):
+        self.assertEqual(audit.audit_shard(0, ENTRIES, 95)[1], [])
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "checkpoint.json")
+
+    def test_round_trip(self):
+        digest = audit.gallery_digest(ENTRIES)
+        audit.save_checkpoint(self.path, {"galleryDigest": digest, "gallerySize": 5, "shards": 2,
+                                          "completedShards": [1]})
+        self.assertEqual(audit.load_checkpoint(self.path, 5, 2, digest)["completedShards"], [1])
+
+    def test_refuses_a_different_gallery(self):
+        audit.save_checkpoint(self.path, {"galleryDigest": audit.gallery_digest(ENTRIES),
+                                          "gallerySize": 5, "shards": 2})
+        changed = ENTRIES[:2] + [(3, "c", 0, b"Z")] + ENTRIES[3:]
+        with self.assertRaises(ValueError):
+            audit.load_checkpoint(self.path, 5, 2, audit.gallery_digest(changed))
+        with self.assertRaises(ValueError):
+            audit.load_checkpoint(self.path, 5, 3, audit.gallery_digest(ENTRIES))
+
+    def test_missing_checkpoint(self):
+        self.assertIsNone(audit.load_checkpoint(self.path, 5, 2, "digest"))
+
+    def test_default_checkpoint_next_to_script(self):
+        self.assertEqual(os.path.dirname(audit.DEFAULT_CHECKPOINT), os.path.dirname(os.path.abspath(audit.__file__)))
+
+if __name__ == "__main__":
+    unittest.main()
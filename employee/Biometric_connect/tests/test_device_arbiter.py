@@ -0,0 +1,106 @@
+"""Device arbiter scheduling against a fake ZKFP2"""
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from device_arbiter import DeviceArbiter, DeviceUnavailable, PRIORITY_ATTENDANCE, PRIORITY_ENROLLMENT
+
+class FakeZKFP2:
+    """AcquireFingerprint returns nothing until a finger is placed"""
+
+    def __init__(self):
+        self.finger = None
+        self.polls = 0
+
+    def AcquireFingerprint(self):
+        self.polls += 1
+        finger, self.finger = self.finger, None
+        return finger
+
+class DeviceArbiterTest(unittest.TestCase):
+    def setUp(self):
+        self.zkfp2 = FakeZKFP2()
+        self.arbiter = DeviceArbiter(log=lambda message: None)
+        self.arbiter.attach(self.zkfp2)
+        self.addCleanup(self.arbiter.stop)
+
+    def hold_worker(self):
+        """Occupy the worker until the returned event is set"""
+        started, release = threading.Event(), threading.Event()
+
+        def blocking(zkfp2):
+            started.set()
+            release.wait(5)
+        self.arbiter.call(PRIORITY_ENROLLMENT, blocking)
+        self.assertTrue(started.wait(5))
+        return release
+
+    def test_priority_then_fifo(self):
+        order = []
+        release = self.hold_worker()
+        requests = [
+            self.arbiter.call(PRIORITY_ENROLLMENT, lambda z: order.append("enroll-1")),
+            self.arbiter.call(PRIORITY_ATTENDANCE, lambda z: order.append("attend-1")),
+            self.arbiter.call(PRIORITY_ENROLLMENT, lambda z: order.append("enroll-2")),
+            self.arbiter.call(PRIORITY_ATTENDANCE, lambda z: order.append("attend-2")),
+        ]
+        release.set()
+        for request in requests:
+            self.assertTrue(request.done.wait(5))
+        self.assertEqual(order, ["attend-1", "attend-2", "enroll-1", "enroll-2"])
+
+    def test_call_returns_value_and_raises_errors(self):
+        self.assertIs(self.arbiter.call(PRIORITY_ATTENDANCE, lambda z: z).result(5), self.zkfp2)
+        failing = self.arbiter.call(PRIORITY_ATTENDANCE, lambda z: 1 / 0)
+        with self.assertRaises(ZeroDivisionError):
+            failing.result(5)
+
+    def test_capture_returns_when_finger_placed(self):
+        request = self.arbiter.capture(PRIORITY_ATTENDANCE, timeout=5)
+        self.zkfp2.finger = (b"template", b"image")
+        self.assertEqual(request.result(5), (b"template", b"image"))
+
+    def test_cancelled_capture_stops_polling(self):
+        request = self.arbiter.capture(PRIORITY_ATTENDANCE, timeout=30)
+        request.cancel()
+        self.assertTrue(request.done.wait(2))
+        self.assertIsNone(request.result())
+        polls = self.zkfp2.polls
+        self.assertIsNone(self.arbiter.call(PRIORITY_ATTENDANCE, lambda z: None).result(5))
+        self.assertEqual(self.zkfp2.polls, polls)
+
+    def test_cancelled_call_is_not_run(self):
+        ran = []
+        release = self.hold_worker()
+        request = self.arbiter.call(PRIORITY_ATTENDANCE, lambda z: ran.append(True))
+        request.cancel()
+        release.set()
+        self.assertTrue(request.done.wait(5))
+        self.assertEqual(ran, [])
+
+    def test_attendance_capture_takes_sensor_from_enrollment(self):
+        release = self.hold_worker()
+        enrollment = self.arbiter.capture(PRIORITY_ENROLLMENT, timeout=5)
+        attendance = self.arbiter.capture(PRIORITY_ATTENDANCE, timeout=5)
+        self.zkfp2.finger = (b"attendance", b"image")
+        release.set()
+        self.assertEqual(attendance.result(5), (b"attendance", b"image"))
+        self.assertFalse(enrollment.done.is_set())
+        enrollment.cancel()
+
+    def test_detach_fails_pending_requests(self):
+        release = self.hold_worker()
+        pending = self.arbiter.call(PRIORITY_ATTENDANCE, lambda z: None)
+        threading.Timer(0.1, release.set).start()
+        self.assertIs(self.arbiter.detach(), self.zkfp2)
+        with self.assertRaises(DeviceUnavailable):
+            pending.result(5)
+        with self.assertRaises(DeviceUnavailable):
+            self.arbiter.call(PRIORITY_ATTENDANCE, lambda z: None).result(5)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""Shared-memory gallery snapshot: generation handover between publisher and reader"""
+
+import os
+import sys
+import uuid
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gallery_snapshot
+from gallery_snapshot import GallerySnapshotPublisher, GallerySnapshotReader
+from fingerprint_templates import TEMPLATE_SIZE
+
+def make_entries(*fill_bytes):
+    return [{
+        "employee_key": f"{index:024x}",
+        "employeeId": f"EMP{index:03d}",
+        "firstName": "Juan",
+        "lastName": "Dela Cruz",
+        "templateIndex": 0,
+        "template": bytes([fill]) * TEMPLATE_SIZE
+    } for index, fill in enumerate(fill_bytes)]
+
+def templates(gallery):
+    return [bytes(entry["template"][:1]) for entry in gallery]
+
+class GallerySnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.name = f"fpgs_test_{uuid.uuid4().hex[:8]}"
+        self.publisher = GallerySnapshotPublisher(self.name)
+        self.addCleanup(lambda: self.publisher.close())
+
+    def reader(self):
+        reader = GallerySnapshotReader(self.name)
+        self.addCleanup(reader.close)
+        return reader
+
+    def test_reader_sees_published_generation(self):
+        self.publisher.publish(make_entries(1, 2))
+        reader = self.reader()
+        self.assertEqual(reader.generation, 1)
+        gallery = reader.gallery()
+        self.assertIsInstance(gallery[0]["template"], memoryview)
+        self.assertEqual(templates(gallery), [b"\x01", b"\x02"])
+        self.assertEqual(gallery[1]["employeeId"], "EMP001")
+        self.assertEqual(reader.entries()[0]["template"], bytes([1]) * TEMPLATE_SIZE)
+
+    def test_same_list_until_new_generation(self):
+        self.publisher.publish(make_entries(1))
+        reader = self.reader()
+        first = reader.gallery()
+        self.assertFalse(reader.refresh())
+        self.assertIs(reader.gallery(), first)
+
+        self.publisher.publish(make_entries(3, 4))
+        self.assertTrue(reader.refresh())
+        second = reader.gallery()
+        self.assertIsNot(second, first)
+        self.assertEqual(reader.generation, 2)
+        self.assertEqual(templates(second), [b"\x03", b"\x04"])
+        # The superseded generation stays readable while its templates are held
+        self.assertEqual(templates(first), [b"\x01"])
+        self.assertEqual(len(reader.retired), 1)
+        del first
+        reader.refresh()
+        self.assertEqual(reader.retired, [])
+
+    def test_refresh_does_not_reattach_control(self):
+        self.publisher.publish(make_entries(1))
+        reader = self.reader()
+        with mock.patch.object(gallery_snapshot, "_attach", wraps=gallery_snapshot._attach) as attach:
+            for _ in range(5):
+                reader.refresh()
+            self.publisher.publish(make_entries(2))
+            reader.refresh()
+        self.assertEqual([call.args[0] for call in attach.call_args_list], [f"{self.name}_g2"])
+
+    def test_reader_follows_restarted_publisher(self):
+        self.publisher.publish(make_entries(1))
+        reader = self.reader()
+        self.publisher.close()
+        self.assertFalse(reader.refresh())
+        self.assertEqual(templates(reader.gallery()), [b"\x01"])
+
+        self.publisher = GallerySnapshotPublisher(self.name)
+        self.publisher.publish(make_entries(5))
+        self.assertTrue(reader.refresh())
+        self.assertEqual(templates(reader.gallery()), [b"\x05"])
+
+    def test_takeover_continues_generations_and_frees_old_data(self):
+        self.publisher.publish(make_entries(1))
+        reader = self.reader()
+        # A publisher that died without closing: its successor takes the segments over
+        dead = self.publisher
+        self.publisher = GallerySnapshotPublisher(self.name)
+        self.assertEqual(self.publisher.generation, 1)
+        self.assertIsNotNone(self.publisher.current)
+        self.assertEqual(self.publisher.publish(make_entries(6)), 2)
+        if os.name != "nt":
+            with self.assertRaises(FileNotFoundError):
+                gallery_snapshot._attach(f"{self.name}_g1")
+        self.assertTrue(reader.refresh())
+        self.assertEqual(templates(reader.gallery()), [b"\x06"])
+        dead.current.close()
+        dead.control.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+"""Repeat-scan debounce cache on a throwaway replica database"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from template_replica import TemplateReplica
+from scan_debounce import ScanDebounceCache
+
+class ScanDebounceCacheTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.replica = TemplateReplica(os.path.join(tmp.name, "replica.db"))
+        self.addCleanup(self.replica.close)
+        self.cache = ScanDebounceCache(self.replica, ttl=60)
+
+    def test_repeat_scan_inside_window_is_debounced(self):
+        self.cache.put("emp-1", "time_in", {"action": "time_in", "success": True}, now=1000)
+        result = self.cache.get("emp-1", now=1059)
+        self.assertEqual(result, {"action": "time_in", "success": True, "debounced": True})
+
+    def test_entry_expires_after_window(self):
+        self.cache.put("emp-1", "time_in", {"action": "time_in"}, now=1000)
+        self.assertIsNone(self.cache.get("emp-1", now=1060.5))
+
+    def test_latest_action_wins(self):
+        self.cache.put("emp-1", "time_in", {"action": "time_in"}, now=1000)
+        self.cache.put("emp-1", "time_out", {"action": "time_out"}, now=1030)
+        self.assertEqual(self.cache.get("emp-1", now=1040)["action"], "time_out")
+        self.assertIsNone(self.cache.get("emp-2", now=1040))
+
+    def test_put_purges_expired_rows(self):
+        self.cache.put("emp-1", "time_in", {"action": "time_in"}, now=1000)
+        self.cache.put("emp-2", "time_in", {"action": "time_in"}, now=1100)
+        rows = self.replica.conn.execute("SELECT employee_key FROM scan_debounce").fetchall()
+        self.assertEqual(rows, [("emp-2",)])
+
+    def test_zero_window_disables_cache(self):
+        cache = ScanDebounceCache(self.replica, ttl=0)
+        cache.put("emp-1", "time_in", {"action": "time_in"}, now=1000)
+        self.assertIsNone(cache.get("emp-1", now=1000))
+
+if __name__ == "__main__":
+    unittest.main()
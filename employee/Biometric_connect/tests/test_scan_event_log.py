@@ -0,0 +1,91 @@
+"""Scan event log: append / read round trip, segment rollover and a failed rollover"""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scan_event_log
+from scan_event_log import ScanEvent, ScanEventLog, read_scan_events, load_scan_events, summarize
+
+EMPLOYEE = "65a1b2c3d4e5f6a7b8c9d0e1"
+
+def make_event(fid, outcome="match", tier="hot"):
+    event = ScanEvent()
+    event.employee = EMPLOYEE if outcome == "match" else None
+    event.fid = fid
+    event.score = 80 if outcome == "match" else 12
+    event.outcome = outcome
+    event.tier = tier
+    event.stages["identify"] = 5.0
+    return event
+
+class ScanEventLogTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.log = ScanEventLog(self.tmp.name, device="kiosk-1", segment_records=4)
+        self.addCleanup(self.log.close)
+
+    def test_round_trip(self):
+        self.log.append(make_event(7))
+        self.log.append(make_event(0, outcome="no_match", tier="cold"))
+        events = read_scan_events(self.log.segment_path(0))
+        self.assertEqual(len(events), 2)
+        self.assertEqual(events["fid"].tolist(), [7, 0])
+        self.assertEqual(events["device"][0], b"kiosk-1")
+        self.assertEqual(events["employee"][0].hex(), EMPLOYEE)
+        self.assertEqual(scan_event_log.OUTCOMES[events["outcome"][1]], "no_match")
+        self.assertEqual(scan_event_log.TIERS[events["tier"][1]], "cold")
+        self.assertAlmostEqual(float(events["identify_ms"][0]), 5.0)
+        del events
+
+    def test_rolls_over_to_new_segment_without_resizing(self):
+        size = os.path.getsize(self.log.segment_path(0))
+        for fid in range(10):
+            self.log.append(make_event(fid))
+        self.assertEqual(sorted(self.log.segments()), [0, 1, 2])
+        self.assertEqual(os.path.getsize(self.log.segment_path(0)), size)
+        events = load_scan_events(self.tmp.name)
+        self.assertEqual(events["fid"].tolist(), list(range(10)))
+        self.assertEqual(summarize(events)["outcomes"]["match"], 10)
+        del events
+
+    def test_second_process_continues_in_latest_segment(self):
+        for fid in range(5):
+            self.log.append(make_event(fid))
+        other = ScanEventLog(self.tmp.name, device="kiosk-1", segment_records=4)
+        self.addCleanup(other.close)
+        self.assertEqual(other.index, 1)
+        other.append(make_event(5))
+        self.log.append(make_event(6))
+        events = load_scan_events(self.tmp.name)
+        self.assertEqual(sorted(events["fid"].tolist()), list(range(7)))
+        del events
+
+    def test_failed_rollover_drops_only_that_event(self):
+        for fid in range(4):
+            self.log.append(make_event(fid))
+        real_open = os.open
+        calls = []
+
+        def failing_open(path, *args, **kwargs):
+            calls.append(path)
+            if len(calls) == 1:
+                raise OSError("disk full")
+            return real_open(path, *args, **kwargs)
+
+        with mock.patch.object(scan_event_log.os, "open", failing_open):
+            with self.assertRaises(OSError):
+                self.log.append(make_event(4))
+            self.log.append(make_event(5))
+        self.assertEqual(self.log.index, 1)
+        events = load_scan_events(self.tmp.name)
+        self.assertEqual(events["fid"].tolist(), [0, 1, 2, 3, 5])
+        del events
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+"""Tiered gallery and chunked search against a fake ZKFP2 and a throwaway replica"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from template_replica import TemplateReplica
+from tiered_gallery import TieredGallery, search_chunks, hot_tier_keys, COLD_FID_BASE
+
+class FakeZKFP2:
+    """SDK cache where a template matches only an identical template"""
+
+    def __init__(self):
+        self.cache = {}
+        self.identify_sizes = []  # templates scanned by each DBIdentify
+        self.peak = 0
+
+    def DBInit(self):
+        return 1
+
+    def DBFree(self, handle=None):
+        self.cache = {}
+
+    def DBAdd(self, fid, template):
+        if not template:
+            raise Exception("Invalid template")
+        self.cache[fid] = bytes(template)
+        self.peak = max(self.peak, len(self.cache))
+
+    def DBDel(self, fid):
+        del self.cache[fid]
+
+    def DBIdentify(self, template):
+        self.identify_sizes.append(len(self.cache))
+        for fid, cached in self.cache.items():
+            if cached == template:
+                return fid, 90
+        return 0, 0
+
+def template_of(number, index=0):
+    return f"{number}:{index}".encode().ljust(16, b"\0")
+
+def employee_key(number):
+    return f"{number:024x}"
+
+def make_replica(path, employees, partition_of=lambda number: "Main"):
+    replica = TemplateReplica(path)
+    replica.upsert_users({
+        "user_id": f"EMP{number:04d}",
+        "user_name": f"Employee {number}",
+        "first_name": "Employee",
+        "last_name": str(number),
+        "employee_key": employee_key(number),
+        "partition_key": partition_of(number),
+        "templates": [(index, template_of(number, index)) for index in range(templates)]
+    } for number, templates in employees)
+    return replica
+
+class SearchChunksTest(unittest.TestCase):
+    def test_stops_at_first_matching_chunk_and_cleans_up(self):
+        zkfp2 = FakeZKFP2()
+        chunks = [[{"template": template_of(n), "firstName": "E"} for n in range(start, start + 3)]
+                  for start in (0, 3, 6)]
+        found, score, searched, count = search_chunks(zkfp2, iter(chunks), template_of(4))
+        self.assertIs(found, chunks[1][1])
+        self.assertEqual((score, searched, count), (90, 6, 2))
+        self.assertEqual(zkfp2.cache, {})
+        self.assertEqual(zkfp2.identify_sizes, [3, 3])
+
+    def test_rejected_template_is_skipped(self):
+        zkfp2 = FakeZKFP2()
+        chunk = [{"template": b"", "firstName": "Bad"}, {"template": template_of(1), "firstName": "E"}]
+        found, score, searched, count = search_chunks(zkfp2, [chunk], template_of(1))
+        self.assertIs(found, chunk[1])
+        self.assertEqual(searched, 1)
+        self.assertNotIn(COLD_FID_BASE, zkfp2.cache)
+
+    def test_miss_searches_everything(self):
+        zkfp2 = FakeZKFP2()
+        chunks = [[{"template": template_of(n), "firstName": "E"}] for n in range(4)]
+        self.assertEqual(search_chunks(zkfp2, chunks, template_of(99)), (None, 0, 4, 4))
+
+class TieredGalleryTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        # 20 employees with 2 templates each; employees 15-19 are at another site
+        self.replica = make_replica(os.path.join(tmp.name, "replica.db"), [(n, 2) for n in range(20)],
+                                    partition_of=lambda n: "North" if n >= 15 else "Main")
+        self.addCleanup(self.replica.close)
+        self.zkfp2 = FakeZKFP2()
+
+    def tiered(self, **options):
+        return TieredGallery(self.zkfp2, self.replica, hot_capacity=8, chunk_size=4, **options)
+
+    def test_priority_keys_loaded_first(self):
+        tiered = self.tiered()
+        tiered.load([employee_key(12), employee_key(3)])
+        self.assertEqual(len(tiered.hot_map), 8)
+        self.assertEqual(len(self.zkfp2.cache), 8)
+        self.assertIn(employee_key(12), tiered.hot_fids)
+        self.assertIn(employee_key(3), tiered.hot_fids)
+        # Priority employees are evicted last, the most important one last of all
+        self.assertEqual(list(tiered.hot_fids)[-2:], [employee_key(3), employee_key(12)])
+
+    def test_hot_hit_searches_hot_tier_only(self):
+        tiered = self.tiered()
+        tiered.load([employee_key(12)])
+        employee, score, tier = tiered.identify(template_of(12, 1))
+        self.assertEqual((str(employee["_id"]), score, tier), (employee_key(12), 90, "hot"))
+        self.assertEqual(self.zkfp2.identify_sizes, [8])
+
+    def test_cold_hit_searches_chunks_alone_and_promotes(self):
+        tiered = self.tiered()
+        tiered.load()
+        hot_before = set(tiered.hot_fids)
+        employee, score, tier = tiered.identify(template_of(13))
+        self.assertEqual((str(employee["_id"]), tier), (employee_key(13), "cold"))
+        # Hot tier out of the cache while chunks are searched: never hot + chunk
+        self.assertTrue(all(size <= 4 for size in self.zkfp2.identify_sizes[1:]))
+        self.assertLessEqual(self.zkfp2.peak, 8)
+        # Promoted in, least recently matched evicted, and the cache matches the tier
+        self.assertIn(employee_key(13), tiered.hot_fids)
+        self.assertEqual(len(set(tiered.hot_fids) - hot_before), 1)
+        self.assertEqual(set(self.zkfp2.cache), set(tiered.hot_map))
+        self.assertEqual(tiered.identify(template_of(13))[2], "hot")
+
+    def test_miss_restores_hot_tier(self):
+        tiered = self.tiered()
+        tiered.load()
+        cache = dict(self.zkfp2.cache)
+        self.assertEqual(tiered.identify(template_of(99))[0], None)
+        self.assertEqual(self.zkfp2.cache, cache)
+        self.assertEqual(tiered.totals["cold"][:2], [1, 32])
+
+    def test_one_shot_skips_restore(self):
+        tiered = self.tiered(restore_hot=False)
+        tiered.load()
+        employee, score, tier = tiered.identify(template_of(13))
+        self.assertEqual((str(employee["_id"]), tier), (employee_key(13), "cold"))
+        self.assertEqual(self.zkfp2.cache, {})
+        self.assertEqual(tiered.hot_map, {})
+        self.assertEqual(self.zkfp2.peak, 8)
+
+    def test_partitioned_kiosk_falls_back_to_other_sites(self):
+        tiered = self.tiered(partitions=("Main",))
+        tiered.load([employee_key(17)])
+        self.assertNotIn(employee_key(17), tiered.hot_fids)
+        employee, score, tier = tiered.identify(template_of(17))
+        self.assertEqual((str(employee["_id"]), tier), (employee_key(17), "fallback"))
+        self.assertEqual(tiered.totals["cold"][1], 22)
+
+        no_fallback = TieredGallery(FakeZKFP2(), self.replica, hot_capacity=8, chunk_size=4,
+                                    partitions=("Main",), cross_partition=False)
+        no_fallback.load()
+        self.assertEqual(no_fallback.identify(template_of(17))[0], None)
+
+class HotTierKeysTest(unittest.TestCase):
+    def test_open_shifts_first_then_latest(self):
+        from datetime import datetime
+        records = [
+            {"employee": "a", "timeIn": datetime(2025, 10, 15, 1), "timeOut": datetime(2025, 10, 15, 9)},
+            {"employee": "b", "timeIn": datetime(2025, 10, 15, 0)},
+            {"employee": "c", "timeIn": datetime(2025, 10, 15, 2)},
+            {"employee": "d"},
+        ]
+        self.assertEqual(hot_tier_keys(records), ["c", "b", "a"])
+
+if __name__ == "__main__":
+    unittest.main()
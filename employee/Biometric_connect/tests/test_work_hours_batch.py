@@ -0,0 +1,80 @@
+"""Batch work-hours engine against the per-record calculate_work_hours()"""
+
+import os
+import sys
+import unittest
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from integrated_capture import calculate_work_hours, determine_attendance_status, MANILA_TZ
+from work_hours_batch import calculate_work_hours_batch, recompute_batch
+
+def manila(hour, minute=0, day=15):
+    return MANILA_TZ.localize(datetime(2025, 10, day, hour, minute))
+
+SHIFTS = [
+    (manila(8), manila(17)),            # through lunch
+    (manila(8), manila(12, 30)),        # out during lunch
+    (manila(12, 15), manila(16)),       # in during lunch
+    (manila(12, 10), manila(12, 50)),   # inside lunch
+    (manila(7, 45), manila(11, 50)),    # morning only
+    (manila(13, 5), manila(18, 40)),    # afternoon only
+    (manila(9), manila(13, 0)),         # exactly 4 hours with lunch
+    (manila(22), manila(6, day=16)),    # overnight
+    (manila(8), None),                  # no time out
+    (None, None),
+]
+
+class FakeCollection:
+    def __init__(self):
+        self.operations = []
+
+    def bulk_write(self, operations, ordered=True):
+        self.operations.extend(operations)
+
+class WorkHoursBatchTest(unittest.TestCase):
+    def test_hours_and_status_match_scalar(self):
+        result = calculate_work_hours_batch([s[0] for s in SHIFTS], [s[1] for s in SHIFTS], tz=MANILA_TZ)
+        for (time_in, time_out), hours, status in zip(SHIFTS, result["hours"], result["status"]):
+            expected = calculate_work_hours(time_in, time_out)
+            self.assertAlmostEqual(float(hours), expected, places=6, msg=f"{time_in} - {time_out}")
+            self.assertEqual(str(status), determine_attendance_status(expected))
+
+    def test_utc_values_are_read_as_manila_time(self):
+        shift = SHIFTS[0]
+        utc = [value.astimezone(timezone.utc) for value in shift]
+        result = calculate_work_hours_batch([utc[0]], [utc[1]], tz=MANILA_TZ)
+        self.assertAlmostEqual(float(result["hours"][0]), calculate_work_hours(*shift), places=6)
+
+    def test_iso_strings(self):
+        result = calculate_work_hours_batch(["2025-10-15T08:00:00"], ["2025-10-15T12:30:00"])
+        self.assertAlmostEqual(float(result["hours"][0]), 4.0)
+
+    def test_recompute_only_writes_owned_fields(self):
+        time_in, time_out = manila(8), manila(12, 30)
+        records = [
+            {"_id": 1, "timeIn": time_in, "timeOut": time_out, "status": "present", "actualHoursWorked": 0},
+            {"_id": 2, "timeIn": time_in, "timeOut": time_out, "status": "late", "actualHoursWorked": 0},
+            {"_id": 3, "timeIn": time_in, "timeOut": time_out, "status": "present", "actualHoursWorked": 0,
+             "dayType": "Half Day", "daySalary": 275},
+            {"_id": 4, "timeIn": time_in, "timeOut": time_out, "status": "half-day", "actualHoursWorked": 4.0},
+        ]
+        collection = FakeCollection()
+        updated, skipped = recompute_batch(collection, records)
+        self.assertEqual((updated, skipped), (2, 1))
+        self.assertEqual(collection.operations, [
+            UpdateOne({"_id": 1, "status": "present", "dayType": None},
+                      {"$set": {"actualHoursWorked": 4.0, "status": "half-day"}}),
+            UpdateOne({"_id": 2, "status": "late", "dayType": None}, {"$set": {"actualHoursWorked": 4.0}}),
+        ])
+
+    def test_dry_run_writes_nothing(self):
+        records = [{"_id": 1, "timeIn": manila(8), "timeOut": manila(17), "status": None}]
+        collection = FakeCollection()
+        self.assertEqual(recompute_batch(collection, records, dry_run=True), (1, 0))
+        self.assertEqual(collection.operations, [])
+
+if __name__ == "__main__":
+    unittest.main()
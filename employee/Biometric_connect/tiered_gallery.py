@@ -0,0 +1,312 @@
+"""
+Tiered Gallery for Rosters Beyond the SDK Cache
+Loading every template into the SDK cache stops scaling once the roster outgrows
+what the cache (and the kiosk's RAM) is sized for. Past SDK_CACHE_CAPACITY
+templates the matcher splits the gallery in two:
+  - hot tier   resident in the SDK cache: today's attendees (latest Time In first),
+               then as many other employees as fit in HOT_TIER_CAPACITY
+  - cold tier  everyone else, left in the local template replica and only searched
+               on a hot miss, COLD_CHUNK_SIZE templates at a time (DBAdd the chunk,
+               DBIdentify, DBDel it again)
+DBIdentify scans everything in the cache, so the hot tier is taken out of the SDK
+cache for a cold sweep (each chunk is then searched on its own, not hot + chunk)
+and put back from the templates kept for it afterwards; hot tier and chunk are
+never resident together, so the hot tier can use the whole SDK cache. One-shot
+callers (--direct exits after one identify) skip putting it back. Python holds
+the hot tier's templates plus one cold chunk. An employee found in the cold tier
+is promoted into the hot tier, evicting the least recently matched one.
+
+A kiosk scoped to site partitions (gallery_partition.py) keeps only its own
+partitions in the tiers; the rest of the company is the "fallback" tier, searched
+in chunks after a cold miss when the cross-site fallback is on.
+
+Identify cost is kept per tier (identifies, templates searched, time; a cold or
+fallback sweep's time includes restoring the hot tier); report() summarises it.
+"""
+
+import os
+import sys
+import time
+from collections import OrderedDict
+from datetime import timezone
+from bson import ObjectId
+
+# Templates the SDK cache is sized for; bigger rosters are tiered
+SDK_CACHE_CAPACITY = int(os.environ.get("SDK_CACHE_CAPACITY", "5000"))
+COLD_CHUNK_SIZE = int(os.environ.get("COLD_CHUNK_SIZE", "1000"))
+HOT_TIER_CAPACITY = SDK_CACHE_CAPACITY  # cold chunks are only loaded while the hot tier is out
+
+# Cold chunks are added above every hot FID so the two never collide
+COLD_FID_BASE = 1 << 30
+
+def use_tiered_gallery(replica):
+    """True when the replica holds more templates than the SDK cache is sized for"""
+    return replica.template_count() > SDK_CACHE_CAPACITY
+
+def hot_tier_keys(records):
+    """Employee keys from today's attendance records: open shifts first, each group latest Time In first"""
+    def order(record):
+        time_in = record['timeIn']
+        # Records read from MongoDB are naive UTC; ones written this session are Manila-aware
+        if time_in.tzinfo is not None:
+            time_in = time_in.astimezone(timezone.utc).replace(tzinfo=None)
+        return (not record.get('timeOut'), time_in)
+    ranked = sorted((record for record in records if record.get('timeIn')), key=order, reverse=True)
+    return list(dict.fromkeys(str(record['employee']) for record in ranked))
+
+def search_chunks(zkfp2, chunks, template):
+    """
+    DBAdd each chunk above every resident FID, DBIdentify, DBDel it again; stops at
+    the first match. Anything else in the cache is rescanned by every DBIdentify, so
+    callers empty it first. Returns (matched entry or None, score, templates searched, chunks)
+    """
+    searched = 0
+    count = 0
+    fid, score = 0, 0
+    for chunk in chunks:
+        chunk_fids = {}
+        for index, entry in enumerate(chunk):
+            try:
+                zkfp2.DBAdd(COLD_FID_BASE + index, entry['template'])
+                chunk_fids[COLD_FID_BASE + index] = entry
+            except Exception as e:
+                print(f"  ⚠️  Failed to load template for {entry['firstName'] or 'Unknown'}: {str(e)}", file=sys.stderr)
+        try:
+            fid, score = zkfp2.DBIdentify(template)
+        finally:
+            for cold_fid in chunk_fids:
+                try:
+                    zkfp2.DBDel(cold_fid)
+                except Exception:
+                    pass
+        count += 1
+        searched += len(chunk_fids)
+        if fid in chunk_fids and score > 0:
+            return chunk_fids[fid], score, searched, count
+    return None, score, searched, count
+
+def employee_info(entry, templates=1):
+    return {
+        "_id": ObjectId(entry['employee_key']),
+        "employeeId": entry['employeeId'],
+        "firstName": entry['firstName'],
+        "lastName": entry['lastName'],
+        "templates": templates
+    }
+
+class TieredGallery:
+    """
+    Hot tier in the SDK cache, cold tier searched chunk by chunk from the replica
+    restore_hot=False is for one-shot callers: after a cold sweep the hot tier is
+    dropped (and nobody is promoted) instead of being DBAdded back
+    """
+
+    def __init__(self, zkfp2, replica, hot_capacity=HOT_TIER_CAPACITY, chunk_size=COLD_CHUNK_SIZE,
+                 partitions=(), cross_partition=True, restore_hot=True):
+        self.zkfp2 = zkfp2
+        self.replica = replica
+        self.hot_capacity = hot_capacity
+        self.chunk_size = chunk_size
+        self.partitions = tuple(partitions)  # empty: the whole company is local
+        self.cross_partition = cross_partition
+        self.restore_hot = restore_hot
+        self.hot_map = {}             # fid -> employee info for the hot tier
+        self.hot_templates = {}       # fid -> template, to restore the hot tier after a cold sweep
+        self.hot_fids = OrderedDict() # employee_key -> [fid, ...], least recently matched first
+        self.next_fid = 1
+        self.totals = {"hot": [0, 0, 0.0, 0], "cold": [0, 0, 0.0, 0],
+                       "fallback": [0, 0, 0.0, 0]}  # identifies, templates, seconds, hits
+
+    def load(self, priority_keys=()):
+        """
+        Rebuild the hot tier: priority_keys (most important first), then other employees
+        until HOT_TIER_CAPACITY, all from the kiosk's partitions. Returns the loaded
+        entries (for HotCandidates.set_gallery)
+        """
+        try:
+            self.zkfp2.DBFree()
+        except Exception:
+            pass  # Nothing cached yet
+        started = time.perf_counter()
+        self.zkfp2.DBInit()
+        self.hot_map = {}
+        self.hot_templates = {}
+        self.hot_fids = OrderedDict()
+        self.next_fid = 1
+
+        priority_keys = list(dict.fromkeys(str(key) for key in priority_keys))
+        loaded = []
+        by_key = {}
+        for entry in self.replica.load_employees(priority_keys):
+            # Today's attendance is company-wide; other sites' attendees stay out
+            if not self.partitions or entry['partition'] in self.partitions:
+                by_key.setdefault(entry['employee_key'], []).append(entry)
+        for key in priority_keys:
+            if key in by_key and self._add(by_key[key]):
+                loaded.extend(by_key[key])
+
+        # Fill the rest of the tier; an employee's templates may straddle two chunks
+        pending = []
+        for chunk in self.replica.iter_gallery_chunks(self.chunk_size, exclude_keys=self.hot_fids.keys(),
+                                                      partitions=self.partitions):
+            if len(self.hot_map) >= self.hot_capacity:
+                break
+            for entry in chunk:
+                if pending and pending[0]['employee_key'] != entry['employee_key']:
+                    if self._add(pending):
+                        loaded.extend(pending)
+                    pending = []
+                pending.append(entry)
+        if pending and self._add(pending):
+            loaded.extend(pending)
+
+        # The most important employees are evicted last
+        for key in reversed(priority_keys):
+            if key in self.hot_fids:
+                self.hot_fids.move_to_end(key)
+        scope = f" of {', '.join(self.partitions)}" if self.partitions else ""
+        print(f"📊 Hot tier: {len(self.hot_fids)} employees{scope}, {len(self.hot_map)} templates "
+              f"(capacity {self.hot_capacity}) loaded in {(time.perf_counter() - started) * 1000:.0f} ms; "
+              f"the rest is searched in chunks of {self.chunk_size}", file=sys.stderr)
+        return loaded
+
+    def _add(self, entries):
+        """DBAdd one employee's templates to the hot tier if they all fit"""
+        if len(self.hot_map) + len(entries) > self.hot_capacity:
+            return False
+        # Every template gets its own FID; all of them share the employee's info
+        info = employee_info(entries[0], templates=0)
+        fids = []
+        for entry in entries:
+            try:
+                self.zkfp2.DBAdd(self.next_fid, entry['template'])
+            except Exception as e:
+                print(f"  ⚠️  Failed to load template for {entry['firstName'] or 'Unknown'}: {str(e)}", file=sys.stderr)
+                continue
+            self.hot_map[self.next_fid] = info
+            self.hot_templates[self.next_fid] = entry['template']
+            fids.append(self.next_fid)
+            self.next_fid += 1
+        info["templates"] = len(fids)
+        if fids:
+            self.hot_fids[entries[0]['employee_key']] = fids
+        return True
+
+    def _evict(self, needed):
+        """DBDel least recently matched employees until needed templates fit"""
+        while self.hot_fids and len(self.hot_map) + needed > self.hot_capacity:
+            key, fids = self.hot_fids.popitem(last=False)
+            for fid in fids:
+                try:
+                    self.zkfp2.DBDel(fid)
+                except Exception:
+                    pass
+                self.hot_map.pop(fid, None)
+                self.hot_templates.pop(fid, None)
+
+    def promote(self, employee_key):
+        """Move an employee found in the cold tier into the hot tier"""
+        entries = self.replica.load_employees([employee_key])
+        if not entries or len(entries) > self.hot_capacity:
+            return
+        self._evict(len(entries))
+        self._add(entries)
+
+    def identify(self, template, hot=None):
+        """
+        Hot tier first (hot candidates 1:1, then DBIdentify), cold chunks on a miss,
+        then the other partitions when cross-partition fallback is on
+        Returns (employee info, score, tier) or (None, score, None)
+        """
+        started = time.perf_counter()
+        hit = hot.match(self.zkfp2, template) if hot is not None else None
+        fid, score = hit or (self.zkfp2.DBIdentify(template) if self.hot_map else (0, 0))
+        employee = self.hot_map.get(fid) if fid > 0 and score > 0 else None
+        self._add_cost("hot", len(self.hot_map), time.perf_counter() - started, employee is not None)
+        if employee:
+            key = str(employee['_id'])
+            self.hot_fids.move_to_end(key)
+            if hot is not None:
+                hot.touch(key)
+            return employee, score, "hot"
+
+        hot_keys = list(self.hot_fids)
+        tiers = [("cold", self.replica.iter_gallery_chunks(
+            self.chunk_size, exclude_keys=hot_keys, partitions=self.partitions))]
+        if self.partitions and self.cross_partition:
+            tiers.append(("fallback", self.replica.iter_gallery_chunks(
+                self.chunk_size, exclude_keys=hot_keys, exclude_partitions=self.partitions)))
+        found = None
+        sweep_started = time.perf_counter()
+        self._unload_hot()
+        try:
+            for tier, chunks in tiers:
+                started = time.perf_counter()
+                found, score, searched, chunk_count = search_chunks(self.zkfp2, chunks, template)
+                elapsed = time.perf_counter() - started
+                self._add_cost(tier, searched, elapsed, found is not None)
+                print(f"{'🧊 Cold tier' if tier == 'cold' else '🌐 Cross-site fallback'}: {chunk_count} chunks, "
+                      f"{searched} templates in {elapsed * 1000:.0f} ms ({'match' if found else 'no match'})", file=sys.stderr)
+                if found:
+                    break
+        finally:
+            if self.restore_hot:
+                restore_started = time.perf_counter()
+                self._restore_hot()
+                restore_seconds = time.perf_counter() - restore_started
+                # The last tier swept pays for putting the hot tier back
+                self.totals[tier][2] += restore_seconds
+            else:
+                self._drop_hot()
+        if self.restore_hot:
+            print(f"♻️  Hot tier restored in {restore_seconds * 1000:.0f} ms "
+                  f"(sweep total {(time.perf_counter() - sweep_started) * 1000:.0f} ms)", file=sys.stderr)
+        if not found:
+            return None, score, None
+        if not self.restore_hot:
+            return employee_info(found), score, tier
+
+        self.promote(found['employee_key'])
+        if hot is not None:
+            hot.touch(found['employee_key'])
+        promoted = self.hot_fids.get(found['employee_key'])
+        return (self.hot_map[promoted[0]] if promoted else employee_info(found)), score, tier
+
+    def _unload_hot(self):
+        """Empty the SDK cache so cold chunks are searched on their own"""
+        try:
+            self.zkfp2.DBFree()
+        except Exception:
+            pass
+        self.zkfp2.DBInit()
+
+    def _restore_hot(self):
+        """DBAdd the hot tier back under its FIDs after a cold sweep"""
+        for fid, hot_template in self.hot_templates.items():
+            try:
+                self.zkfp2.DBAdd(fid, hot_template)
+            except Exception as e:
+                print(f"  ⚠️  Failed to restore hot FID {fid}: {str(e)}", file=sys.stderr)
+
+    def _drop_hot(self):
+        """Forget the hot tier after a sweep that did not put it back (the SDK cache is empty)"""
+        self.hot_map = {}
+        self.hot_templates = {}
+        self.hot_fids = OrderedDict()
+        self.next_fid = 1
+
+    def _add_cost(self, tier, templates, seconds, matched):
+        totals = self.totals[tier]
+        totals[0] += 1
+        totals[1] += templates
+        totals[2] += seconds
+        totals[3] += int(matched)
+
+    def report(self):
+        """One line per tier: identifies, hits, average templates searched and ms"""
+        lines = []
+        for tier, (identifies, templates, seconds, hits) in self.totals.items():
+            if identifies:
+                lines.append(f"{tier}: {identifies} identifies, {hits} hits, "
+                             f"avg {templates / identifies:.0f} templates in {seconds * 1000 / identifies:.1f} ms")
+        return "; ".join(lines) or "no identifies"
@@ -0,0 +1,60 @@
+"""
+Non-Modal Result Banner for the Tkinter GUIs
+A coloured banner laid over the top of the window that hides itself after a few
+seconds. Unlike messagebox.showinfo it never waits for a click, so the next
+person in line can scan while the previous result is still on screen.
+Must be called from the Tk thread (use root.after from worker threads).
+"""
+
+import tkinter as tk
+
+TOAST_DEFAULT_MS = 4000
+
+# kind -> (background, foreground)
+TOAST_COLORS = {
+    "success": ("#2e7d32", "white"),
+    "info": ("#1565c0", "white"),
+    "warning": ("#f9a825", "black"),
+    "error": ("#c62828", "white"),
+}
+
+class ToastBanner:
+    """One banner per window; a new message replaces the current one and restarts its timer"""
+
+    def __init__(self, root, font=('Arial', 14, 'bold')):
+        self.root = root
+        self.hide_after_id = None
+        self.label = tk.Label(root, font=font, justify=tk.CENTER, padx=20, pady=12,
+                              wraplength=700, relief=tk.FLAT, cursor="hand2")
+        # Click to dismiss early; nothing waits for it
+        self.label.bind("<Button-1>", lambda event: self.hide())
+
+    def show(self, message, kind="info", duration_ms=TOAST_DEFAULT_MS):
+        """Show message for duration_ms (kind: success, info, warning, error)"""
+        background, foreground = TOAST_COLORS.get(kind, TOAST_COLORS["info"])
+        self.label.config(text=message, bg=background, fg=foreground)
+        self.label.place(relx=0.5, y=10, anchor=tk.N)
+        self.label.lift()
+        self._cancel_pending()
+        self.hide_after_id = self.root.after(duration_ms, self.hide)
+
+    def success(self, message, duration_ms=TOAST_DEFAULT_MS):
+        self.show(message, "success", duration_ms)
+
+    def info(self, message, duration_ms=TOAST_DEFAULT_MS):
+        self.show(message, "info", duration_ms)
+
+    def warning(self, message, duration_ms=TOAST_DEFAULT_MS):
+        self.show(message, "warning", duration_ms)
+
+    def error(self, message, duration_ms=TOAST_DEFAULT_MS):
+        self.show(message, "error", duration_ms)
+
+    def hide(self):
+        self._cancel_pending()
+        self.label.place_forget()
+
+    def _cancel_pending(self):
+        if self.hide_after_id is not None:
+            self.root.after_cancel(self.hide_after_id)
+            self.hide_after_id = None
@@ -0,0 +1,85 @@
+"""
+UI Event Bus for the Tkinter GUIs
+Worker threads must not touch Tk widgets. Instead they post here, and the Tk thread
+drains the bus once per frame:
+  - post(callback, *args)           run once, in posting order
+  - post(callback, *args, key=K)    coalesced: only the newest update for K runs
+                                    (progress bars, status labels)
+  - append(key, sink, item)         batched: sink(items) runs once with everything
+                                    appended in a row since the last frame (log lines)
+"""
+
+import sys
+import itertools
+import threading
+
+UI_FRAME_MS = 33  # ~30 frames per second
+
+class UIEventBus:
+    """Thread-safe queue of UI updates drained by the Tk thread at a fixed frame rate"""
+
+    def __init__(self, root, frame_ms=UI_FRAME_MS):
+        self.root = root
+        self.frame_ms = frame_ms
+        self.lock = threading.Lock()
+        self.pending = {}  # key -> [callback, args]; dicts keep insertion order
+        self.sequence = itertools.count()
+        self.after_id = None
+        self.stopped = False
+
+    def start(self):
+        """Begin draining (call from the Tk thread)"""
+        self.stopped = False
+        if self.after_id is None:
+            self.after_id = self.root.after(self.frame_ms, self._frame)
+
+    def stop(self):
+        """Stop draining; anything still queued is dropped"""
+        self.stopped = True
+        if self.after_id is not None:
+            try:
+                self.root.after_cancel(self.after_id)
+            except Exception:
+                pass
+            self.after_id = None
+
+    def post(self, callback, *args, key=None):
+        """Queue callback(*args) for the Tk thread; with a key, replaces the previous update for that key"""
+        with self.lock:
+            if key is None:
+                key = ("call", next(self.sequence))
+            else:
+                # Move to the end so the newest state is applied after anything posted before it
+                self.pending.pop(key, None)
+            self.pending[key] = [callback, args]
+
+    def append(self, key, sink, item):
+        """Queue item for sink; consecutive items under a key are delivered together as one list"""
+        with self.lock:
+            # Only extend the batch if nothing was posted after it, so ordering is kept
+            last = next(reversed(self.pending), None) if self.pending else None
+            if last is not None and last[:2] == ("batch", key):
+                self.pending[last][1][0].append(item)
+            else:
+                self.pending[("batch", key, next(self.sequence))] = [sink, ([item],)]
+
+    def _frame(self):
+        self.after_id = None
+        if self.stopped:
+            return
+        self.drain()
+        if not self.stopped:
+            self.after_id = self.root.after(self.frame_ms, self._frame)
+
+    def drain(self):
+        """Run everything queued so far (Tk thread only)"""
+        with self.lock:
+            if not self.pending:
+                return
+            pending, self.pending = self.pending, {}
+        for callback, args in pending.values():
+            try:
+                callback(*args)
+            except Exception as e:
+                # One failed update must not stop the frame loop
+                print(f"UI update failed: {str(e)}", file=sys.stderr)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Batch Work Hours Engine for Attendance Recomputation
+Vectorized counterpart of calculate_work_hours() using NumPy datetime64 arrays
+
+Only writes what this engine owns: actualHoursWorked, and status when it is still
+one of OWNED_STATUSES. Records the backend has already priced (dayType / pay
+fields set) are left alone and counted as skipped, since new hours would no
+longer match their pay.
+Usage: python work_hours_batch.py --from YYYY-MM-DD --to YYYY-MM-DD [--dry-run] [--batch-size N]
+"""
+
+import sys
+import json
+import argparse
+from datetime import datetime, timedelta
+import numpy as np
+from pymongo import UpdateOne
+from bson.codec_options import CodecOptions
+from integrated_capture import get_database_connection, MANILA_TZ
+
+# Same rules as calculate_work_hours() / determine_attendance_status()
+LUNCH_START = np.timedelta64(12, 'h')
+LUNCH_END = np.timedelta64(13, 'h')
+FULL_DAY_HOURS = 6.5
+HALF_DAY_HOURS = 4.0
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Statuses determine_attendance_status() writes; full-day, overtime, late and
+# invalid come from the backend and are never rewritten here
+OWNED_STATUSES = (None, 'present', 'half-day')
+
+def backend_priced(record):
+    """True if the backend computed dayType / pay for this record"""
+    return (record.get('dayType') not in (None, 'Incomplete')
+            or any(record.get(field) for field in ('daySalary', 'overtimePay', 'totalPay')))
+
+def to_datetime64(values, tz=None):
+    """
+    Convert a sequence of datetimes / ISO strings / None into a datetime64[us] array
+    Timezone-aware values are converted to tz (if given) and then read as wall-clock time
+    """
+    converted = []
+    for value in values:
+        if value is None:
+            converted.append(None)
+            continue
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if isinstance(value, datetime) and value.tzinfo is not None:
+            if tz is not None:
+                value = value.astimezone(tz)
+            value = value.replace(tzinfo=None)
+        converted.append(value)
+    return np.array(converted, dtype='datetime64[us]')
+
+def calculate_work_hours_batch(time_in, time_out, tz=None):
+    """
+    Calculate work hours for many records at once, excluding lunch break (12:00 PM - 12:59 PM)
+    Gives the same hours as calculate_work_hours() called per record
+    Returns dict of NumPy arrays: hours, lunch_overlap_hours, status
+    """
+    if not isinstance(time_in, np.ndarray) or time_in.dtype.kind != 'M':
+        time_in = to_datetime64(time_in, tz)
+    if not isinstance(time_out, np.ndarray) or time_out.dtype.kind != 'M':
+        time_out = to_datetime64(time_out, tz)
+    time_in = time_in.astype('datetime64[us]')
+    time_out = time_out.astype('datetime64[us]')
+
+    # Records missing either side count as 0 hours (same as the scalar function)
+    valid = ~(np.isnat(time_in) | np.isnat(time_out))
+    one_us = np.timedelta64(1, 'us')
+
+    # Total time in seconds
+    total_seconds = np.where(valid, (time_out - time_in) / one_us, 0.0) / 1e6
+
+    # Lunch window on the time-in calendar day
+    day_start = time_in.astype('datetime64[D]').astype('datetime64[us]')
+    lunch_start = day_start + LUNCH_START
+    lunch_end = day_start + LUNCH_END
+
+    # Overlap with lunch break, only subtracted when positive
+    overlap = np.minimum(time_out, lunch_end) - np.maximum(time_in, lunch_start)
+    lunch_overlap_seconds = np.where(valid, overlap / one_us, 0.0) / 1e6
+    lunch_overlap_seconds = np.maximum(lunch_overlap_seconds, 0.0)
+
+    hours = np.maximum(0.0, (total_seconds - lunch_overlap_seconds) / 3600.0)
+    hours = np.where(valid, hours, 0.0)
+
+    status = np.where((hours >= HALF_DAY_HOURS) & (hours < FULL_DAY_HOURS), 'half-day', 'present')
+
+    return {
+        "hours": hours,
+        "lunch_overlap_hours": lunch_overlap_seconds / 3600.0,
+        "status": status
+    }
+
+def parse_manila_date(value):
+    """Parse YYYY-MM-DD into midnight Manila time"""
+    return MANILA_TZ.localize(datetime.strptime(value, '%Y-%m-%d'))
+
+def recompute_batch(collection, records, dry_run=False):
+    """
+    Recompute one batch of attendance documents and bulk-write the changed ones
+    Returns (records updated, backend-priced records whose hours differ and were skipped)
+    """
+    result = calculate_work_hours_batch(
+        [record.get('timeIn') for record in records],
+        [record.get('timeOut') for record in records],
+        tz=MANILA_TZ
+    )
+
+    operations = []
+    skipped = 0
+    for record, hours, status in zip(records, result["hours"], result["status"]):
+        hours = round(float(hours), 2)
+        changes = {}
+        if record.get('actualHoursWorked') != hours:
+            changes["actualHoursWorked"] = hours
+        if record.get('status') in OWNED_STATUSES and record.get('status') != str(status):
+            changes["status"] = str(status)
+        if not changes:
+            continue
+        if backend_priced(record):
+            # Changing hours would leave dayType / pay stale; the backend must reprice it
+            skipped += 1
+            continue
+        # Only the fields that changed, filtered on the values read, so a concurrent
+        # backend write is not overwritten
+        operations.append(UpdateOne(
+            {"_id": record['_id'], "status": record.get('status'), "dayType": record.get('dayType')},
+            {"$set": changes}
+        ))
+
+    if operations and not dry_run:
+        collection.bulk_write(operations, ordered=False)
+    return len(operations), skipped
+
+def recompute_range(db, start_date, end_date, dry_run=False, batch_size=DEFAULT_BATCH_SIZE):
+    """Recompute work hours and status for every completed attendance in [start_date, end_date]"""
+    # Read datetimes back as UTC-aware; the batch converts them to Manila wall-clock time
+    collection = db.attendances.with_options(codec_options=CodecOptions(tz_aware=True))
+
+    cursor = collection.find(
+        {
+            "date": {"$gte": start_date, "$lt": end_date + timedelta(days=1)},
+            "timeIn": {"$ne": None},
+            "timeOut": {"$ne": None},
+            "archived": {"$ne": True}
+        },
+        {"timeIn": 1, "timeOut": 1, "status": 1, "actualHoursWorked": 1,
+         "dayType": 1, "daySalary": 1, "overtimePay": 1, "totalPay": 1}
+    ).batch_size(batch_size)
+
+    scanned = 0
+    updated = 0
+    skipped = 0
+    records = []
+    for record in cursor:
+        records.append(record)
+        if len(records) >= batch_size:
+            changed, priced = recompute_batch(collection, records, dry_run)
+            updated += changed
+            skipped += priced
+            scanned += len(records)
+            print(f"📊 Processed {scanned} records ({updated} changed, {skipped} skipped)", file=sys.stderr)
+            records = []
+    if records:
+        changed, priced = recompute_batch(collection, records, dry_run)
+        updated += changed
+        skipped += priced
+        scanned += len(records)
+
+    return {"scanned": scanned, "updated": updated, "skipped": skipped}
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Recompute attendance work hours for a date range")
+    parser.add_argument('--from', dest='start', required=True, help="First day (YYYY-MM-DD, Manila time)")
+    parser.add_argument('--to', dest='end', required=True, help="Last day, inclusive (YYYY-MM-DD, Manila time)")
+    parser.add_argument('--dry-run', action='store_true', help="Compute changes without writing them")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    try:
+        start_date = parse_manila_date(args.start)
+        end_date = parse_manila_date(args.end)
+    except ValueError as e:
+        print(json.dumps({"success": False, "message": f"Invalid date: {str(e)}"}))
+        sys.exit(1)
+
+    db, client, connection_error = get_database_connection()
+    if connection_error:
+        print(json.dumps({"success": False, "message": connection_error}))
+        sys.exit(1)
+
+    try:
+        stats = recompute_range(db, start_date, end_date, args.dry_run, args.batch_size)
+        result = {
+            "success": True,
+            "message": f"Recomputed {stats['scanned']} attendance records ({stats['updated']} changed, "
+                       f"{stats['skipped']} already priced by the backend left unchanged)",
+            "dryRun": args.dry_run,
+            **stats
+        }
+    except Exception as e:
+        result = {"success": False, "message": f"Recompute failed: {str(e)}"}
+    finally:
+        client.close()
+
+    print(json.dumps(result))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
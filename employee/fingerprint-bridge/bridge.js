@@ -520,7 +520,9 @@ app.post('/api/fingerprint/login', async (req, res) => {
   try {
     console.log('\n🔐 === FINGERPRINT LOGIN REQUEST ===');
     
-    const result = await executePython(CAPTURE_SCRIPT, ['--login']);
+    // With an employee ID from the login form the script verifies 1:1 instead of searching everyone
+    const employeeId = typeof req.body?.employeeId === 'string' ? req.body.employeeId.trim() : '';
+    const result = await executePython(CAPTURE_SCRIPT, employeeId ? ['--login', employeeId] : ['--login']);
     
     if (result.success && result.employee) {
       console.log(`✅ Login successful for: ${result.employee.firstName} ${result.employee.lastName}`);
@@ -6,7 +6,7 @@ import SalaryRate from '../models/SalaryRate.model.js';
 import Salary from '../models/SalaryModel.js'; // ✅ NEW: Import Salary model for auto-creation
 import { localEmployeeStorage, localAttendanceStorage } from '../localStorage.js';
 import { mongoConnected } from '../server.js';
-import { validateTimeInRealTime, validateAndCalculateAttendance } from '../utils/attendanceCalculator.js';
+import { validateTimeInRealTime, validateAndCalculateAttendance, getTimeInRules } from '../utils/attendanceCalculator.js';
 import moment from 'moment-timezone';
 import { validateNoSunday } from '../middleware/validateDates.js';
 import { getPhilippinesNow, getStartOfDay, getEndOfDay, getDateOnly, formatTime } from '../utils/dateHelpers.js';
@@ -15,6 +15,7 @@ import { getPhilippinesNow, getStartOfDay, getEndOfDay, getDateOnly, formatTime
 import { validateAttendanceForFraud, validateNoMultipleOpenShifts } from '../middleware/fraudPrevention.js';
 import { getPaginationParams, createPaginatedResponse, optimizeMongooseQuery } from '../utils/paginationHelper.js';
 import { setCacheHeaders } from '../middleware/cacheMiddleware.js';
+import { templateBody, readTemplateHex, readEdgeMatch, verifyEdgeMatch, describeTemplateUpload } from '../utils/templateTransport.js';
 
 // ✅ CRITICAL FIX: Helper function to check ACTUAL MongoDB connection status
 // Now uses Mongoose connection state instead of static variable
@@ -254,6 +255,14 @@ const findEmployeeByFingerprint = async (inputTemplate, useMongoDB) => {
   }
 };
 
+// Employee for a match the kiosk already made with DBIdentify (edge mode)
+const findEmployeeByEdgeMatch = async ({ employeeId }, useMongoDB) => {
+  if (useMongoDB) {
+    return Employee.findOne({ employeeId, fingerprintEnrolled: true });
+  }
+  return localEmployeeStorage.findByEmployeeId(employeeId) || null;
+};
+
 // Create attendance record
 router.post('/attendance', validateNoSunday, async (req, res) => {
     try {
@@ -553,6 +562,11 @@ router.get('/attendance/stats', async (req, res) => {
     }
 });
 
+// Time-in rules for kiosks that validate locally - before /:employeeId to avoid route conflict
+router.get('/attendance/timein-rules', (req, res) => {
+    res.json({ success: true, ...getTimeInRules() });
+});
+
 // Get attendance for specific employee - After /stats to avoid route conflict
 router.get('/attendance/:employeeId', async (req, res) => {
     try {
@@ -570,24 +584,38 @@ router.get('/attendance/:employeeId', async (req, res) => {
 });
 
 // New route for fingerprint-based attendance recording
-router.post('/attendance/record', async (req, res) => {
+router.post('/attendance/record', templateBody, async (req, res) => {
     try {
-        console.log('📨 Attendance record request received:', req.body);
-        const { fingerprint_template } = req.body;
+        console.log(`📨 Attendance record request received (${describeTemplateUpload(req)})`);
+        // Either a match the kiosk made itself, or a template (hex, base64 or raw bytes, compared as hex)
+        const edgeMatch = readEdgeMatch(req);
+        const fingerprint_template = edgeMatch ? null : readTemplateHex(req, 'fingerprint_template');
 
-        if (!fingerprint_template) {
+        if (!edgeMatch && !fingerprint_template) {
             console.log('❌ No fingerprint template provided');
             return res.status(400).json({ error: 'Fingerprint template is required' });
         }
 
-        console.log('🔍 Searching for employee with fingerprint template...');
-        console.log('🔍 DEBUG: Template type:', typeof fingerprint_template);
-        console.log('🔍 DEBUG: Template length:', fingerprint_template ? fingerprint_template.length : 'undefined');
-        console.log('🔍 DEBUG: Template first 100 chars:', fingerprint_template ? fingerprint_template.substring(0, 100) + '...' : 'undefined');
-        console.log('🔍 DEBUG: Template last 100 chars:', fingerprint_template ? '...' + fingerprint_template.substring(fingerprint_template.length - 100) : 'undefined');
-        
-        // Use the improved fingerprint matching function
-        const employee = await findEmployeeByFingerprint(fingerprint_template, isMongoConnected());
+        let employee;
+        if (edgeMatch) {
+            // No user login on this route: only signed matches from registered kiosks count
+            const verification = verifyEdgeMatch(req, edgeMatch);
+            if (!verification.ok) {
+                console.log(`🚫 Edge match rejected: ${verification.error}`);
+                return res.status(verification.status).json({ error: verification.error, edgeRejected: true });
+            }
+            console.log(`🖐️ Edge match from kiosk ${verification.kioskId}: ${edgeMatch.employeeId} (FID ${edgeMatch.fid}, score ${edgeMatch.score}, captured ${edgeMatch.capturedAt})`);
+            employee = await findEmployeeByEdgeMatch(edgeMatch, isMongoConnected());
+        } else {
+            console.log('🔍 Searching for employee with fingerprint template...');
+            console.log('🔍 DEBUG: Template type:', typeof fingerprint_template);
+            console.log('🔍 DEBUG: Template length:', fingerprint_template ? fingerprint_template.length : 'undefined');
+            console.log('🔍 DEBUG: Template first 100 chars:', fingerprint_template ? fingerprint_template.substring(0, 100) + '...' : 'undefined');
+            console.log('🔍 DEBUG: Template last 100 chars:', fingerprint_template ? '...' + fingerprint_template.substring(fingerprint_template.length - 100) : 'undefined');
+
+            // Use the improved fingerprint matching function
+            employee = await findEmployeeByFingerprint(fingerprint_template, isMongoConnected());
+        }
         console.log('👤 Employee found:', employee ? employee.employeeId : 'None');
 
         if (!employee) {
@@ -913,8 +941,12 @@ router.post('/biometric/login', async (req, res) => {
             '../../Biometric_connect/capture_fingerprint_ipc_complete.py'
         );
 
+        // With an employee ID from the login form the script verifies 1:1 instead of searching everyone
+        const employeeId = typeof req.body?.employeeId === 'string' ? req.body.employeeId.trim() : '';
+        const loginArgs = employeeId ? ["--login", employeeId] : ["--login"];
+
         // Spawn Python script for biometric login
-        const process = spawn("py", [pythonScript, "--login"], {
+        const process = spawn("py", [pythonScript, ...loginArgs], {
             stdio: "pipe",
             timeout: 30000, // 30 second timeout
             env: {
@@ -55,6 +55,18 @@ if (!PYTHON_PATH) {
 
 console.log('🐍 Using Python command:', PYTHON_PATH);
 
+// If the client disconnects before we answer, close the child's stdin. The Python
+// bridge treats EOF on its stdin pipe as a cancel and stops polling the scanner
+// within one poll, instead of holding the device until its own timeout.
+function cancelOnAbandon(res, child) {
+  res.on("close", () => {
+    if (!res.writableEnded && child.exitCode === null && child.stdin && !child.stdin.destroyed) {
+      console.log("🛑 Client disconnected - cancelling fingerprint capture");
+      child.stdin.end();
+    }
+  });
+}
+
 /* ------------------------------------------------------
    🔍 Check biometric device health
    ✅ FIX: Return graceful error in production (Vercel doesn't support USB devices)
@@ -219,6 +231,8 @@ router.post("/pre-enroll", async (req, res) => {
       }
     );
 
+    cancelOnAbandon(res, captureProcess);
+
     let stdout = "";
     let stderr = "";
 
@@ -369,6 +383,8 @@ router.post("/enroll/:employeeId", async (req, res) => {
       }
     );
 
+    cancelOnAbandon(res, captureProcess);
+
     let stdout = "";
     let stderr = "";
 
@@ -624,6 +640,8 @@ router.post("/attendance/record", async (req, res) => {
       },
     });
 
+    cancelOnAbandon(res, attendanceProcess);
+
     let stdout = "";
     let stderr = "";
 
@@ -2,6 +2,7 @@ import express from "express";
 import { spawn } from "child_process";
 import path from "path";
 import Employee from "../models/EmployeeModels.js";
+import { templateBody, readTemplateHex, readTemplateField } from "../utils/templateTransport.js";
 
 const router = express.Router();
 
@@ -410,9 +411,11 @@ router.post("/scan/direct", async (req, res) => {
 });
 
 // Check for duplicate fingerprints
-router.post('/check-duplicate', async (req, res) => {
+router.post('/check-duplicate', templateBody, async (req, res) => {
   try {
-    const { fingerprintTemplate, excludeEmployeeId } = req.body;
+    // Stored templates are hex, so compact uploads are decoded to hex before comparing
+    const fingerprintTemplate = readTemplateHex(req, 'fingerprintTemplate');
+    const excludeEmployeeId = readTemplateField(req, 'excludeEmployeeId');
     
     if (!fingerprintTemplate) {
       return res.status(400).json({
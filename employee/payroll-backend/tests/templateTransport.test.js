@@ -0,0 +1,96 @@
+/**
+ * Edge match verification (utils/templateTransport.js)
+ * Run: npm test
+ */
+
+import { test, beforeEach } from 'node:test';
+import assert from 'node:assert/strict';
+import crypto from 'crypto';
+import { readEdgeMatch, verifyEdgeMatch } from '../utils/templateTransport.js';
+
+const SECRET = 'kiosk-1-secret';
+
+const sign = (kioskId, body, secret = SECRET) => crypto.createHmac('sha256', secret)
+  .update(`${kioskId}|${body.employeeId}|${body.fid}|${body.score}|${body.capturedAt}`)
+  .digest('hex');
+
+// Minimal Express request: a JSON body and case-insensitive headers
+const makeRequest = (body, headers = {}) => {
+  const lowered = Object.fromEntries(Object.entries(headers).map(([name, value]) => [name.toLowerCase(), value]));
+  return { body, headers: lowered, get: (name) => lowered[name.toLowerCase()] };
+};
+
+let sequence = 0;
+const signedRequest = (overrides = {}, kioskId = 'kiosk-1', secret = SECRET) => {
+  // A distinct capturedAt per request keeps signatures unique across tests
+  const capturedAt = new Date(Date.now() - 1000 + (sequence++ % 500)).toISOString();
+  const body = { employeeId: 'EMP001', fid: 12, score: 85, capturedAt, ...overrides };
+  return makeRequest(body, { 'X-Kiosk-Id': kioskId, 'X-Kiosk-Signature': sign(kioskId, body, secret) });
+};
+
+const verify = (req) => verifyEdgeMatch(req, readEdgeMatch(req));
+
+beforeEach(() => {
+  process.env.EDGE_MATCH_ENABLED = 'true';
+  process.env.EDGE_KIOSK_KEYS = `kiosk-1:${SECRET}, kiosk-2:other:secret`;
+  delete process.env.EDGE_MATCH_MIN_SCORE;
+  delete process.env.EDGE_MATCH_WINDOW_SECONDS;
+});
+
+test('accepts a match signed by a registered kiosk', () => {
+  assert.deepEqual(verify(signedRequest()), { ok: true, kioskId: 'kiosk-1' });
+});
+
+test('secrets may contain colons', () => {
+  assert.equal(verify(signedRequest({}, 'kiosk-2', 'other:secret')).ok, true);
+});
+
+test('is off unless EDGE_MATCH_ENABLED=true', () => {
+  delete process.env.EDGE_MATCH_ENABLED;
+  assert.equal(verify(signedRequest()).status, 403);
+});
+
+test('rejects unknown kiosks and missing headers', () => {
+  assert.equal(verify(signedRequest({}, 'kiosk-9')).status, 401);
+  const unsigned = makeRequest({ employeeId: 'EMP001', fid: 12, score: 85, capturedAt: new Date().toISOString() });
+  assert.equal(verify(unsigned).status, 401);
+});
+
+test('rejects a tampered body or a wrong secret', () => {
+  const req = signedRequest();
+  req.body.employeeId = 'EMP002';
+  assert.deepEqual(verify(req), { ok: false, status: 401, error: 'Invalid kiosk signature' });
+  assert.equal(verify(signedRequest({}, 'kiosk-1', 'guessed')).error, 'Invalid kiosk signature');
+});
+
+test('rejects a multibyte signature without throwing', () => {
+  const req = signedRequest();
+  req.headers['x-kiosk-signature'] = 'é'.repeat(32);
+  assert.equal(verify(req).error, 'Invalid kiosk signature');
+});
+
+test('rejects a replayed signature', () => {
+  const req = signedRequest();
+  assert.equal(verify(req).ok, true);
+  assert.equal(verify(req).error, 'Edge match was already used');
+});
+
+test('rejects matches outside the replay window', () => {
+  process.env.EDGE_MATCH_WINDOW_SECONDS = '30';
+  const stale = new Date(Date.now() - 31000).toISOString();
+  assert.equal(verify(signedRequest({ capturedAt: stale })).error, 'Edge match is outside the replay window');
+  assert.equal(verify(signedRequest({ capturedAt: 'yesterday' })).status, 401);
+});
+
+test('rejects low scores and invalid FIDs', () => {
+  process.env.EDGE_MATCH_MIN_SCORE = '70';
+  assert.equal(verify(signedRequest({ score: 69 })).error, 'Edge match score below 70');
+  assert.equal(verify(signedRequest({ score: 70 })).ok, true);
+  assert.equal(verify(signedRequest({ fid: 0 })).status, 401);
+  assert.equal(verify(signedRequest({ fid: 1.5 })).status, 401);
+});
+
+test('template uploads are not edge matches', () => {
+  assert.equal(readEdgeMatch(makeRequest({ employeeId: 'EMP001', fid: 1, fingerprint_template: 'ab' })), null);
+  assert.equal(readEdgeMatch(makeRequest(Buffer.from('ab'))), null);
+});
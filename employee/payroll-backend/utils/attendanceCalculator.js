@@ -8,6 +8,7 @@
  * - Lunch break: 12:00 PM - 1:00 PM (excluded from hours calculation)
  */
 
+import crypto from 'crypto';
 import moment from 'moment-timezone';
 
 // Set timezone to Philippines
@@ -463,6 +464,22 @@ const validateTimeInRealTime = (timeIn, date) => {
   }
 };
 
+/**
+ * Time-in rules applied by validateTimeInRealTime, for kiosks that validate locally
+ * hash is the sha256 of JSON.stringify(rules); a kiosk whose own rules hash differently
+ * falls back to /api/attendance/validate-timein
+ * @returns {Object} { rules, hash }
+ */
+const getTimeInRules = () => {
+  const rules = {
+    fullDayCutoff: { hour: FULL_DAY_CUTOFF.hour, minute: FULL_DAY_CUTOFF.minute },
+    latestTimeIn: { hour: LATEST_TIME_IN.hour, minute: LATEST_TIME_IN.minute },
+    timezone: TIMEZONE
+  };
+  const hash = crypto.createHash('sha256').update(JSON.stringify(rules)).digest('hex');
+  return { rules, hash };
+};
+
 export {
   parseTime,
   calculateHoursWorked,
@@ -472,7 +489,8 @@ export {
   calculateOvertimeHours,
   validateAndCalculateAttendance,
   calculateAttendanceSummary,
-  validateTimeInRealTime
+  validateTimeInRealTime,
+  getTimeInRules
 };
 
 export const CONSTANTS = {
@@ -0,0 +1,155 @@
+/**
+ * 📦 FINGERPRINT TEMPLATE TRANSPORT
+ *
+ * Kiosks can upload a template in three forms:
+ *   - hex string in JSON (legacy, ~2x the template size)
+ *   - base64 string in JSON with templateEncoding: 'base64' (~1.33x)
+ *   - raw bytes as application/octet-stream (1x), other fields in the query string
+ * Any of them may be gzip/deflate compressed with Content-Encoding.
+ * Matching still compares hex strings, so every form is decoded to hex here.
+ *
+ * Kiosks in edge mode identify the finger themselves and send only
+ * { employeeId, fid, score, capturedAt } instead of a template. The route has no
+ * user login, so an edge match is only trusted when (see verifyEdgeMatch):
+ *   - EDGE_MATCH_ENABLED=true (off by default)
+ *   - it is signed by a kiosk listed in EDGE_KIOSK_KEYS ("kioskId:secret,...") with
+ *     X-Kiosk-Id and X-Kiosk-Signature = hex HMAC-SHA256(secret,
+ *     "kioskId|employeeId|fid|score|capturedAt")
+ *   - capturedAt is within EDGE_MATCH_WINDOW_SECONDS (default 60) of server time and
+ *     the signature has not been seen before in that window
+ *   - score is at least EDGE_MATCH_MIN_SCORE (default 60)
+ */
+
+import crypto from 'crypto';
+import express from 'express';
+
+/**
+ * Route middleware that parses application/octet-stream bodies into a Buffer
+ * (express.json has already handled JSON bodies; inflate handles Content-Encoding)
+ */
+export const templateBody = express.raw({ type: 'application/octet-stream', limit: '64kb' });
+
+/**
+ * Read an uploaded template as a hex string
+ * @param {Object} req - Express request (after templateBody)
+ * @param {string} field - JSON field holding the template
+ * @returns {string|null} Hex template, or the field's value as sent for legacy formats
+ */
+export const readTemplateHex = (req, field) => {
+  if (Buffer.isBuffer(req.body)) {
+    return req.body.length ? req.body.toString('hex') : null;
+  }
+  const value = req.body?.[field];
+  if (typeof value === 'string' && req.body.templateEncoding === 'base64') {
+    return Buffer.from(value, 'base64').toString('hex');
+  }
+  return value ?? null;
+};
+
+/**
+ * Read a non-template field, which binary uploads carry in the query string
+ * @param {Object} req - Express request (after templateBody)
+ * @param {string} field - Field name
+ * @returns {*} Field value or undefined
+ */
+export const readTemplateField = (req, field) => {
+  if (Buffer.isBuffer(req.body)) {
+    return req.query?.[field];
+  }
+  return req.body?.[field];
+};
+
+/**
+ * Read an edge-identified match (kiosk ran DBIdentify itself)
+ * @param {Object} req - Express request (after templateBody)
+ * @returns {Object|null} { employeeId, fid, score, capturedAt } or null for template uploads
+ */
+export const readEdgeMatch = (req) => {
+  if (Buffer.isBuffer(req.body) || !req.body?.employeeId || req.body.fid === undefined) return null;
+  // A body that still carries a template is matched server-side as before
+  if (req.body.fingerprint_template || req.body.fingerprintTemplate) return null;
+  const { employeeId, fid, score, capturedAt } = req.body;
+  return {
+    employeeId: String(employeeId),
+    fid: Number(fid),
+    score: Number(score),
+    capturedAt: capturedAt || null
+  };
+};
+
+// Signatures already accepted, until their capturedAt leaves the replay window
+const seenEdgeSignatures = new Map();
+
+// Read when used: config.env is loaded after the routes are imported
+const edgeSettings = () => ({
+  enabled: process.env.EDGE_MATCH_ENABLED === 'true',
+  keys: new Map((process.env.EDGE_KIOSK_KEYS || '')
+    .split(',')
+    .map((pair) => pair.trim().split(':'))
+    .filter(([kioskId, secret]) => kioskId && secret)
+    .map(([kioskId, ...secret]) => [kioskId, secret.join(':')])),
+  minScore: Number(process.env.EDGE_MATCH_MIN_SCORE || 60),
+  windowMs: Number(process.env.EDGE_MATCH_WINDOW_SECONDS || 60) * 1000
+});
+
+/**
+ * Check that an edge match comes from an authenticated kiosk and may be trusted
+ * @param {Object} req - Express request
+ * @param {Object} edgeMatch - Result of readEdgeMatch(req)
+ * @returns {Object} { ok: true, kioskId } or { ok: false, status, error }
+ */
+export const verifyEdgeMatch = (req, edgeMatch) => {
+  const settings = edgeSettings();
+  const reject = (status, error) => ({ ok: false, status, error });
+  if (!settings.enabled) {
+    return reject(403, 'Edge matching is disabled - send the fingerprint template');
+  }
+
+  const kioskId = req.get('X-Kiosk-Id');
+  const signature = req.get('X-Kiosk-Signature') || '';
+  const secret = kioskId && settings.keys.get(kioskId);
+  if (!secret) {
+    return reject(401, 'Unknown kiosk');
+  }
+  const { employeeId, fid, score, capturedAt } = req.body;
+  const expected = crypto.createHmac('sha256', secret)
+    .update(`${kioskId}|${employeeId}|${fid}|${score}|${capturedAt}`)
+    .digest('hex');
+  const given = Buffer.from(signature);
+  if (given.length !== expected.length || !crypto.timingSafeEqual(given, Buffer.from(expected))) {
+    return reject(401, 'Invalid kiosk signature');
+  }
+
+  const now = Date.now();
+  const capturedMs = Date.parse(edgeMatch.capturedAt);
+  if (Number.isNaN(capturedMs) || Math.abs(now - capturedMs) > settings.windowMs) {
+    return reject(401, 'Edge match is outside the replay window');
+  }
+  for (const [seen, expires] of seenEdgeSignatures) {
+    if (expires < now) seenEdgeSignatures.delete(seen);
+  }
+  if (seenEdgeSignatures.has(signature)) {
+    return reject(401, 'Edge match was already used');
+  }
+  if (!Number.isInteger(edgeMatch.fid) || edgeMatch.fid <= 0 ||
+      !(edgeMatch.score >= settings.minScore)) {
+    return reject(401, `Edge match score below ${settings.minScore}`);
+  }
+  seenEdgeSignatures.set(signature, capturedMs + settings.windowMs);
+  return { ok: true, kioskId };
+};
+
+/**
+ * Short description of how a template arrived, for request logs
+ * @param {Object} req - Express request (after templateBody)
+ * @returns {string} e.g. "binary, 2048 B on the wire (gzip)"
+ */
+export const describeTemplateUpload = (req) => {
+  if (readEdgeMatch(req)) {
+    return `edge match, ${req.headers['content-length'] || '?'} B on the wire`;
+  }
+  const format = Buffer.isBuffer(req.body) ? 'binary' : (req.body?.templateEncoding || 'hex');
+  const wireBytes = req.headers['content-length'] || '?';
+  const encoding = req.headers['content-encoding'];
+  return `${format}, ${wireBytes} B on the wire${encoding ? ` (${encoding})` : ''}`;
+};
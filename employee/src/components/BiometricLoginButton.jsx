@@ -3,7 +3,8 @@ import { useNavigate } from 'react-router-dom';
 import { showError, showSuccess } from '../utils/toast';
 import { FaFingerprint, FaSpinner, FaCheck, FaTimes, FaExclamationTriangle } from 'react-icons/fa';
 
-const BiometricLoginButton = ({ onSuccess, onError }) => {
+// employeeId (optional): when the form already knows who is logging in, the scan is verified 1:1
+const BiometricLoginButton = ({ onSuccess, onError, employeeId }) => {
   const [deviceStatus, setDeviceStatus] = useState('checking'); // checking, connected, disconnected, error
   const [isScanning, setIsScanning] = useState(false);
   const [scanStatus, setScanStatus] = useState(''); // '', 'scanning', 'success', 'error'
@@ -53,6 +54,7 @@ const BiometricLoginButton = ({ onSuccess, onError }) => {
         headers: {
           'Content-Type': 'application/json',
         },
+        body: JSON.stringify(employeeId ? { employeeId } : {}),
       });
 
       const data = await response.json();
@@ -1,11 +1,10 @@
-import React, { useState, useEffect } from "react";
+import React, { useState } from "react";
 import { useNavigate } from "react-router-dom";
 // Add this import
 import { fingerprintApi, employeeApi } from "../services/apiService";
-import { biometricLoginIPC } from "../services/biometricService_updated";
 import { toast } from 'react-toastify';
 // Add react-icons import
-import { FaUser, FaLock, FaEye, FaEyeSlash, FaFingerprint } from "react-icons/fa";
+import { FaUser, FaLock, FaEye, FaEyeSlash, FaIdBadge } from "react-icons/fa";
 import BiometricLoginButton from './BiometricLoginButton';
 import logo from '../assets/logo.png';
 
@@ -33,8 +32,7 @@ const Login = () => {
   const [password, setPassword] = useState("");
   const [error, setError] = useState("");
   const [showBiometrics, setShowBiometrics] = useState(false);
-  const [isScanning, setIsScanning] = useState(false);
-  const [deviceStatus, setDeviceStatus] = useState('unknown'); // unknown, connected, disconnected, initializing
+  const [employeeId, setEmployeeId] = useState(""); // optional: verifies the scan 1:1 instead of searching everyone
   const [scanAttempts, setScanAttempts] = useState(0);
   const [lastScanTime, setLastScanTime] = useState(null);
 
@@ -61,40 +59,6 @@ const Login = () => {
     }
   };
 
-  const handleBiometricLogin = async () => {
-    setIsScanning(true);
-    try {
-      const response = await biometricLoginIPC();
-      if (response.success) {
-        localStorage.setItem('employee', JSON.stringify(response.employee));
-        localStorage.setItem('isLoggedIn', 'true');
-        navigate('/dashboard');
-        toast.success('Biometric login successful!');
-      } else {
-        setError(response.error || 'Biometric login failed');
-        toast.error(response.error || 'Biometric login failed');
-      }
-    } catch (error) {
-      setError('Biometric login failed');
-      toast.error('Biometric login failed');
-    } finally {
-      setIsScanning(false);
-    }
-  };
-
-  useEffect(() => {
-    const checkDeviceStatus = async () => {
-      try {
-        const response = await fetch('http://localhost:5000/api/biometric/health');
-        const data = await response.json();
-        setDeviceStatus(data.status);
-      } catch (error) {
-        setDeviceStatus('error');
-      }
-    };
-    checkDeviceStatus();
-  }, []);
-
   return (
     <div className="min-h-screen bg-gradient-to-br from-blue-50 to-indigo-100 flex items-center justify-center p-4">
       <div className="bg-white rounded-lg shadow-xl p-8 w-full max-w-md">
@@ -149,23 +113,21 @@ const Login = () => {
             </button>
           </form>
         ) : (
-          <div className="text-center">
+          <div className="mb-4">
             <div className="mb-4">
-              <FaFingerprint className="text-6xl text-gray-400 mx-auto mb-4" />
-              <p className="text-gray-600 mb-2">Biometric Login</p>
-              <p className="text-sm text-gray-500 mb-4">Device Status: {deviceStatus}</p>
+              <label className="block text-gray-700 text-sm font-bold mb-2" htmlFor="employeeId">
+                <FaIdBadge className="inline mr-2" />Employee ID (optional, faster)
+              </label>
+              <input
+                type="text"
+                id="employeeId"
+                value={employeeId}
+                onChange={(e) => setEmployeeId(e.target.value)}
+                placeholder="e.g. EMP001"
+                className="shadow appearance-none border rounded w-full py-2 px-3 text-gray-700 leading-tight focus:outline-none focus:shadow-outline"
+              />
             </div>
-            <button
-              onClick={handleBiometricLogin}
-              disabled={deviceStatus !== 'connected' || isScanning}
-              className={`font-bold py-2 px-4 rounded focus:outline-none focus:shadow-outline w-full mb-4 ${
-                deviceStatus === 'connected' && !isScanning
-                  ? 'bg-green-500 hover:bg-green-700 text-white'
-                  : 'bg-gray-300 text-gray-500 cursor-not-allowed'
-              }`}
-            >
-              {isScanning ? 'Scanning...' : 'Login with Fingerprint'}
-            </button>
+            <BiometricLoginButton employeeId={employeeId.trim() || undefined} onError={setError} />
           </div>
         )}
         <button
@@ -197,15 +197,16 @@ class BiometricService {
 
   /**
    * Login with fingerprint
+   * @param {string} [employeeId] - When known, the scan is verified against this employee only
    */
-  async loginWithFingerprint() {
+  async loginWithFingerprint(employeeId) {
     try {
       const bridgeUrl = await this.findWorkingBridgeUrl();
       if (!bridgeUrl) {
         throw new Error('Bridge server not available. Please install and start the Fingerprint Bridge Service.');
       }
 
-      const response = await axios.post(`${bridgeUrl}/fingerprint/login`);
+      const response = await axios.post(`${bridgeUrl}/fingerprint/login`, employeeId ? { employeeId } : {});
       return response.data;
     } catch (error) {
       console.error('❌ Fingerprint login failed:', error);
@@ -272,7 +273,7 @@ export default biometricService;
 // Export individual functions for convenience
 export const checkBridgeHealth = () => biometricService.checkBridgeHealth();
 export const enrollEmployee = (data) => biometricService.enrollEmployee(data);
-export const loginWithFingerprint = () => biometricService.loginWithFingerprint();
+export const loginWithFingerprint = (employeeId) => biometricService.loginWithFingerprint(employeeId);
 export const captureFingerprint = () => biometricService.captureFingerprint();
 export const recordAttendance = () => biometricService.recordAttendance();
 